@@ -0,0 +1,374 @@
+"""
+Network Diagnostics: Loopback Benchmark Harness
+
+PROBLEM STATEMENT:
+    There is no way to tell how fast the pingers themselves are, or whether a
+    change made them slower. Every RTT they report also contains their own
+    processing time, which is invisible without a reference measurement.
+
+DESCRIPTION:
+    This module implements an offline benchmark harness that:
+    - Starts each server script on loopback and drives it with its matching client
+      script, in count mode and, where the client has one, in flood mode
+    - Overrides the scripts' module-level settings (flood_mode, framing, ...) without
+      editing them, and disables the servers' simulated loss with PING_IMPAIRMENT
+    - Measures how the sharded scheduler (ping_common.shard_scheduler) scales from
+      one worker process to one per core
+    - Reports packets per second, client and server CPU time per packet and the
+      tool's own latency noise floor (the RTTs the client reports on loopback)
+    - Subtracts interpreter start-up time measured with a zero-ping calibration run
+    - Writes the results to JSON and compares them against a stored baseline,
+      flagging regressions beyond a tolerance
+    - Skips the ICMP error scenarios when raw sockets are not allowed (not root)
+
+    Commands:
+        python3 benchmark/loopback_benchmark.py run [-o results.json] [--scale 1.0] [--only NAME ...]
+        python3 benchmark/loopback_benchmark.py compare baseline.json results.json [--tolerance 10]
+
+USE CASES:
+    - Measuring the pingers' own packet rate and CPU cost
+    - Catching performance regressions before merging a change
+    - Knowing the latency floor below which RTTs say nothing about the network
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import re
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+SERVER_PORT = 14008
+STARTUP_TIMEOUT = 10  # Seconds to wait for a server to start listening
+RUN_TIMEOUT = 300  # Seconds allowed for one client run
+DEFAULT_TOLERANCE = 10  # Percent
+
+# Runs a pinger script with some of its module-level settings replaced
+BOOTSTRAP = """
+import json, os, re, sys
+path, overrides = sys.argv[1], json.loads(sys.argv[2])
+arguments = overrides.pop("argv", [])  # Command-line arguments rather than a setting
+with open(path) as f:
+    source = f.read()
+for name, value in overrides.items():
+    source, found = re.subn(r"^%s = .*$" % re.escape(name), "%s = %r" % (name, value), source, count=1, flags=re.M)
+    if not found:
+        sys.exit("setting %s not found in %s" % (name, path))
+sys.argv = [path] + arguments
+sys.path[:0] = [os.path.dirname(os.path.abspath(path)), os.path.dirname(os.path.dirname(os.path.abspath(path)))]
+exec(compile(source, path, "exec"), {"__name__": "__main__", "__file__": path})
+"""
+
+SHARDED_TARGETS = [f"udp:127.0.0.1:{SERVER_PORT}"] * 16
+
+# name, server script, server settings, client script, client settings, pings, needs root
+Scenario = collections.namedtuple("Scenario", "name mode server server_settings client client_settings count root")
+
+SCENARIOS = [
+    Scenario("udp", "count", "udp_ping/udp_pinger_server.py", {},
+             "udp_ping/udp_pinger_client.py", {}, 2000, False),
+    Scenario("udp", "flood", "udp_ping/udp_pinger_server.py", {},
+             "udp_ping/udp_pinger_client.py", {"flood_mode": True}, 20000, False),
+    # The basic and threaded servers close a connection after 100 messages
+    Scenario("tcp", "count", "tcp_ping/tcp_pinger_server.py", {},
+             "tcp_ping/tcp_pinger_client.py", {}, 98, False),
+    Scenario("tcp", "flood", "tcp_ping/tcp_pinger_server.py", {"framing": True},
+             "tcp_ping/tcp_pinger_client.py", {"framing": True, "max_outstanding": 32}, 98, False),
+    Scenario("tcp_threaded", "count", "tcp_ping/tcp_pinger_server_threaded.py", {},
+             "tcp_ping/tcp_pinger_client.py", {}, 98, False),
+    Scenario("tcp_threaded", "flood", "tcp_ping/tcp_pinger_server_threaded.py", {"framing": True},
+             "tcp_ping/tcp_pinger_client.py", {"framing": True, "max_outstanding": 32}, 98, False),
+    Scenario("tcp_async", "count", "tcp_ping/tcp_pinger_server_async.py", {},
+             "tcp_ping/tcp_pinger_client.py", {}, 2000, False),
+    Scenario("tcp_async", "flood", "tcp_ping/tcp_pinger_server_async.py", {"framing": True},
+             "tcp_ping/tcp_pinger_client.py", {"framing": True, "max_outstanding": 32}, 20000, False),
+    Scenario("udp_icmp_error", "count", "udp_ping/udp_pinger_server_icmp_error.py", {},
+             "udp_ping/udp_pinger_client_icmp_error.py", {}, 500, True),
+    # About 40% of the pings draw an ICMP error the TCP client only notices by timing out
+    Scenario("tcp_icmp_error", "count", "tcp_ping/tcp_pinger_server_icmp_error.py", {},
+             "tcp_ping/tcp_pinger_client_icmp_error.py", {}, 10, True),
+    # 16 targets on the multi-process server, from one worker and from one worker per core;
+    # the count is per target, and packets/s of all-cores over one-worker is the scaling
+    Scenario("udp_sharded", "one-worker", "udp_ping/udp_pinger_server_reuseport.py", {},
+             "ping_common/shard_scheduler.py", {"argv": ["--workers", "1"] + SHARDED_TARGETS}, 1000, False),
+    Scenario("udp_sharded", "all-cores", "udp_ping/udp_pinger_server_reuseport.py", {},
+             "ping_common/shard_scheduler.py", {"argv": SHARDED_TARGETS}, 1000, False),
+]
+
+# (metric, True if higher is better) checked by compare
+METRICS = (
+    ("packets_per_second", True),
+    ("client_cpu_us_per_packet", False),
+    ("server_cpu_us_per_packet", False),
+    ("rtt_p50_ms", False),
+)
+
+_packets = re.compile(r"Packets: Sent = (\d+), Received = (\d+), Lost = (\d+)")
+_rtts = re.compile(r"Minimum: ([\d.]+) ms, Maximum: ([\d.]+) ms, Average: ([\d.]+) ms, Std dev: ([\d.]+) ms")
+_percentiles = re.compile(r"p([\d.]+): ([\d.]+) ms")
+
+
+def _command(script, settings):
+    return [sys.executable, "-u", "-c", BOOTSTRAP, os.path.join(ROOT, script), json.dumps(settings)]
+
+
+def _environment():
+    env = dict(os.environ)
+    env["PING_IMPAIRMENT"] = ""  # Measure the tool, not the simulated network
+    return env
+
+
+def _process_cpu(pid):
+    """
+    User plus system CPU seconds used so far by a running server and the worker
+    processes it started, i.e. every process of its session (Linux /proc).
+    """
+    ticks = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue  # Exited meanwhile
+        if int(fields[3]) == pid:  # Session id; the server leads its own session
+            ticks += int(fields[11]) + int(fields[12])
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def _stop_server(server):
+    # Signal the whole session so that worker processes do not outlive the server
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    try:
+        server.wait(5)
+    except subprocess.TimeoutExpired:
+        os.killpg(server.pid, signal.SIGKILL)
+        server.wait()
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _port_free(kind):
+    sock = socket.socket(socket.AF_INET, kind)
+    try:
+        sock.bind(("127.0.0.1", SERVER_PORT))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def _wait_listening(process, log, kind):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"server exited with status {process.returncode}: {log.read()[-500:]}")
+        # Probing would send the server a message; a port that cannot be bound is in use by it
+        if not _port_free(kind):
+            return
+        time.sleep(0.05)
+    raise RuntimeError("server did not start listening")
+
+
+def _run_client(scenario, count):
+    """
+    Run the client once and collect its output, wall time and CPU time.
+    """
+    cpuBefore = _children_cpu()
+    started = time.perf_counter()
+    result = subprocess.run(_command(scenario.client, scenario.client_settings), input=f"{count}\n",
+                            capture_output=True, text=True, env=_environment(), timeout=RUN_TIMEOUT)
+    elapsed = time.perf_counter() - started
+    return result.stdout, elapsed, _children_cpu() - cpuBefore
+
+
+def _parse_client(output):
+    packets = _packets.search(output)
+    if packets is None:
+        return None
+    parsed = {"packets_sent": int(packets.group(1)), "packets_received": int(packets.group(2))}
+    rtts = _rtts.search(output)
+    if rtts is not None:
+        parsed.update(rtt_min_ms=float(rtts.group(1)), rtt_max_ms=float(rtts.group(2)),
+                      rtt_avg_ms=float(rtts.group(3)), rtt_stddev_ms=float(rtts.group(4)))
+        line = output[rtts.end():].split("\n", 2)[1]
+        for p, value in _percentiles.findall(line):
+            parsed[f"rtt_p{p}_ms"] = float(value)
+    return parsed
+
+
+def run_scenario(scenario, scale=1.0):
+    """
+    Benchmark one server/client pair.
+
+    Argument : Scenario and a factor applied to its ping count
+
+    Output : dictionary of results, with 'skipped' or 'error' set on failure
+    """
+    if scenario.root and os.geteuid() != 0:
+        return {"skipped": "needs root for raw sockets"}
+    count = max(1, int(scenario.count * scale))
+    kind = socket.SOCK_DGRAM if scenario.server.startswith("udp") else socket.SOCK_STREAM
+    deadline = time.time() + STARTUP_TIMEOUT
+    while not _port_free(kind):
+        if time.time() > deadline:
+            return {"error": f"port {SERVER_PORT} is in use"}
+        time.sleep(0.1)
+
+    with tempfile.TemporaryFile("w+") as log:
+        server = subprocess.Popen(_command(scenario.server, scenario.server_settings), stdin=subprocess.DEVNULL,
+                                  stdout=log, stderr=subprocess.STDOUT, text=True, env=_environment(),
+                                  start_new_session=True)
+        try:
+            _wait_listening(server, log, kind)
+            # Interpreter start-up and imports, measured with a run that sends (almost) nothing
+            _, startupTime, startupCpu = _run_client(scenario, 0)
+            serverCpuBefore = _process_cpu(server.pid)
+            output, elapsed, clientCpu = _run_client(scenario, count)
+            serverCpu = _process_cpu(server.pid) - serverCpuBefore
+        except (RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+            return {"error": str(e)}
+        finally:
+            _stop_server(server)
+
+    result = _parse_client(output)
+    if result is None:
+        return {"error": "no statistics in client output: " + output[-500:]}
+    sent = max(result["packets_sent"], 1)
+    # Runs shorter than the start-up noise have no meaningful rate; use a larger --scale
+    elapsed -= startupTime
+    result.update(
+        server=scenario.server, client=scenario.client, mode=scenario.mode,
+        elapsed_s=round(elapsed, 6),
+        packets_per_second=round(sent / elapsed, 1) if elapsed > 0 else None,
+        client_cpu_us_per_packet=round(max(clientCpu - startupCpu, 0) / sent * 1e6, 2),
+        # /proc counts in clock ticks; a run shorter than one tick measured nothing
+        server_cpu_us_per_packet=round(serverCpu / sent * 1e6, 2) if serverCpu else None,
+    )
+    return result
+
+
+def run(output_path=None, scale=1.0, only=None):
+    """
+    Run every scenario (or the selected ones) and print and save the results.
+
+    Argument : JSON output path (None prints only), count scale factor and
+               scenario names to run, e.g. ['udp-flood', 'tcp_async']
+
+    Output : results dictionary as written to JSON
+    """
+    results = {}
+    for scenario in SCENARIOS:
+        key = f"{scenario.name}-{scenario.mode}"
+        if only and key not in only and scenario.name not in only:
+            continue
+        print(f"Running {key} ...", flush=True)
+        result = run_scenario(scenario, scale)
+        results[key] = result
+        if "skipped" in result or "error" in result:
+            print(f"     {result.get('skipped') or 'Error: ' + result['error']}")
+            continue
+        print(f"     Packets: Sent = {result['packets_sent']}, Received = {result['packets_received']}, "
+              + (f"{result['packets_per_second']:.0f} packets/s" if result["packets_per_second"]
+                 else "too short to time"))
+        serverCpu = result["server_cpu_us_per_packet"]
+        print(f"     CPU per packet: client = {result['client_cpu_us_per_packet']:.1f} us, "
+              f"server = {'%.1f us' % serverCpu if serverCpu else 'below one clock tick'}")
+        if "rtt_p50_ms" in result:
+            print(f"     Noise floor: min = {result['rtt_min_ms']:.3f} ms, p50 = {result['rtt_p50_ms']:.3f} ms, "
+                  f"p99 = {result.get('rtt_p99_ms', 0):.3f} ms")
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "scale": scale,
+        "results": results,
+    }
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {output_path}")
+    return report
+
+
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare two result files metric by metric.
+
+    Argument : baseline and current results dictionaries and the tolerated
+               change in percent
+
+    Output : list of regression descriptions (empty when none)
+    """
+    regressions = []
+    for key, old in baseline["results"].items():
+        new = current["results"].get(key)
+        if new is None or "packets_sent" not in old or "packets_sent" not in new:
+            print(f"{key}: not comparable")
+            continue
+        for metric, higherIsBetter in METRICS:
+            if not old.get(metric) or new.get(metric) is None:
+                continue
+            change = (new[metric] - old[metric]) / old[metric] * 100
+            worse = -change if higherIsBetter else change
+            verdict = "REGRESSION" if worse > tolerance else "improved" if worse < -tolerance else "ok"
+            print(f"{key:22} {metric:26} {old[metric]:>12.3f} -> {new[metric]:>12.3f} ({change:+.1f}%) {verdict}")
+            if verdict == "REGRESSION":
+                regressions.append(f"{key} {metric} {change:+.1f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pingers on loopback")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runParser = commands.add_parser("run", help="run the benchmarks")
+    runParser.add_argument("-o", "--output", help="write the results to this JSON file")
+    runParser.add_argument("--scale", type=float, default=1.0, help="multiply every ping count by this factor")
+    runParser.add_argument("--only", nargs="+", help="scenarios to run, e.g. udp-flood or tcp_async")
+    compareParser = commands.add_parser("compare", help="flag regressions against a baseline")
+    compareParser.add_argument("baseline")
+    compareParser.add_argument("current")
+    compareParser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                               help="tolerated change in percent (default %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.output, args.scale, args.only)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:g}%:")
+        for regression in regressions:
+            print("     " + regression)
+        return 1
+    print(f"\nNo regressions beyond {args.tolerance:g}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
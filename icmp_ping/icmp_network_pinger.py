@@ -10,10 +10,27 @@ DESCRIPTION:
     This module provides comprehensive ICMP ping functionality that:
     - Sends ICMP echo requests to remote hosts using raw sockets
     - Measures round-trip time (RTT) for network latency analysis
-    - Calculates minimum, maximum, and average RTT statistics
-    - Detects and handles ICMP error responses (Destination Unreachable, Host Unreachable, etc.)
+    - Calculates minimum, maximum, average and percentile RTT statistics in constant memory
+    - Detects and handles ICMP error responses (Destination Unreachable, Host Unreachable,
+      Time Exceeded, etc.)
     - Reports packet loss rates and network connectivity status
     - Works across different network topologies and configurations
+    - Optionally times every stage of each probe (socket, build, checksum, send,
+      wait, receive, output) and profiles the ping loop (ping_common.probe_timing)
+    - Optionally appends every result to a columnar results store for later
+      queries (ping_common.results_store)
+    - Optionally serves live counters, RTT histograms and ICMP error counts by
+      type and code in the OpenMetrics format (ping_common.metrics_exporter)
+    - Sends probes on an absolute schedule (one per INTERVAL, optionally capped
+      by a token bucket) and reports how far the sends deviated from it
+      (ping_common.pacing)
+    - Optionally adapts the probe timeout to the path from the smoothed RTT and
+      its variance (RFC 6298) and matches replies to probes by sequence number
+      (ping_common.adaptive_timeout)
+    - Resolves the host through a TTL cache shared by every ping() call
+      (ping_common.resolver)
+    - Optionally finds the path MTU to the host with concurrent DF probes
+      before pinging and reports MTU blackholes (ping_common.pmtu)
 
 USE CASES:
     - Host reachability testing and network troubleshooting
@@ -29,42 +46,66 @@ import struct
 import time
 import select
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.adaptive_timeout import load_timeout
+from ping_common.inet_checksum import checksum
+from ping_common.metrics_exporter import load_metrics_exporter
+from ping_common.pacing import load_pacer
+from ping_common.pmtu import describe as describe_pmtu, discover, pmtu_enabled
+from ping_common.probe_timing import DISABLED, load_loop_profiler, load_stage_timer
+from ping_common.resolver import shared_resolver
+from ping_common.results_store import STATUS_LOST, STATUS_REPLY, STATUS_UNREACHABLE, load_results_writer
+from ping_common.rtt_clock import RttClock
+from ping_common.rtt_stats import PERCENTILES, RttStats, print_on_signal
+
 ICMP_ECHO_REQUEST = 8
 ICMP_DEST_UNREACHABLE = 3 
-rtts = []
+ICMP_TIME_EXCEEDED = 11
+CLOCK_SOURCE = "wall"  # "wall" (time.time), "monotonic" or "kernel" (SO_TIMESTAMPNS)
+rtts = RttStats()  # Constant-memory RTT statistics; kill -USR1 prints them
+STAGE_TIMING = False  # Print per-stage probe timings on exit (or PING_STAGE_TIMING=1)
+PROFILE_OUTPUT = ""  # Profile the ping loop into this file, .folded = sampling (or PING_PROFILE)
+RESULTS_PATH = ""  # Append every result to this results store directory (or PING_RESULTS)
+METRICS_ADDRESS = ""  # Serve OpenMetrics on this "[host:]port", e.g. "9464" (or PING_METRICS)
+exporter = None  # MetricsExporter, started by the first ping()
+INTERVAL = 1.0  # Seconds between probe sends on an absolute schedule (or PING_INTERVAL, e.g. "100ms")
+RATE_LIMIT = 0  # Maximum probes per second (token bucket), 0 = unlimited (or PING_RATE)
+TIMEOUT_MODE = "fixed"  # "fixed" (the timeout argument) or "adaptive [floor=20ms] [ceiling=3s]" (or PING_TIMEOUT)
+PMTU_DISCOVERY = False  # Find the path MTU to the host before pinging, cached per target (or PING_PMTU=1)
+
+def ignoreResult(status, rtt=0.0, error=None):
+    pass
 
-def checksum(string):
+def destUnreachableMessage(code):
     """
-    This function takes a argument of a string to calculate the checksum value
+    Describe an ICMP Destination Unreachable (Type 3) error.
 
-    Argument: string(byte)
+    Argument : ICMP code of the error
 
-    Output: checksum value
+    Output : Error message in the format printed by the pinger
 
     """
-    csum = 0
-    countTo = (len(string) // 2) * 2
-    count = 0
-    while count < countTo:
-        thisVal = string[count+1] * 256 + string[count]
-        csum = csum + thisVal
-        csum = csum & 0xffffffff
-        count = count + 2
-    if countTo < len(string):
-        csum = csum + string[len(string) - 1]
-        csum = csum & 0xffffffff
-    csum = (csum >> 16) + (csum & 0xffff)
-    csum = csum + (csum >> 16)
-    answer = ~csum
-    answer = answer & 0xffff
-    answer = answer >> 8 | (answer << 8 & 0xff00)
-    return answer
-
-def receiveOnePing(mySocket, ID, timeout, destAddr):
+    if code == 0:
+        return "Error: Network unreachable"
+    elif code == 1:
+        return "Error: Host unreachable"
+    elif code == 2:
+        return "Error: Protocol unreachable"
+    elif code == 3:
+        return "Error: Port unreachable"
+    else:
+        return f"Error: Destination unreachable, ICMP code {code}"
+
+def receiveOnePing(mySocket, ID, timeout, destAddr, clock=None, timer=DISABLED, record=ignoreResult,
+                   sequence=None):
     """
     Receive one ping from the socket.
 
-    Argument : ICMP socket object,ping request identifier,time out and destination address
+    Argument : ICMP socket object,ping request identifier,time out and destination address,
+               and optionally the RttClock used to timestamp the probe, the
+               StageTimer of the probe, a record(status, rtt, error) callable
+               that stores the result, error being the ICMP (type, code) if any,
+               and the sequence number the reply must carry (None = any)
 
     Output : Information of a ping response
 
@@ -74,53 +115,65 @@ def receiveOnePing(mySocket, ID, timeout, destAddr):
         startedSelect = time.time()
         whatReady = select.select([mySocket], [], [], timeLeft)
         howLongInSelect = (time.time() - startedSelect)
+        timer.mark("wait")
         if whatReady[0] == []:  # Timeout
+            record(STATUS_LOST)
             return "Request timed out."
-        timeReceived = time.time()
-        recPacket, addr = mySocket.recvfrom(1024)
+        if clock is None:
+            timeReceived = time.time()
+            recPacket, addr = mySocket.recvfrom(1024)
+        else:
+            recPacket, addr, receivedNs = clock.recvfrom(mySocket, 1024)
+            timeReceived = receivedNs / 1e9
         # Fetch the ICMP header from the IP packet
         icmpHeader = recPacket[20:28]#as first 20 bytes are ip header 
-        type, code, checksum, packetID, sequence = struct.unpack("bbHHh", icmpHeader)
+        type, code, checksum, packetID, replySequence = struct.unpack("bbHHh", icmpHeader)
         
         # Handle ICMP Destination Unreachable errors (Type 3)
         if type == 3:
-            if code == 0:
-                return "Error: Network unreachable"
-            elif code == 1:
-                return "Error: Host unreachable"
-            elif code == 2:
-                return "Error: Protocol unreachable"
-            elif code == 3:
-                return "Error: Port unreachable"
-            else:
-                return f"Error: Destination unreachable, ICMP code {code}"
+            timer.mark("receive")
+            record(STATUS_UNREACHABLE, error=(type, code))
+            return destUnreachableMessage(code)
+
+        # Handle ICMP Time Exceeded errors (Type 11); icmp_traceroute.py maps them per hop
+        if type == ICMP_TIME_EXCEEDED:
+            timer.mark("receive")
+            record(STATUS_UNREACHABLE, error=(type, code))
+            return f"Error: Time exceeded in transit at {addr[0]}"
 
         # Calculate RTT
         sentTime = struct.unpack('d', recPacket[28:])[0]
         rtt = (timeReceived - sentTime) * 1000  # Convert to ms
+        timer.mark("receive")
         
-        # Handle valid Echo Reply (Type 0)
-        if packetID == ID:
-            rtts.append(rtt)
+        # Handle valid Echo Reply (Type 0); late replies to earlier probes carry another sequence
+        if packetID == ID and (sequence is None or replySequence & 0xFFFF == sequence):
+            rtts.add(rtt)
+            record(STATUS_REPLY, rtt)
             return f"Reply from {addr[0]}: time={rtt:.2f}ms"
         #to response if both the response or icmp error not recieved in time
         timeLeft = timeLeft - howLongInSelect
         if timeLeft <= 0:
+            record(STATUS_LOST)
             return "Request timed out."
 
-def sendOnePing(mySocket, destAddr, ID):
+def sendOnePing(mySocket, destAddr, ID, sequence=1, clock=None, timer=DISABLED):
     """
     Send one ping to the given destination address.
 
-    Argument : ICMP socket object , destination address , ping request's identifier
+    Argument : ICMP socket object , destination address , ping request's identifier,
+               sequence number (1 unless several probes share an identifier)
+               and optionally the RttClock that timestamps the payload and the
+               StageTimer of the probe
 
     Output: Sends ICMP echo request to the dest. address
 
     """
     myChecksum = 0
     # Make a dummy header with a 0 checksum
-    header = struct.pack("bbHHh", ICMP_ECHO_REQUEST, 0, myChecksum, ID, 1)
-    data = struct.pack("d", time.time())
+    header = struct.pack("bbHHH", ICMP_ECHO_REQUEST, 0, myChecksum, ID, sequence)
+    data = struct.pack("d", clock.now() / 1e9 if clock else time.time())
+    timer.mark("build")
     # Calculate the checksum on the data and the dummy header.
     myChecksum = checksum(header + data)
     # Get the right checksum, and put it in the header
@@ -128,15 +181,21 @@ def sendOnePing(mySocket, destAddr, ID):
         myChecksum = htons(myChecksum) & 0xffff
     else:
         myChecksum = htons(myChecksum)
-    header = struct.pack("bbHHh", ICMP_ECHO_REQUEST, 0, myChecksum, ID, 1)
+    header = struct.pack("bbHHH", ICMP_ECHO_REQUEST, 0, myChecksum, ID, sequence)
+    timer.mark("checksum")
     packet = header + data
+    timer.mark("build")
     mySocket.sendto(packet, (destAddr, 0))  # AF_INET address must be tuple, port is 0 for ICMP
+    timer.mark("send")
 
-def doOnePing(destAddr, timeout):
+def doOnePing(destAddr, timeout, clock=None, timer=DISABLED, record=ignoreResult, sequence=1):
     """
     Perform a single ping operation.
 
-    Argument : Destination address and maximum waiting of ping response
+    Argument : Destination address, maximum waiting of ping response and
+               optionally the RttClock used to time the probe, the StageTimer
+               of the probe, the record(status, rtt, error) callable of its result
+               and the probe's sequence number
 
     Output : Round trip time of the ping
 
@@ -144,44 +203,95 @@ def doOnePing(destAddr, timeout):
     icmp = getprotobyname("icmp")
     # SOCK_RAW is a powerful socket type. For more details: http://sockraw.org/papers/sock_raw
     mySocket = socket(AF_INET, SOCK_RAW, icmp)
+    if clock is not None:
+        clock.enable(mySocket)
     myID = os.getpid() & 0xFFFF  # Return the current process ID
-    sendOnePing(mySocket, destAddr, myID) #to send the packet
-    delay = receiveOnePing(mySocket, myID, timeout, destAddr) # receive the packet 
+    timer.mark("socket")
+    sendOnePing(mySocket, destAddr, myID, sequence, clock, timer) #to send the packet
+    delay = receiveOnePing(mySocket, myID, timeout, destAddr, clock, timer, record, sequence) # receive the packet 
     mySocket.close()
+    timer.mark("socket")
     return delay
 
-def ping(host, numPing, timeout=1):
+def ping(host, numPing, timeout=1, clock_source=CLOCK_SOURCE):
     """
     Ping a host and print the result.
 
-    Argument : Host's IP address and the time-out time
+    Argument : Host's IP address, the time-out time (the fixed timeout, or
+               the initial one of TIMEOUT_MODE "adaptive" if not given there)
+               and the clock source ("wall", "monotonic" or "kernel")
 
     Output: Delay
     
     """
-    dest = gethostbyname(host)
+    global exporter
+    dest = shared_resolver().resolve(host)  # Cached across calls
+    clock = RttClock(clock_source)
     print(f"Pinging {dest} using Python:")
     print("")
-    # Send ping requests to the server at approximately one-second intervals.
-    for i in range(numPing):
-        delay = doOnePing(dest, timeout)
-        print(delay)
-        time.sleep(1)  # Pause for one second between sending packets.
+    print_on_signal(rtts, f"Ping statistics for {dest} so far:")
+    timer = load_stage_timer(STAGE_TIMING)
+    profiler = load_loop_profiler(PROFILE_OUTPUT)
+    pacer = load_pacer(INTERVAL, RATE_LIMIT)
+    probe_timeout = load_timeout(TIMEOUT_MODE, timeout)  # Adapts to the RTT of this host if configured
+    results = load_results_writer(RESULTS_PATH)
+    target = f"icmp:{dest}"  # Target name in the results store and metrics
+    if pmtu_enabled(PMTU_DISCOVERY):
+        try:
+            print(describe_pmtu(discover(target, dest)))
+        except OSError as e:
+            print(f"Path MTU to {target}: unknown ({e})")  # Pinging shows the rest
+        print("")
+    if exporter is None:
+        exporter = load_metrics_exporter(METRICS_ADDRESS)
+    metrics = exporter.target(target)
+
+    def record(status, rtt=0.0, error=None):
+        results.append(target, i, rtt, status)
+        if status == STATUS_REPLY:
+            metrics.reply(rtt)
+            probe_timeout.sample(rtt)
+        else:
+            metrics.loss()
+            if status == STATUS_LOST:
+                probe_timeout.expired()
+        if error is not None:
+            metrics.icmp_error(*error)
+
+    received = rtts.count
+    profiler.start()
+    try:
+        # Send ping requests to the server at exact intervals, measured from the first send
+        for i in range(numPing):
+            pacer.wait()
+            timer.start()
+            metrics.probe_sent()
+            delay = doOnePing(dest, probe_timeout.timeout, clock, timer, record, (i + 1) & 0xFFFF)
+            print(delay)
+            timer.mark("output")
+            timer.finish()
+    finally:
+        profiler.stop()
+        results.flush()
     
-    # Calculate and print statistics
-    if rtts:
-        min_rtt = min(rtts)
-        max_rtt = max(rtts)
-        avg_rtt = sum(rtts) / len(rtts)
-        packet_loss_rate = ((numPing - len(rtts)) / numPing) * 100
-
-        print(f"\nMinimum RTT: {min_rtt:.2f} ms")
-        print(f"Maximum RTT: {max_rtt:.2f} ms")
-        print(f"Average RTT: {avg_rtt:.2f} ms")
-        print(f"Packet loss rate: {packet_loss_rate:.2f}%")
+    rtts.add_loss(numPing - (rtts.count - received))
+
+    # Print statistics
+    if rtts.count:
+        print(f"\nMinimum RTT: {rtts.minimum:.2f} ms")
+        print(f"Maximum RTT: {rtts.maximum:.2f} ms")
+        print(f"Average RTT: {rtts.mean:.2f} ms")
+        print(f"RTT std dev: {rtts.stddev:.2f} ms")
+        print("RTT percentiles: " + ", ".join(f"p{p:g} = {rtts.percentile(p):.2f} ms" for p in PERCENTILES))
+        print(f"Packet loss rate: {rtts.loss_rate:.2f}%")
     else:
         print("No RTTs recorded.")
         print("Packet loss rate: 100%")
+    print(f"Clock source: {clock.describe()}")
+    if probe_timeout.adaptive:
+        print(f"Timeout: {probe_timeout.describe()}")
+    if pacer.enabled:
+        print(pacer.report())
 
 if __name__ == "__main__":
     numPing = int(input("Enter number of pings: "))
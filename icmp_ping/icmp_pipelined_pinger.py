@@ -0,0 +1,192 @@
+"""
+Network Diagnostics: Pipelined ICMP Pinger
+
+PROBLEM STATEMENT:
+    The ICMP pinger waits for each reply (or a full timeout) before sending the
+    next probe, so on a lossy link every lost packet stalls the run for a second.
+    Measuring loss with a thousand probes can then take up to a thousand seconds.
+
+DESCRIPTION:
+    This module implements a pipelined pinger for a single target (like fping -p) that:
+    - Sends probes on a fixed schedule with incrementing sequence numbers
+    - Keeps sending whether or not earlier replies have arrived
+    - Tracks outstanding probes in a bounded ring keyed by sequence number
+    - Counts replies that arrive after their timeout as late
+    - Counts repeated replies for the same sequence number as duplicates
+    - Reports RTT statistics and loss once the last probe has been answered or expired
+
+USE CASES:
+    - Fast loss measurement on lossy or long links
+    - High-rate latency sampling of a single host
+    - Detecting duplicated and reordered ICMP replies
+"""
+
+import collections
+import os
+import select
+import struct
+import time
+from socket import *
+
+from icmp_network_pinger import sendOnePing
+from ping_common.resolver import shared_resolver
+from ping_common.rtt_stats import PERCENTILES, RttStats, print_on_signal
+
+ICMP_ECHO_REPLY = 0
+
+# States of a ring slot
+PENDING = 0
+ANSWERED = 1
+EXPIRED = 2
+
+
+class ProbeRing:
+    """
+    Bounded ring of outstanding probes indexed by sequence number.
+
+    Argument : number of slots; sequences more than size apart share a slot
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.sequences = [None] * size
+        self.sentTimes = [0.0] * size
+        self.states = [EXPIRED] * size
+
+    def add(self, sequence, sentTime):
+        """
+        Record a new probe. Returns True if an unanswered older probe was evicted.
+        """
+        slot = sequence % self.size
+        evicted = self.sequences[slot] is not None and self.states[slot] == PENDING
+        self.sequences[slot] = sequence
+        self.sentTimes[slot] = sentTime
+        self.states[slot] = PENDING
+        return evicted
+
+    def lookup(self, sequence):
+        """
+        Return (state, send time) of a probe, or None if its slot was reused.
+        """
+        slot = sequence % self.size
+        if self.sequences[slot] != sequence:
+            return None
+        return self.states[slot], self.sentTimes[slot]
+
+    def mark(self, sequence, state):
+        self.states[sequence % self.size] = state
+
+
+def pipelined_ping(host, count, interval=0.01, timeout=1, ring_size=1024):
+    """
+    Ping a host with count probes sent every interval seconds.
+
+    Argument : host name or address, number of probes, send interval and
+               per-probe timeout in seconds, and the size of the probe ring
+
+    Output : dictionary with sent, received, lost, late and duplicate counts
+             and the RttStats of the run under "rtt"
+    """
+    if ring_size > 0x10000 or 0x10000 % ring_size:
+        raise ValueError("ring_size must be a power of two no larger than 65536")
+    dest = shared_resolver().resolve(host)
+    print(f"Pinging {dest} every {interval * 1000:.1f} ms using Python:")
+    print("")
+
+    mySocket = socket(AF_INET, SOCK_RAW, getprotobyname("icmp"))
+    mySocket.setblocking(False)
+    myID = os.getpid() & 0xFFFF
+    ring = ProbeRing(ring_size)
+    expiries = collections.deque()  # (deadline, sequence) in send order
+    rtts = RttStats()
+    stats = {"sent": 0, "received": 0, "lost": 0, "late": 0, "duplicates": 0, "rtt": rtts}
+    print_on_signal(rtts, f"Ping statistics for {dest} so far:")
+
+    start = time.time()
+    nextSend = start
+    outstanding = 0
+    try:
+        while stats["sent"] < count or outstanding:
+            now = time.time()
+            if stats["sent"] < count and now >= nextSend:
+                sequence = stats["sent"] & 0xFFFF
+                if ring.add(sequence, now):
+                    stats["lost"] += 1  # Evicted before it could expire
+                    rtts.add_loss()
+                    outstanding -= 1
+                sendOnePing(mySocket, dest, myID, sequence)
+                expiries.append((now + timeout, sequence))
+                stats["sent"] += 1
+                outstanding += 1
+                nextSend = start + stats["sent"] * interval  # Fixed schedule, no drift
+                continue
+
+            while expiries and expiries[0][0] <= now:
+                sequence = expiries.popleft()[1]
+                probe = ring.lookup(sequence)
+                if probe is not None and probe[0] == PENDING:
+                    ring.mark(sequence, EXPIRED)
+                    stats["lost"] += 1
+                    rtts.add_loss()
+                    outstanding -= 1
+                    print(f"Request timed out (seq={sequence})")
+
+            wakeUp = nextSend if stats["sent"] < count else now + timeout
+            if expiries:
+                wakeUp = min(wakeUp, expiries[0][0])
+            if stats["sent"] == count and not outstanding:
+                break
+            whatReady = select.select([mySocket], [], [], max(0.0, wakeUp - time.time()))
+            if whatReady[0] == []:
+                continue
+
+            while True:
+                try:
+                    recPacket, addr = mySocket.recvfrom(1024)
+                except (BlockingIOError, InterruptedError):
+                    break
+                timeReceived = time.time()
+                type, code, checksum, packetID, sequence = struct.unpack("bbHHH", recPacket[20:28])
+                if type != ICMP_ECHO_REPLY or packetID != myID or addr[0] != dest:
+                    continue
+                probe = ring.lookup(sequence)
+                if probe is None:
+                    stats["late"] += 1  # Slot already reused by a newer probe
+                    continue
+                state, sentTime = probe
+                if state == ANSWERED:
+                    stats["duplicates"] += 1
+                    print(f"Duplicate reply from {addr[0]} (seq={sequence})")
+                elif state == EXPIRED:
+                    stats["late"] += 1
+                    print(f"Late reply from {addr[0]} (seq={sequence})")
+                    ring.mark(sequence, ANSWERED)
+                else:
+                    rtt = (timeReceived - sentTime) * 1000  # Convert to ms
+                    rtts.add(rtt)
+                    stats["received"] += 1
+                    outstanding -= 1
+                    ring.mark(sequence, ANSWERED)
+                    print(f"Reply from {addr[0]}: seq={sequence} time={rtt:.2f}ms")
+    finally:
+        mySocket.close()
+
+    elapsed = time.time() - start
+    print(f"\nSent {stats['sent']} probes in {elapsed:.2f} s")
+    print(f"Received: {stats['received']}, Lost: {stats['lost']}, "
+          f"Late: {stats['late']}, Duplicates: {stats['duplicates']}")
+    if rtts.count:
+        print(f"Minimum RTT: {rtts.minimum:.2f} ms")
+        print(f"Maximum RTT: {rtts.maximum:.2f} ms")
+        print(f"Average RTT: {rtts.mean:.2f} ms")
+        print(f"RTT std dev: {rtts.stddev:.2f} ms")
+        print("RTT percentiles: " + ", ".join(f"p{p:g} = {rtts.percentile(p):.2f} ms" for p in PERCENTILES))
+    print(f"Packet loss rate: {stats['lost'] / stats['sent'] * 100 if stats['sent'] else 100:.2f}%")
+    return stats
+
+
+if __name__ == "__main__":
+    host = input("Enter target host: ").strip() or "8.8.8.8"
+    numPing = int(input("Enter number of pings: "))
+    interval = float(input("Enter interval between pings in ms: ")) / 1000
+    pipelined_ping(host, numPing, interval)
@@ -0,0 +1,261 @@
+"""
+Network Diagnostics: Asynchronous Multi-Target ICMP Sweep
+
+PROBLEM STATEMENT:
+    The ICMP pinger probes one host at a time, opens a new raw socket for every
+    probe and sleeps a full second between probes. Sweeping a fleet of thousands
+    of addresses that way takes hours, although almost all of that time is spent
+    waiting for replies that could be awaited concurrently.
+
+DESCRIPTION:
+    This module implements an asyncio sweep engine that:
+    - Sends ICMP echo requests to many targets over one shared raw socket
+    - Gives every probe a unique (identifier, sequence) pair
+    - Matches echo replies and quoted ICMP errors back to the probe that caused them
+    - Bounds the number of probes in flight so socket buffers do not overflow
+    - Yields per-target results as soon as they arrive or time out
+    - Resolves all target names concurrently before the first send, through a
+      TTL cache that later sweeps reuse (ping_common.resolver)
+    - Reuses sendOnePing() and the reply messages of icmp_network_pinger.py
+
+USE CASES:
+    - Reachability sweeps over large host inventories
+    - Fleet-wide latency snapshots
+    - Detecting unreachable hosts and networks in bulk
+"""
+
+import asyncio
+import collections
+import os
+import struct
+import time
+from socket import *
+
+from icmp_network_pinger import ICMP_DEST_UNREACHABLE, destUnreachableMessage, sendOnePing
+from ping_common.resolver import shared_resolver
+from ping_common.rtt_stats import RttStats
+
+ICMP_ECHO_REPLY = 0
+
+# One sweep result; rtt is in milliseconds and None when no reply arrived
+SweepResult = collections.namedtuple("SweepResult", "target address sequence rtt message")
+
+
+def _probe_key(counter, base_id):
+    """
+    Map a running probe counter onto a unique (identifier, sequence) pair.
+
+    Argument : probe counter and the identifier of the first probe
+
+    Output : (identifier, sequence) tuple
+    """
+    return ((base_id + (counter >> 16)) & 0xFFFF, counter & 0xFFFF)
+
+
+def _parse_packet(packet):
+    """
+    Extract the probe key and outcome from a packet read off the raw socket.
+
+    Argument : IP packet received on the ICMP socket
+
+    Output : (key, icmp type, icmp code, sent timestamp) or None if irrelevant
+    """
+    ihl = (packet[0] & 0x0F) * 4
+    if len(packet) < ihl + 8:
+        return None
+    type, code, _, packetID, sequence = struct.unpack("bbHHH", packet[ihl:ihl + 8])
+    if type == ICMP_ECHO_REPLY:
+        if len(packet) < ihl + 16:
+            return None
+        sentTime = struct.unpack("d", packet[ihl + 8:ihl + 16])[0]
+        return (packetID, sequence), type, code, sentTime
+    if type == ICMP_DEST_UNREACHABLE:
+        # The error quotes the IP header and first 8 bytes of our echo request
+        inner = packet[ihl + 8:]
+        if len(inner) < 20:
+            return None
+        innerIhl = (inner[0] & 0x0F) * 4
+        if len(inner) < innerIhl + 8:
+            return None
+        _, _, _, packetID, sequence = struct.unpack("bbHHH", inner[innerIhl:innerIhl + 8])
+        return (packetID, sequence), type, code, None
+    return None
+
+
+class IcmpSweep:
+    """
+    Sweep many targets with ICMP echo requests over a single raw socket.
+
+    Argument : timeout per probe in seconds, maximum probes in flight, the
+               pause between consecutive sends in seconds and the Resolver of
+               the target names (default the process's shared one)
+    """
+
+    def __init__(self, timeout=1, max_in_flight=1024, interval=0.0, resolver=None):
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.interval = interval
+        self.resolver = resolver or shared_resolver()
+        self.base_id = os.getpid() & 0xFFFF
+        self.counter = 0
+        self.pending = {}  # (ID, sequence) -> (target, address, probe number, deadline)
+        self.deadlines = collections.deque()  # (deadline, key) in send order
+        self.socket = None
+        self.results = None
+        self.slots = None
+
+    def _open_socket(self):
+        icmp = getprotobyname("icmp")
+        mySocket = socket(AF_INET, SOCK_RAW, icmp)
+        mySocket.setblocking(False)
+        # A large receive buffer absorbs reply bursts from thousands of hosts
+        mySocket.setsockopt(SOL_SOCKET, SO_RCVBUF, 4 * 1024 * 1024)
+        return mySocket
+
+    def _finish(self, key, rtt, message):
+        target, address, number, _ = self.pending.pop(key)
+        self.slots.release()
+        self.results.put_nowait(SweepResult(target, address, number, rtt, message))
+
+    def _on_readable(self):
+        while True:
+            try:
+                recPacket, addr = self.socket.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            timeReceived = time.time()
+            parsed = _parse_packet(recPacket)
+            if parsed is None:
+                continue
+            key, type, code, sentTime = parsed
+            probe = self.pending.get(key)
+            if probe is None:
+                continue  # Late, duplicate or someone else's probe
+            if type == ICMP_ECHO_REPLY:
+                if addr[0] != probe[1]:
+                    continue
+                rtt = (timeReceived - sentTime) * 1000  # Convert to ms
+                self._finish(key, rtt, f"Reply from {addr[0]}: time={rtt:.2f}ms")
+            else:
+                self._finish(key, None, destUnreachableMessage(code))
+
+    async def _expire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, key = self.deadlines.popleft()
+                if key in self.pending:
+                    self._finish(key, None, "Request timed out.")
+            delay = self.deadlines[0][0] - now if self.deadlines else self.timeout
+            await asyncio.sleep(delay)
+
+    async def _send(self, target, address, number):
+        loop = asyncio.get_running_loop()
+        await self.slots.acquire()
+        key = _probe_key(self.counter, self.base_id)
+        self.counter += 1
+        deadline = loop.time() + self.timeout
+        self.pending[key] = (target, address, number, deadline)
+        self.deadlines.append((deadline, key))
+        while True:
+            try:
+                sendOnePing(self.socket, address, key[0], key[1])
+                return
+            except (BlockingIOError, InterruptedError):
+                writable = loop.create_future()
+                loop.add_writer(self.socket, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(self.socket)
+            except OSError as e:
+                self._finish(key, None, f"Error: {e.strerror}")
+                return
+
+    async def _send_all(self, targets, count):
+        addresses = await self.resolver.resolve_many_async(targets)
+        resolved = [addresses[target] for target in targets]
+        for target, address in zip(targets, resolved):
+            if isinstance(address, OSError):
+                self.results.put_nowait(SweepResult(target, None, 0, None, f"Error: {address}"))
+        for number in range(count):
+            for target, address in zip(targets, resolved):
+                if isinstance(address, OSError):
+                    continue
+                await self._send(target, address, number)
+                if self.interval:
+                    await asyncio.sleep(self.interval)
+
+    async def sweep(self, targets, count=1):
+        """
+        Probe every target count times and yield results as they arrive.
+
+        Argument : iterable of host names or addresses and probes per target
+
+        Output : asynchronous iterator of SweepResult tuples
+        """
+        targets = list(targets)
+        loop = asyncio.get_running_loop()
+        self.results = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.socket = self._open_socket()
+        loop.add_reader(self.socket, self._on_readable)
+        sender = asyncio.ensure_future(self._send_all(targets, count))
+        expirer = asyncio.ensure_future(self._expire())
+        expected = len(targets) * count
+        try:
+            while expected:
+                result = await self.results.get()
+                if result.address is None:
+                    expected -= count  # Unresolvable targets are reported once
+                else:
+                    expected -= 1
+                yield result
+        finally:
+            sender.cancel()
+            expirer.cancel()
+            loop.remove_reader(self.socket)
+            self.socket.close()
+            self.pending.clear()
+            self.deadlines.clear()
+
+
+async def sweep(targets, count=1, timeout=1, max_in_flight=1024):
+    """
+    Sweep the targets and print one line per result plus per-target statistics.
+
+    Argument : host names or addresses, probes per target, timeout and
+               maximum probes in flight
+
+    Output : dictionary of target -> RttStats
+    """
+    rtts = {}
+    async for result in IcmpSweep(timeout, max_in_flight).sweep(targets, count):
+        print(f"{result.target}: {result.message}")
+        stats = rtts.setdefault(result.target, RttStats())
+        if result.rtt is not None:
+            stats.add(result.rtt)
+        else:
+            stats.add_loss(count if result.address is None else 1)
+
+    print("")
+    for target, stats in rtts.items():
+        if stats.count:
+            print(f"{target}: {stats.count}/{count} replies, "
+                  f"min/avg/max = {stats.minimum:.2f}/{stats.mean:.2f}/{stats.maximum:.2f} ms, "
+                  f"p99 = {stats.percentile(99):.2f} ms")
+        else:
+            print(f"{target}: 0/{count} replies, 100% loss")
+    return rtts
+
+
+if __name__ == "__main__":
+    answer = input("Enter targets (comma separated) or a file with one target per line: ").strip()
+    if os.path.isfile(answer):
+        with open(answer) as f:
+            targets = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        targets = [t.strip() for t in answer.split(",") if t.strip()]
+    numPing = int(input("Enter number of pings per target: "))
+    asyncio.run(sweep(targets, numPing))
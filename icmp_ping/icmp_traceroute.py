@@ -0,0 +1,339 @@
+"""
+Network Diagnostics: Parallel-TTL ICMP Traceroute
+
+PROBLEM STATEMENT:
+    The ICMP pinger measures the path end to end. When latency or loss appears,
+    it cannot tell on which hop it is added: Time Exceeded replies (type 11)
+    are never requested or decoded. A classic traceroute that probes hop by
+    hop needs up to one timeout per silent hop to map a path once.
+
+DESCRIPTION:
+    This module implements a traceroute/mtr-style mode that:
+    - Sends one echo request for every TTL from 1 to the maximum hop count at
+      once, over one raw socket, each with its own (identifier, sequence)
+    - Matches Time Exceeded and Destination Unreachable replies to the probe
+      that caused them through the IP header and first 8 bytes they quote, and
+      echo replies through their own identifier and sequence
+    - Finds the path length from the lowest TTL answered by the destination
+      (or ended by an unreachable error) and probes only up to it afterwards,
+      until a Time Exceeded at that TTL shows the route got longer
+    - Repeats the rounds on a schedule and keeps per-hop loss and RTT
+      statistics (last, average, best, worst, p90) up to date after every round
+    - Maps a whole path in about one RTT of its slowest hop, not one timeout
+      per hop; silent hops only delay the end of a round, not the next hops
+    - Runs the same receive loop against a crafted-packet stand-in path
+      (python3 icmp_traceroute.py --stand-in), without root or a network
+
+USE CASES:
+    - Locating the hop where latency or loss is added
+    - Continuous per-hop monitoring of a path (like mtr)
+    - Detecting routing changes and unreachable networks
+"""
+
+import collections
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from socket import *
+
+from icmp_network_pinger import ICMP_DEST_UNREACHABLE, ICMP_TIME_EXCEEDED, sendOnePing
+from ping_common.pacing import load_pacer
+from ping_common.resolver import shared_resolver
+from ping_common.rtt_stats import RttStats
+
+ICMP_ECHO_REPLY = 0
+MAX_HOPS = 30  # Highest TTL probed
+TIMEOUT = 1.0  # Seconds to wait for the replies of a round
+INTERVAL = 1.0  # Seconds between rounds (or PING_INTERVAL)
+
+# Destination Unreachable codes shown next to the hop, as traceroute does
+UNREACHABLE_MARKS = {0: "!N", 1: "!H", 2: "!P", 9: "!X", 10: "!X", 13: "!X"}
+
+
+def parse_reply(packet):
+    """
+    Extract the probe key and the kind of answer from a packet read off the raw socket.
+
+    Argument : IP packet received on the ICMP socket
+
+    Output : ((identifier, sequence), icmp type, icmp code), or None if the
+             packet is not an answer to an echo request
+    """
+    ihl = (packet[0] & 0x0F) * 4
+    if len(packet) < ihl + 8:
+        return None
+    type, code, _, packetID, sequence = struct.unpack("bbHHH", packet[ihl:ihl + 8])
+    if type == ICMP_ECHO_REPLY:
+        return (packetID, sequence), type, code
+    if type not in (ICMP_TIME_EXCEEDED, ICMP_DEST_UNREACHABLE):
+        return None
+    # The error quotes the IP header and first 8 bytes of our echo request
+    inner = packet[ihl + 8:]
+    if len(inner) < 20:
+        return None
+    innerIhl = (inner[0] & 0x0F) * 4
+    if len(inner) < innerIhl + 8 or inner[9] != IPPROTO_ICMP:
+        return None
+    _, _, _, packetID, sequence = struct.unpack("bbHHH", inner[innerIhl:innerIhl + 8])
+    return (packetID, sequence), type, code
+
+
+class Hop:
+    """
+    Statistics of one TTL: who answered and how fast.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.rtts = RttStats()
+        self.addresses = collections.Counter()  # Several with equal-cost multipath
+        self.last = None  # RTT of the latest reply in ms
+        self.mark = ""  # Unreachable code, e.g. '!H'
+
+    def answered(self, address, rtt, mark=""):
+        self.rtts.add(rtt)
+        self.addresses[address] += 1
+        self.last = rtt
+        self.mark = mark
+
+    def describe(self):
+        """
+        One table row: TTL, addresses, loss and RTTs in milliseconds.
+        """
+        stats = self.rtts
+        address = " ".join(a for a, _ in self.addresses.most_common()) or "???"
+        if not stats.count:
+            return f"{self.ttl:>3}  {address:<18} {stats.loss_rate:5.1f}% {stats.sent:>5}"
+        return (f"{self.ttl:>3}  {address + self.mark:<18} {stats.loss_rate:5.1f}% {stats.sent:>5} "
+                f"{self.last:8.2f} {stats.mean:8.2f} {stats.minimum:8.2f} {stats.maximum:8.2f} "
+                f"{stats.percentile(90):8.2f}")
+
+
+class Traceroute:
+    """
+    Probe every hop of a path at once, round after round.
+
+    Argument : destination address, highest TTL, seconds to wait for the
+               replies of a round and the raw ICMP socket (or a stand-in with
+               setsockopt, sendto, recvfrom and fileno)
+    """
+
+    def __init__(self, dest, max_hops=MAX_HOPS, timeout=TIMEOUT, mySocket=None):
+        self.dest = dest
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.socket = mySocket or socket(AF_INET, SOCK_RAW, getprotobyname("icmp"))
+        self.myID = os.getpid() & 0xFFFF
+        self.sequence = 0
+        self.pathLength = None  # Lowest TTL that reached the end of the path
+        self.hops = {}  # TTL -> Hop
+        self.pending = {}  # (ID, sequence) -> (TTL, send time in ns)
+        self.rounds = 0
+
+    def _hop(self, ttl):
+        hop = self.hops.get(ttl)
+        if hop is None:
+            hop = self.hops[ttl] = Hop(ttl)
+        return hop
+
+    def _send_round(self):
+        for ttl in range(1, (self.pathLength or self.max_hops) + 1):
+            self.sequence = (self.sequence + 1) & 0xFFFF
+            key = (self.myID, self.sequence)
+            self.socket.setsockopt(IPPROTO_IP, IP_TTL, ttl)
+            self.pending[key] = (ttl, time.perf_counter_ns())
+            try:
+                sendOnePing(self.socket, self.dest, self.myID, self.sequence)
+            except OSError:
+                pass  # Counted as lost when the round ends
+
+    def _received(self, recPacket, addr, timeReceived):
+        parsed = parse_reply(recPacket)
+        if parsed is None:
+            return
+        key, type, code = parsed
+        probe = self.pending.pop(key, None)
+        if probe is None:
+            return  # Late, duplicate or someone else's probe
+        ttl, sentTime = probe
+        if type == ICMP_ECHO_REPLY and addr[0] != self.dest:
+            self.pending[key] = probe
+            return
+        rtt = (timeReceived - sentTime) / 1e6  # Convert to ms
+        mark = UNREACHABLE_MARKS.get(code, f"!{code}") if type == ICMP_DEST_UNREACHABLE else ""
+        self._hop(ttl).answered(addr[0], rtt, mark)
+        if type == ICMP_TIME_EXCEEDED:
+            if ttl == self.pathLength:
+                self.pathLength = None  # The route got longer: probe every TTL again next round
+        elif self.pathLength is None or ttl < self.pathLength:
+            # The destination (or an unreachable error) ends the path here
+            self.pathLength = ttl
+            for other in [k for k, (t, _) in self.pending.items() if t > ttl]:
+                del self.pending[other]
+            for other in [t for t in self.hops if t > ttl]:
+                del self.hops[other]
+
+    def round(self):
+        """
+        Send one probe per TTL and wait until every hop answered or the timeout passed.
+
+        Output : seconds the round took
+        """
+        started = time.perf_counter_ns()
+        self._send_round()
+        deadline = started + int(self.timeout * 1e9)
+        while self.pending:
+            left = (deadline - time.perf_counter_ns()) / 1e9
+            if left <= 0:
+                break
+            if not select.select([self.socket], [], [], left)[0]:
+                continue
+            recPacket, addr = self.socket.recvfrom(2048)
+            self._received(recPacket, addr, time.perf_counter_ns())
+        # Whatever is still unanswered in this round is lost
+        for ttl, _ in self.pending.values():
+            self._hop(ttl).rtts.add_loss()
+        self.pending.clear()
+        self.rounds += 1
+        return (time.perf_counter_ns() - started) / 1e9
+
+    def report(self):
+        """
+        Format the per-hop table.
+
+        Output : multi-line string
+        """
+        lines = [f"Route to {self.dest}, {self.rounds} rounds:",
+                 "Hop  Address             Loss%  Sent     Last      Avg     Best    Worst      p90"]
+        lines.extend(self.hops[ttl].describe() for ttl in sorted(self.hops))
+        if self.pathLength is None:
+            lines.append(f"Destination not reached within {self.max_hops} hops")
+        return "\n".join(lines)
+
+    def close(self):
+        self.socket.close()
+
+
+def traceroute(host, rounds=10, max_hops=MAX_HOPS, timeout=TIMEOUT, interval=INTERVAL):
+    """
+    Trace the path to a host and print the per-hop table after every round.
+
+    Argument : host name or address, number of rounds (0 = until Ctrl-C),
+               highest TTL, seconds to wait for a round's replies and seconds
+               between rounds
+
+    Output : Traceroute with the statistics of every hop
+    """
+    dest = shared_resolver().resolve(host)
+    tracer = Traceroute(dest, max_hops, timeout)
+    pacer = load_pacer(interval)
+    redraw = sys.stdout.isatty()
+    try:
+        while not rounds or tracer.rounds < rounds:
+            pacer.wait()
+            elapsed = tracer.round()
+            if redraw:
+                print("\033[H\033[J", end="")  # Redraw the table in place, like mtr
+            print(tracer.report())
+            print(f"Round {tracer.rounds} took {elapsed * 1000:.1f} ms\n")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracer.close()
+    return tracer
+
+
+class StandInPath:
+    """
+    A crafted-packet stand-in for a raw ICMP socket and the path behind it.
+
+    Every echo request sent through it is answered like a real path would:
+    with a Time Exceeded error quoting the request from the router at its TTL,
+    or with an echo reply from the destination, after that hop's delay.
+
+    Argument : router addresses (None for a hop that never answers), the
+               destination address and the one-way delay per hop in seconds
+    """
+
+    def __init__(self, routers, dest, hopDelay=0.005):
+        self.routers = routers
+        self.dest = dest
+        self.hopDelay = hopDelay
+        self.ttl = 64
+        self.receiver, self.sender = socketpair(AF_UNIX, SOCK_DGRAM)
+
+    def setsockopt(self, level, option, value):
+        if (level, option) == (IPPROTO_IP, IP_TTL):
+            self.ttl = value
+
+    def _ip_header(self, source, dest, ttl, payloadLength):
+        return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + payloadLength, 0, 0, ttl, IPPROTO_ICMP, 0,
+                           inet_aton(source), inet_aton(dest))
+
+    def sendto(self, packet, address):
+        request = self._ip_header("192.0.2.1", address[0], self.ttl, len(packet)) + packet
+        hop = min(self.ttl, len(self.routers) + 1)
+        if hop <= len(self.routers):
+            router = self.routers[hop - 1]
+            if router is None:
+                return len(packet)
+            # Time Exceeded: unused word, then the request's IP header and first 8 bytes
+            body = struct.pack("bbHI", ICMP_TIME_EXCEEDED, 0, 0, 0) + request[:28]
+            reply = self._ip_header(router, "192.0.2.1", 64 - hop, len(body)) + body
+        else:
+            body = struct.pack("bbHHH", ICMP_ECHO_REPLY, 0, 0, *struct.unpack("HH", packet[4:8])) + packet[8:]
+            reply = self._ip_header(self.dest, "192.0.2.1", 64 - hop, len(body)) + body
+        timer = threading.Timer(2 * hop * self.hopDelay, self.sender.send, (reply,))
+        timer.daemon = True
+        timer.start()
+        return len(packet)
+
+    def recvfrom(self, size):
+        packet = self.receiver.recv(size)
+        return packet, (inet_ntoa(packet[12:16]), 0)
+
+    def fileno(self):
+        return self.receiver.fileno()
+
+    def close(self):
+        self.receiver.close()
+        self.sender.close()
+
+
+def check_against_stand_in():
+    """
+    Trace a crafted 6-hop path with one silent router and check the hop table.
+    """
+    routers = ["10.0.0.1", "10.0.1.1", None, "172.16.0.1", "198.51.100.7"]
+    dest = "203.0.113.9"
+    tracer = Traceroute(dest, max_hops=16, timeout=0.2, mySocket=StandInPath(routers, dest))
+    elapsed = [tracer.round() for _ in range(3)]
+    print(tracer.report())
+    assert tracer.pathLength == 6, tracer.pathLength
+    assert sorted(tracer.hops) == [1, 2, 3, 4, 5, 6], sorted(tracer.hops)
+    for ttl, router in enumerate(routers + [dest], 1):
+        hop = tracer.hops[ttl]
+        if router is None:
+            assert hop.rtts.count == 0 and hop.rtts.sent == 3
+        else:
+            assert list(hop.addresses) == [router] and hop.rtts.count == 3, hop.describe()
+            assert 2 * ttl * 5 <= hop.rtts.minimum < 2 * ttl * 5 + 50, hop.describe()
+    # All hops at once: a round lasts about the timeout of the silent hop, not
+    # one timeout per hop, and nothing is sent beyond the destination afterwards
+    assert max(elapsed) < 0.2 + 0.1, elapsed
+    assert tracer.sequence == 16 + 6 + 6, tracer.sequence
+    tracer.close()
+    print(f"\nStand-in path mapped in {elapsed[0] * 1000:.0f} ms per round "
+          f"(hop by hop: up to {len(routers) + 1} x {tracer.timeout * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--stand-in"]:
+        check_against_stand_in()
+    else:
+        host = input("Enter target host: ").strip() or "8.8.8.8"
+        rounds = int(input("Enter number of rounds (0 = until Ctrl-C): "))
+        traceroute(host, rounds)
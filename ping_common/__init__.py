@@ -0,0 +1,26 @@
+"""
+Shared Helpers for the UDP, TCP and ICMP Pingers
+
+This package holds code used by more than one of the udp_ping, tcp_ping and
+icmp_ping scripts. The scripts put the repository root on sys.path so that
+they can keep being run directly from their own folders.
+
+Modules:
+- inet_checksum: Word-at-a-time Internet checksum (RFC 1071)
+- rtt_clock: Wall, monotonic and kernel (SO_TIMESTAMPNS) RTT clock sources
+- probe_format: Compact binary probe wire format and the servers' echo rule
+- rtt_stats: Constant-memory RTT statistics with percentiles
+- tcp_framing: Length-prefixed framing for the TCP pingers
+- icmp_errqueue: ICMP errors read from a UDP socket's error queue (IP_RECVERR)
+- icmp_emitter: ICMP error sender with one raw socket and cached templates
+- impairment: tc-netem style loss, delay, reordering and duplication for the servers
+- probe_timing: Per-stage probe timings and cProfile/sampling profiling of the ping loops
+- output_sink: Background-thread output in text, quiet, summary, interval and JSON Lines modes
+- results_store: Columnar on-disk store of probe results with a windowed query command
+- metrics_exporter: OpenMetrics HTTP endpoint with per-target counters, RTT histograms and ICMP errors
+- shard_scheduler: Multi-process scheduler probing shards of a UDP/TCP/ICMP target list
+- pacing: Absolute-deadline probe pacing, token bucket rate limit and deviation report
+- adaptive_timeout: Per-target probe timeouts estimated from SRTT and RTTVAR (RFC 6298)
+- resolver: Concurrent host name resolution with a positive and negative TTL cache
+- pmtu: Path MTU discovery with concurrent Don't Fragment probes and blackhole detection
+"""
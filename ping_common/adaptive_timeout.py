@@ -0,0 +1,142 @@
+"""
+Network Diagnostics: Adaptive Probe Timeouts (RFC 6298)
+
+PROBLEM STATEMENT:
+    Every client waits a fixed second for each reply. On a 0.2 ms loopback or
+    LAN path every lost probe wastes almost a full second, and on a 1.5 s
+    satellite path every reply arrives after the timeout and counts as lost.
+    The duration of a run depends on the worst case, not on the path.
+
+DESCRIPTION:
+    This module implements per-target probe timeouts that:
+    - Either stay fixed (the script's timeout, the default) or adapt to the path
+    - Estimate a retransmission timeout (RTO) from the smoothed RTT and the RTT
+      variance as TCP does (Jacobson/Karels, RFC 6298):
+          first sample R:  SRTT = R, RTTVAR = R / 2
+          later samples:   RTTVAR = 3/4 RTTVAR + 1/4 |SRTT - R|, SRTT = 7/8 SRTT + 1/8 R
+          RTO = SRTT + max(G, 4 * RTTVAR), clamped to [floor, ceiling]
+    - Double the RTO after every timeout (Karn's backoff) until the next reply
+      gives a new sample; probes are never retransmitted and every reply is
+      matched to its probe by sequence number, so every reply, even a late one,
+      is an unambiguous sample
+    - Are configured like the other shared settings, per script or with
+      PING_TIMEOUT: 'fixed', a fixed value like '250ms', or
+      'adaptive [floor=20ms] [ceiling=3s] [initial=1s]', the initial value
+      being the script's fixed timeout unless given
+
+USE CASES:
+    - Short runs on fast paths where losses would otherwise cost a second each
+    - Long-delay paths (satellite, congested links) without false losses
+    - One timeout policy shared by the UDP, TCP and ICMP clients
+"""
+
+import os
+
+from ping_common.pacing import parse_interval
+
+TIMEOUT_VARIABLE = "PING_TIMEOUT"
+DEFAULT_FLOOR = 0.02  # Seconds; keeps scheduling jitter on fast paths from counting as loss
+DEFAULT_CEILING = 3.0  # Seconds
+DEFAULT_INITIAL = 1.0  # Seconds before the first sample (RFC 6298, 2.1)
+CLOCK_GRANULARITY = 0.001  # Seconds (G); socket timeouts are waited for in milliseconds
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+
+
+class ProbeTimeout:
+    """
+    Timeout of the next probe to one target, fixed or adaptive.
+
+    Argument : fixed timeout in seconds, True for the adaptive RTO, and its
+               floor, ceiling and initial value in seconds
+    """
+
+    def __init__(self, fixed=1.0, adaptive=False, floor=DEFAULT_FLOOR, ceiling=DEFAULT_CEILING,
+                 initial=DEFAULT_INITIAL):
+        self.adaptive = adaptive
+        self.floor = floor
+        self.ceiling = ceiling
+        self.srtt = None  # Seconds
+        self.rttvar = None
+        self.samples = 0
+        self.backoffs = 0
+        self.timeout = min(max(initial, floor), ceiling) if adaptive else fixed  # Seconds
+        if not adaptive:
+            self.sample = self.expired = _nothing
+
+    def sample(self, rtt):
+        """
+        Update the estimate with the RTT of a reply in milliseconds.
+        """
+        r = rtt / 1000
+        if self.srtt is None:
+            self.srtt = r
+            self.rttvar = r / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - r)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * r
+        self.samples += 1
+        self.timeout = min(max(self.srtt + max(CLOCK_GRANULARITY, K * self.rttvar), self.floor), self.ceiling)
+
+    def expired(self, waited=None):
+        """
+        Back off after a probe timed out: double the timeout, up to the ceiling.
+
+        Probes in flight together back off once, not once each, and a probe
+        that waited longer than the current timeout doubles only the current one.
+
+        Argument : seconds the probe waited (default the current timeout)
+        """
+        backoff = min(min(waited or self.timeout, self.timeout) * 2, self.ceiling)
+        if backoff > self.timeout:
+            self.backoffs += 1
+            self.timeout = backoff
+
+    @property
+    def timeout_ns(self):
+        return int(self.timeout * 1e9)
+
+    def describe(self):
+        """
+        One line describing the timeout policy and the current estimate.
+        """
+        if not self.adaptive:
+            return f"fixed {self.timeout * 1000:g} ms"
+        text = f"adaptive (RFC 6298, floor {self.floor * 1000:g} ms, ceiling {self.ceiling * 1000:g} ms)"
+        if self.srtt is None:
+            return text + f", no replies yet, RTO = {self.timeout * 1000:.1f} ms"
+        return text + (f", SRTT = {self.srtt * 1000:.3f} ms, RTTVAR = {self.rttvar * 1000:.3f} ms, "
+                       f"RTO = {self.timeout * 1000:.1f} ms, {self.backoffs} backoffs")
+
+
+def _nothing(*args):
+    pass
+
+
+def load_timeout(spec="fixed", fixed=1.0):
+    """
+    Build the probe timeout for a pinger, letting PING_TIMEOUT override its setting.
+
+    Argument : 'fixed', a fixed timeout like '250ms' or
+               'adaptive [floor=20ms] [ceiling=3s] [initial=1s]', and the
+               pinger's own fixed timeout in seconds, also the adaptive
+               timeout's initial value unless one is given
+
+    Output : ProbeTimeout
+    """
+    spec = (os.environ.get(TIMEOUT_VARIABLE, spec) or "fixed").strip().lower()
+    words = spec.split()
+    if words[0] == "fixed":
+        return ProbeTimeout(fixed)
+    if words[0] != "adaptive":
+        return ProbeTimeout(parse_interval(words[0]))
+    options = {"floor": DEFAULT_FLOOR, "ceiling": DEFAULT_CEILING, "initial": fixed or DEFAULT_INITIAL}
+    for word in words[1:]:
+        name, _, value = word.partition("=")
+        if name not in options or not value:
+            raise ValueError(f"Unknown timeout option {word!r}, expected floor=, ceiling= or initial=")
+        options[name] = parse_interval(value)
+    if options["floor"] > options["ceiling"]:
+        raise ValueError(f"Timeout floor {options['floor']} s is above the ceiling {options['ceiling']} s")
+    return ProbeTimeout(adaptive=True, **options)
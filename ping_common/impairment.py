@@ -0,0 +1,402 @@
+"""
+Network Diagnostics: Shared Network Impairment Layer
+
+PROBLEM STATEMENT:
+    Every server simulates packet loss with its own hard-coded
+    random.randint(1, 10) > 8 test. Added delay, jitter, reordering, duplication
+    and bursty loss cannot be simulated at all, and no run can be reproduced.
+
+DESCRIPTION:
+    This module implements an impairment layer for the UDP and TCP servers that:
+    - Is configured with a tc-netem style string, e.g.
+      'delay 20ms 5ms distribution normal loss gemodel 1% 30% reorder 10% seed 7'
+    - Drops replies with Bernoulli ('loss 20%') or Gilbert-Elliott
+      ('loss gemodel p r [1-h [1-k]]') loss
+    - Delays replies by a constant, uniform, normal, pareto or paretonormal amount
+    - Reorders (sends a share of replies without the delay) and duplicates replies
+    - Draws every decision from one seedable random.Random for reproducible runs
+    - Keeps delayed replies on a hashed timer wheel that the server's own receive
+      loop drives, so 100k pending replies cost no threads and no sleeps
+    - Can be overridden for every server at once with the PING_IMPAIRMENT variable
+
+    Spec keywords (values like tc-netem; times in us/ms/s, bare numbers are ms;
+    percentages may omit the '%', so 'loss 20' is 'loss 20%'):
+        loss [random] P% | loss gemodel P% [R% [1-H% [1-K%]]]
+        delay TIME [JITTER [CORRELATION]] [distribution uniform|normal|pareto|paretonormal]
+        reorder P%    duplicate P%    seed N
+
+USE CASES:
+    - Reproducible loss, latency and jitter scenarios without root or tc
+    - Bursty loss testing with the Gilbert-Elliott model
+    - Exercising client sequence matching with reordered and duplicated replies
+"""
+
+import os
+import random
+import socket
+import time
+
+ENVIRONMENT_VARIABLE = "PING_IMPAIRMENT"
+DISTRIBUTIONS = ("uniform", "normal", "pareto", "paretonormal")
+
+
+class BernoulliLoss:
+    """
+    Drop every packet independently with probability p.
+    """
+
+    def __init__(self, p):
+        self.p = p
+
+    def drop(self, rng):
+        return rng.random() < self.p
+
+    def fork(self):
+        return BernoulliLoss(self.p)
+
+
+class GilbertElliottLoss:
+    """
+    Two-state bursty loss model (the 'gemodel' of tc-netem).
+
+    Argument : probability of moving from the good to the bad state (p), of
+               moving back (r), loss probability in the bad state (1-h) and
+               in the good state (1-k)
+    """
+
+    def __init__(self, p, r=None, bad_loss=1.0, good_loss=0.0):
+        self.p = p
+        self.r = 1.0 - p if r is None else r
+        self.bad_loss = bad_loss
+        self.good_loss = good_loss
+        self.bad = False
+
+    def drop(self, rng):
+        if self.bad:
+            if rng.random() < self.r:
+                self.bad = False
+        elif rng.random() < self.p:
+            self.bad = True
+        return rng.random() < (self.bad_loss if self.bad else self.good_loss)
+
+    def fork(self):
+        return GilbertElliottLoss(self.p, self.r, self.bad_loss, self.good_loss)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel holding items until their deadline.
+
+    Scheduling is O(1); each expire() only visits the slots of the ticks that
+    passed since the previous call. Deadlines further away than one turn of the
+    wheel stay in their slot and are skipped until their turn comes.
+
+    Argument : tick length in seconds, number of slots and the current time
+    """
+
+    def __init__(self, tick=0.001, slots=4096, now=None):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.current = int((time.monotonic() if now is None else now) / tick)
+        self.pending = 0
+
+    def schedule(self, deadline, item):
+        """
+        Add an item that becomes due at deadline (time.monotonic() scale).
+        """
+        expiry = max(-int(-deadline // self.tick), self.current + 1)  # Never early
+        self.slots[expiry % len(self.slots)].append((expiry, item))
+        self.pending += 1
+
+    def expire(self, now):
+        """
+        Remove and return the items that are due, in deadline order per tick.
+
+        Argument : current time (time.monotonic() scale)
+
+        Output : list of items
+        """
+        target = int(now / self.tick)
+        due = []
+        if self.pending and target > self.current:
+            count = len(self.slots)
+            if target - self.current >= count:
+                ticks = range(count)  # A whole turn passed; visit every slot once
+            else:
+                ticks = range(self.current + 1, target + 1)
+            for tick in ticks:
+                slot = self.slots[tick % count]
+                if not slot:
+                    continue
+                keep = [entry for entry in slot if entry[0] > target]
+                if len(keep) < len(slot):
+                    due.extend(item for expiry, item in slot if expiry <= target)
+                    slot[:] = keep
+            self.pending -= len(due)
+        self.current = max(self.current, target)
+        return due
+
+    def next_timeout(self, now):
+        """
+        Seconds until the wheel needs to be expired again.
+
+        Output : time to the next tick, or None when nothing is pending
+        """
+        if not self.pending:
+            return None
+        return max((self.current + 1) * self.tick - now, 0.0)
+
+
+def _percent(value):
+    # Like tc-netem, '20' and '20%' both mean a probability of 0.2
+    try:
+        p = float(value.strip().rstrip("%")) / 100
+    except ValueError:
+        raise ValueError(f"{value!r} is not a percentage") from None
+    if not 0.0 <= p <= 1.0:
+        raise ValueError(f"{value!r} is not between 0% and 100%")
+    return p
+
+
+def _seconds(value):
+    value = value.strip().lower()
+    for suffix, scale in (("us", 1e-6), ("ms", 1e-3), ("s", 1.0)):
+        if value.endswith(suffix):
+            return float(value[:-len(suffix)]) * scale
+    return float(value) * 1e-3
+
+
+class Impairment:
+    """
+    Decide what happens to each reply a server sends: drop, delay, reorder, duplicate.
+
+    Argument : loss model (BernoulliLoss, GilbertElliottLoss or None), delay
+               and jitter in seconds, jitter distribution, reorder and duplicate
+               probabilities and the random seed (None = unseeded)
+    """
+
+    def __init__(self, loss=None, delay=0.0, jitter=0.0, distribution="uniform",
+                 reorder=0.0, duplicate=0.0, seed=None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown delay distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.distribution = distribution
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.wheel = TimerWheel()
+        self.dropped = 0
+        self.delayed = 0
+        self.reordered = 0
+        self.duplicated = 0
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Build an Impairment from a tc-netem style string.
+
+        Argument : spec such as 'delay 10ms 2ms loss 1%' ('' = no impairment)
+
+        Output : Impairment
+        """
+        tokens = spec.replace(",", " ").split()
+        options = {}
+        i = 0
+
+        def values(convert, limit):
+            # Up to limit values that convert() accepts, starting at tokens[i]
+            found = []
+            for token in tokens[i:i + limit]:
+                try:
+                    found.append(convert(token))
+                except ValueError:
+                    if not found or token[:1].isdigit():
+                        raise  # A keyword ends the values; a bad number is an error
+                    break
+            if not found:
+                raise ValueError(f"{keyword!r} needs a value")
+            return found
+
+        try:
+            while i < len(tokens):
+                keyword = tokens[i].lower()
+                i += 1
+                if keyword == "loss":
+                    model = "random"
+                    if i < len(tokens) and tokens[i].lower() in ("random", "gemodel"):
+                        model = tokens[i].lower()
+                        i += 1
+                    found = values(_percent, 4 if model == "gemodel" else 1)
+                    i += len(found)
+                    if model == "gemodel":
+                        # Missing values default like tc-netem: r = 1 - p, 1-h = 100%, 1-k = 0%
+                        options["loss"] = GilbertElliottLoss(*(found + [None, 1.0, 0.0][len(found) - 1:]))
+                    else:
+                        options["loss"] = BernoulliLoss(found[0])
+                elif keyword == "delay":
+                    found = values(_seconds, 2)
+                    i += len(found)
+                    options["delay"] = found[0]
+                    if len(found) > 1:
+                        options["jitter"] = found[1]
+                        if i < len(tokens) and tokens[i].endswith("%"):
+                            i += 1  # Correlation is accepted and ignored
+                elif keyword == "distribution":
+                    options["distribution"] = tokens[i].lower()
+                    i += 1
+                elif keyword in ("reorder", "duplicate"):
+                    found = values(_percent, 2)  # A correlation value is ignored
+                    i += len(found)
+                    options[keyword] = found[0]
+                elif keyword == "seed":
+                    options["seed"] = int(tokens[i])
+                    i += 1
+                else:
+                    raise ValueError(f"unknown keyword {keyword!r}")
+        except (IndexError, ValueError) as e:
+            raise ValueError(f"Invalid impairment spec {spec!r}: {e}") from None
+        return cls(**options)
+
+    def fork(self, index):
+        """
+        Copy the configuration for another connection or worker process.
+
+        The copy has its own loss state, timer wheel and counters; a seeded
+        impairment gives every index its own reproducible random sequence.
+
+        Argument : connection or worker number
+
+        Output : Impairment
+        """
+        return Impairment(self.loss.fork() if self.loss else None, self.delay, self.jitter,
+                          self.distribution, self.reorder, self.duplicate,
+                          None if self.seed is None else self.seed * 1000003 + index)
+
+    def _sample_delay(self):
+        if not self.jitter:
+            return self.delay
+        if self.distribution == "uniform":
+            value = self.delay + self.rng.uniform(-self.jitter, self.jitter)
+        elif self.distribution == "normal":
+            value = self.rng.gauss(self.delay, self.jitter)
+        else:
+            # Pareto with alpha 3 has mean 1.5; shift it so the mean stays at delay
+            value = self.delay + self.jitter * (self.rng.paretovariate(3.0) - 1.5)
+            if self.distribution == "paretonormal":
+                value = 0.75 * value + 0.25 * self.rng.gauss(self.delay, self.jitter)
+        return max(value, 0.0)
+
+    def apply(self, payload, destination=None, now=None):
+        """
+        Decide the fate of one reply.
+
+        Delayed copies are copied onto the timer wheel and come back from due().
+
+        Argument : reply payload, where it goes (passed back by due()) and the
+                   current time.monotonic()
+
+        Output : number of copies to send right away (0, 1 or 2)
+        """
+        if self.loss is not None and self.loss.drop(self.rng):
+            self.dropped += 1
+            return 0
+        copies = 1
+        if self.duplicate and self.rng.random() < self.duplicate:
+            self.duplicated += 1
+            copies = 2
+        if not self.delay and not self.jitter:
+            return copies
+        if self.reorder and self.rng.random() < self.reorder:
+            self.reordered += 1
+            return copies  # Overtakes the delayed replies, like tc-netem
+        now = time.monotonic() if now is None else now
+        data = bytes(payload)
+        for _ in range(copies):
+            self.wheel.schedule(now + self._sample_delay(), (data, destination))
+        self.delayed += copies
+        return 0
+
+    def due(self, now=None):
+        """
+        Take the delayed replies whose time has come.
+
+        Output : list of (payload, destination) tuples
+        """
+        return self.wheel.expire(time.monotonic() if now is None else now)
+
+    def next_timeout(self, now=None):
+        """
+        How long a server may block before calling due() again.
+
+        Output : seconds, or None when no reply is waiting
+        """
+        return self.wheel.next_timeout(time.monotonic() if now is None else now)
+
+    def recv(self, sock, receive):
+        """
+        Run a receive on a blocking connected socket while sending the delayed
+        replies that fall due in the meantime.
+
+        The replies must have been passed to apply() with their TCP socket as
+        destination; replies for sockets closed since then are discarded.
+
+        Argument : connected socket and a function performing the receive
+
+        Output : whatever receive() returns
+        """
+        try:
+            while True:
+                sock.settimeout(self.next_timeout())  # None blocks until data arrives
+                try:
+                    return receive()
+                except (socket.timeout, BlockingIOError):
+                    pass  # A zero timeout makes the socket non-blocking
+                finally:
+                    for data, destination in self.due():
+                        if destination.fileno() != -1:
+                            destination.sendall(data)
+        finally:
+            sock.settimeout(None)
+
+    def describe(self):
+        """
+        Summarize what the impairment did so far.
+
+        Output : one-line string
+        """
+        return (f"Impaired: Dropped = {self.dropped}, Delayed = {self.delayed}, "
+                f"Reordered = {self.reordered}, Duplicated = {self.duplicated}, "
+                f"Pending = {self.wheel.pending}")
+
+
+def load_impairment(spec=""):
+    """
+    Build the impairment for a server, letting PING_IMPAIRMENT override its setting.
+
+    Argument : the server's default spec
+
+    Output : Impairment
+    """
+    return Impairment.parse(os.environ.get(ENVIRONMENT_VARIABLE, spec))
+
+
+if __name__ == "__main__":
+    # Self-check: both percentage spellings parse alike and bad values are refused
+    for bare, percent in (("loss 20", "loss 20%"), ("loss gemodel 1 30 90 5", "loss gemodel 1% 30% 90% 5%"),
+                          ("reorder 10 duplicate 2.5", "reorder 10% duplicate 2.5%")):
+        a, b = Impairment.parse(bare), Impairment.parse(percent)
+        assert (vars(a.loss) if a.loss else None) == (vars(b.loss) if b.loss else None), (bare, percent)
+        assert (a.reorder, a.duplicate) == (b.reorder, b.duplicate), (bare, percent)
+    assert Impairment.parse("loss 20").loss.p == 0.2
+    assert Impairment.parse("loss gemodel 1% 30%").loss.r == 0.3
+    for bad in ("loss 150%", "loss 120", "loss -1", "loss gemodel 1% 130%", "duplicate 101", "loss x%", "loss"):
+        try:
+            Impairment.parse(bad)
+        except ValueError as e:
+            print(e)
+        else:
+            raise AssertionError(f"{bad!r} was accepted")
+    print("Percentages with and without '%' parse alike; values outside 0-100% are rejected")
@@ -0,0 +1,117 @@
+"""
+Network Diagnostics: Internet Checksum
+
+PROBLEM STATEMENT:
+    Every ICMP packet the pingers build carries an Internet checksum. The pingers
+    had two slightly different pure-Python loops that walk the buffer a byte at
+    a time, and at high probe rates those loops dominate the profile.
+
+DESCRIPTION:
+    This module provides one shared checksum implementation that:
+    - Computes the RFC 1071 checksum over whole 16-bit words at once
+    - Uses the identity 2**16 == 1 (mod 0xFFFF) so a single int.from_bytes()
+      and a modulo replace the per-word loop and carry folding
+    - Returns the value in the convention of the original ICMP pinger, i.e. the
+      checksum as read in network byte order
+    - Re-sums the whole packet when the sequence number or timestamp changes:
+      for the 16-byte echo requests one int.from_bytes() is cheaper in Python
+      than an incremental update (RFC 1624), and no pinger sends large packets
+      in which only such a field changes
+    - Verifies itself against the original byte loops and benchmarks them when
+      run as a script
+
+USE CASES:
+    - Building ICMP echo requests and error messages
+    - Filling in the checksums of cached ICMP error templates
+"""
+
+import os
+import struct
+import timeit
+
+
+def _ones_sum(data):
+    """
+    One's complement sum of the 16-bit big-endian words of data.
+
+    Argument : bytes-like object (an odd trailing byte is padded with zero)
+
+    Output : folded 16-bit sum, 0 only when every word is zero
+    """
+    if len(data) & 1:
+        data = bytes(data) + b"\x00"
+    value = int.from_bytes(data, "big")
+    total = value % 0xFFFF
+    if total == 0 and value:
+        total = 0xFFFF  # One's complement "negative zero"
+    return total
+
+
+def checksum(data):
+    """
+    Calculate the Internet checksum of a packet.
+
+    Argument : packet bytes with the checksum field set to zero
+
+    Output : 16-bit checksum in network byte order, ready for struct.pack("!H")
+    """
+    return ~_ones_sum(data) & 0xFFFF
+
+
+def _legacy_icmp_checksum(string):
+    # Byte loop previously in icmp_ping/icmp_network_pinger.py, kept as the reference
+    csum = 0
+    countTo = (len(string) // 2) * 2
+    count = 0
+    while count < countTo:
+        thisVal = string[count+1] * 256 + string[count]
+        csum = csum + thisVal
+        csum = csum & 0xffffffff
+        count = count + 2
+    if countTo < len(string):
+        csum = csum + string[len(string) - 1]
+        csum = csum & 0xffffffff
+    csum = (csum >> 16) + (csum & 0xffff)
+    csum = csum + (csum >> 16)
+    answer = ~csum
+    answer = answer & 0xffff
+    answer = answer >> 8 | (answer << 8 & 0xff00)
+    return answer
+
+
+def _legacy_tcp_checksum(data):
+    # Byte loop previously in tcp_ping/tcp_pinger_server_icmp_error.py, kept as the reference
+    s = 0
+    for i in range(0, len(data), 2):
+        w = (data[i] << 8) + (data[i+1] if i+1 < len(data) else 0)
+        s = s + w
+    s = (s >> 16) + (s & 0xffff)
+    s = ~s & 0xffff
+    return s
+
+
+if __name__ == "__main__":
+    # Byte-identical results against the original ICMP pinger loop
+    samples = [b"", b"\x00", b"\xff", b"\x00" * 8, b"\xff" * 8, b"\xff\xff", b"\x01\x02\x03"]
+    samples += [os.urandom(n) for n in range(1, 200) for _ in range(20)]
+    samples += [os.urandom(1500) for _ in range(100)]
+    for data in samples:
+        assert checksum(data) == _legacy_icmp_checksum(data), data
+    print(f"checksum() matches the ICMP pinger loop on {len(samples)} buffers")
+
+    # The TCP server loop folds only once, so it agrees on the ICMP error
+    # headers it is used for (type and code set, everything else zero)
+    for icmp_type in range(256):
+        for code in range(16):
+            header = struct.pack("!BBHHH", icmp_type, code, 0, 0, 0)
+            assert checksum(header) == _legacy_tcp_checksum(header), header
+    print("checksum() matches the TCP server loop on every ICMP error header")
+
+    # Micro-benchmark
+    echo = struct.pack("!BBHHHd", 8, 0, 0, 0x1234, 1, 1.0)
+    large = os.urandom(1472)
+    for name, data in (("16-byte echo request", echo), ("1472-byte payload", large)):
+        runs = 20000 if len(data) < 100 else 2000
+        old = timeit.timeit(lambda: _legacy_icmp_checksum(data), number=runs) / runs
+        new = timeit.timeit(lambda: checksum(data), number=runs) / runs
+        print(f"{name}: byte loop {old * 1e6:.2f} us, word sum {new * 1e6:.2f} us ({old / new:.1f}x)")
@@ -0,0 +1,231 @@
+"""
+Network Diagnostics: Buffered Structured Output Sink
+
+PROBLEM STATEMENT:
+    Every client and server prints one or more lines per packet. At high rates
+    terminal I/O becomes the bottleneck, and because the clients print inside
+    the timed region, the prints even distort the RTTs they report.
+
+DESCRIPTION:
+    This module implements an output subsystem for the pingers that:
+    - Takes per-packet records as (kind, template, fields) and only appends them
+      to a queue; nothing is formatted, written or flushed on the send/receive path
+    - Formats and writes the records from a background thread in large buffered
+      writes, a few times per second
+    - Describes payload fields (bytes) with probe_format.describe() on that thread
+    - Supports these modes, chosen per script or with PING_OUTPUT:
+        text                the original per-packet lines (default)
+        quiet               no per-packet lines and no statistics
+        summary             the final statistics only
+        interval[=SECONDS]  one line per interval: counts per record kind and RTTs
+        jsonl[=PATH]        one JSON object per record and per summary, on stdout or in PATH
+    - Lets the script flush() at round boundaries so its own prints stay in order
+
+USE CASES:
+    - Flood and high-rate runs without terminal I/O in the measurement
+    - Machine-readable results for scripts and dashboards (JSON Lines)
+    - Long-running sessions with a compact progress line
+"""
+
+import atexit
+import collections
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+from ping_common.probe_format import describe
+from ping_common.rtt_stats import PERCENTILES
+
+OUTPUT_VARIABLE = "PING_OUTPUT"
+OUTPUT_MODES = ("text", "quiet", "summary", "interval", "jsonl")
+FLUSH_INTERVAL = 0.1  # Seconds between background writes
+DEFAULT_INTERVAL = 1.0  # Seconds per line in interval mode
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+def _text(value):
+    # Payloads are described like the scripts always printed them
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return describe(value)
+    return value
+
+
+def _json(value):
+    # Addresses become "ip:port"
+    value = _text(value)
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], str):
+        return f"{value[0]}:{value[1]}"
+    return value
+
+
+class OutputSink:
+    """
+    Queue per-packet records and write them from a background thread.
+
+    Argument : output mode (see OUTPUT_MODES), seconds per line in interval
+               mode and the file for jsonl mode (None = stdout)
+    """
+
+    def __init__(self, mode="text", interval=DEFAULT_INTERVAL, path=None):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode {mode!r}, expected one of {OUTPUT_MODES}")
+        self.mode = mode
+        self.interval = interval
+        self.stream = open(path, "a", buffering=WRITE_BUFFER_SIZE) if path else sys.stdout
+        self._records = collections.deque()
+        self._lock = threading.Lock()  # Held while formatting and writing
+        self._stop = threading.Event()
+        self._window = None  # Interval mode: counts per kind and RTTs of the current line
+        self._window_start = time.time()
+        self._thread = None
+        if mode in ("quiet", "summary"):
+            self.record = _nothing
+            return
+        self._thread = threading.Thread(target=self._run, name="output-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, kind, template, **fields):
+        """
+        Queue one record, e.g. record("received", "Received {reply}", seq=3, reply=data).
+
+        Argument : record kind ('sent', 'received', 'lost', ...), str.format
+                   template of its text line and its fields; bytes fields are
+                   payloads and must not change afterwards
+        """
+        self._records.append((time.time(), kind, template, fields))
+
+    def _format(self, records):
+        if self.mode == "text":
+            return "".join(template.format(**{k: _text(v) for k, v in fields.items()}) + "\n"
+                           for _, _, template, fields in records)
+        if self.mode == "jsonl":
+            return "".join(json.dumps({"time": round(stamp, 6), "event": kind,
+                                       **{k: _json(v) for k, v in fields.items()}}) + "\n"
+                           for stamp, kind, _, fields in records)
+        # interval: accumulate; lines are produced by _interval_line()
+        window = self._window
+        if window is None:
+            window = self._window = [collections.Counter(), 0, 0.0, math.inf, 0.0]
+        counts = window[0]
+        for _, kind, _, fields in records:
+            counts[kind] += 1
+            rtt = fields.get("rtt_ms")
+            if rtt is not None:
+                window[1] += 1
+                window[2] += rtt
+                window[3] = min(window[3], rtt)
+                window[4] = max(window[4], rtt)
+        return ""
+
+    def _interval_line(self, now):
+        window, self._window = self._window, None
+        elapsed = now - self._window_start
+        self._window_start = now
+        line = f"[{time.strftime('%H:%M:%S', time.localtime(now))}] {elapsed:.1f} s:"
+        if window is None:
+            return line + " no packets\n"
+        counts, rtts, total, low, high = window
+        line += "".join(f" {kind} = {count}," for kind, count in counts.items()).rstrip(",")
+        if rtts:
+            line += f"; RTT min/avg/max = {low:.2f}/{total / rtts:.2f}/{high:.2f} ms"
+        return line + "\n"
+
+    def _drain(self, final=False):
+        with self._lock:
+            records = []
+            while self._records:
+                records.append(self._records.popleft())
+            text = self._format(records) if records else ""
+            now = time.time()
+            if self.mode == "interval" and (now - self._window_start >= self.interval
+                                            or (final and self._window is not None)):
+                text += self._interval_line(now)
+            if text:
+                self.stream.write(text)
+                self.stream.flush()
+
+    def _run(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self._drain()
+
+    def flush(self):
+        """
+        Write every queued record now, e.g. before the script prints on its own.
+        """
+        if self._thread is not None:
+            self._drain(final=True)
+
+    def message(self, text):
+        """
+        Write a line outside the per-packet records (not in quiet mode).
+        """
+        self.flush()
+        if self.mode == "quiet":
+            return
+        if self.mode == "jsonl":
+            if not text.strip():
+                return
+            text = json.dumps({"time": round(time.time(), 6), "event": "message", "text": text.strip()})
+        with self._lock:
+            self.stream.write(text + "\n")
+            self.stream.flush()
+
+    def summary(self, stats, title=None, footer=None):
+        """
+        Write final statistics: stats.report(title) and an optional footer line,
+        or one 'summary' object in jsonl mode. Nothing in quiet mode.
+
+        Argument : RttStats, heading and footer (e.g. the clock source)
+        """
+        if self.mode != "jsonl":
+            self.message(stats.report(title) + ("\n" + footer if footer else ""))
+            return
+        self.flush()
+        summary = {"time": round(time.time(), 6), "event": "summary", "title": title,
+                   "sent": stats.sent, "received": stats.count, "lost": stats.lost,
+                   "loss_percent": round(stats.loss_rate, 3)}
+        if stats.count:
+            summary.update(min_ms=stats.minimum, max_ms=stats.maximum, avg_ms=stats.mean, stddev_ms=stats.stddev)
+            summary.update((f"p{p:g}_ms", stats.percentile(p)) for p in PERCENTILES)
+        if footer:
+            summary["note"] = footer.strip()
+        with self._lock:
+            self.stream.write(json.dumps(summary) + "\n")
+            self.stream.flush()
+
+    def close(self):
+        """
+        Stop the background thread after writing everything queued.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._drain(final=True)
+
+
+def _nothing(*args, **fields):
+    pass
+
+
+def load_output_sink(spec="text"):
+    """
+    Build the output sink for a script, letting PING_OUTPUT override its setting.
+
+    Argument : mode, optionally with a parameter: 'interval=5' (seconds) or
+               'jsonl=results.jsonl' (file)
+
+    Output : OutputSink
+    """
+    spec = os.environ.get(OUTPUT_VARIABLE, spec) or "text"
+    mode, _, parameter = spec.partition("=")
+    mode = mode.strip().lower()
+    if mode == "interval":
+        return OutputSink(mode, float(parameter) if parameter else DEFAULT_INTERVAL)
+    if mode == "jsonl":
+        return OutputSink(mode, path=parameter.strip() or None)
+    return OutputSink(mode)
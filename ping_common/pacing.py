@@ -0,0 +1,221 @@
+"""
+Network Diagnostics: Paced Probe Scheduler
+
+PROBLEM STATEMENT:
+    The ICMP pinger sleeps one second after each probe completes, so the real
+    interval is one second plus the RTT (or the timeout) and the schedule drifts
+    further with every probe. The UDP and TCP clients send back to back with no
+    pacing at all. Neither gives the exact, reproducible probe rate an SLA
+    measurement needs.
+
+DESCRIPTION:
+    This module implements a pacing scheduler for the pingers that:
+    - Places every send on an absolute schedule (start + k * interval) on the
+      monotonic perf_counter_ns() clock, so time spent probing never shifts
+      later sends
+    - Sleeps until shortly before a deadline and spins for the last stretch,
+      which keeps intervals down to 100 us accurate despite the scheduler's
+      sleep granularity; the stretch grows with the sleep overshoot measured
+      on the host (SPIN_THRESHOLD up to MAX_SPIN)
+    - Moves the schedule forward by whole intervals instead of sending a burst
+      when a send is more than an interval late, and counts the skipped slots
+    - Limits the aggregate rate with a token bucket (rate and burst), on its own
+      or on top of the interval
+    - Records how late each send was against its deadline (log-linear
+      histogram) and reports p50, p99 and maximum, the late sends and the
+      achieved rate
+    - Is configured per script or with PING_INTERVAL (e.g. '1s', '10ms', '100us')
+      and PING_RATE (probes per second)
+
+USE CASES:
+    - Exact, reproducible probe rates for SLA measurements
+    - Sub-millisecond probe intervals without drift
+    - Capping the probe rate of a run against production hosts
+"""
+
+import os
+import re
+import time
+
+from ping_common.probe_timing import StageHistogram
+
+INTERVAL_VARIABLE = "PING_INTERVAL"
+RATE_VARIABLE = "PING_RATE"
+SPIN_THRESHOLD = 200_000  # Nanoseconds before a deadline spent spinning instead of sleeping
+MAX_SPIN = 2_000_000  # Upper limit of the spin stretch when sleeps overshoot, ns
+LATE_THRESHOLD = 100_000  # Sends later than this many ns are reported as late
+
+_duration = re.compile(r"^(\d+(?:\.\d+)?)\s*(us|ms|s)?$")
+_units = {"us": 1e-6, "ms": 1e-3, "s": 1.0, None: 1.0}
+
+
+def parse_interval(text):
+    """
+    Seconds in an interval like '1', '0.5s', '10ms' or '100us'.
+    """
+    match = _duration.match(str(text).strip().lower())
+    if match is None:
+        raise ValueError(f"invalid interval {text!r}")
+    return float(match.group(1)) * _units[match.group(2)]
+
+
+class TokenBucket:
+    """
+    Token bucket limiting an aggregate rate.
+
+    Argument : tokens (probes) per second and the bucket size, i.e. the
+               largest burst sent back to back
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.cost = int(1e9 / rate)  # Nanoseconds to earn one token
+        self.tokens = self.burst * self.cost  # Stored as nanoseconds of credit
+        self.updated = time.perf_counter_ns()
+
+    def _refill(self, now):
+        self.tokens = min(self.tokens + now - self.updated, self.burst * self.cost)
+        self.updated = now
+
+    def delay(self, now):
+        """
+        Nanoseconds until a token is available (0 = now).
+        """
+        self._refill(now)
+        return max(self.cost - self.tokens, 0)
+
+    def take(self, now):
+        """
+        Spend one token (the balance may go negative after a late send).
+        """
+        self._refill(now)
+        self.tokens -= self.cost
+
+
+def sleep_until(deadline, spin=SPIN_THRESHOLD):
+    """
+    Wait for a perf_counter_ns() deadline: sleep, then spin the last stretch.
+
+    Argument : deadline in ns and the stretch before it that is spun
+
+    Output : (perf_counter_ns() when the wait ended, ns the sleep overshot its
+             wake-up time)
+    """
+    now = time.perf_counter_ns()
+    overshoot = 0
+    if deadline - now > spin:
+        wake = deadline - spin
+        time.sleep((wake - now) / 1e9)
+        now = time.perf_counter_ns()
+        overshoot = max(now - wake, 0)
+    while now < deadline:
+        now = time.perf_counter_ns()
+    return now, overshoot
+
+
+class Pacer:
+    """
+    Pace sends on an absolute schedule and/or an aggregate rate.
+
+    Call wait() right before every send. Without an interval and a rate the
+    pacer is disabled and wait() does nothing.
+
+    Argument : seconds between sends (0 = no schedule), aggregate sends per
+               second (0 = no limit), token bucket burst and spin threshold in ns
+    """
+
+    def __init__(self, interval=0.0, rate=0.0, burst=1, spin=SPIN_THRESHOLD):
+        self.interval = int(interval * 1e9)  # ns
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.spin = spin
+        self.enabled = bool(self.interval or self.bucket)
+        self.deviation = StageHistogram()  # Lateness of each send against its deadline, ns
+        self.sends = 0
+        self.late = 0
+        self.skipped = 0  # Slots given up after falling more than an interval behind
+        self.origin = None
+        self.slot = 0
+        self.first = self.last = None
+        if not self.enabled:
+            self.wait = _nothing
+
+    def wait(self):
+        """
+        Wait until the next send is due.
+
+        Output : perf_counter_ns() at the end of the wait
+        """
+        now = time.perf_counter_ns()
+        if self.origin is None:
+            self.origin = now
+        deadline = now
+        if self.interval:
+            deadline = self.origin + self.slot * self.interval
+            behind = (now - deadline) // self.interval
+            if behind >= 1:
+                # Stay on the grid rather than bursting to catch up
+                self.slot += behind
+                self.skipped += behind
+                deadline += behind * self.interval
+            self.slot += 1
+        if self.bucket is not None:
+            deadline = max(deadline, now + self.bucket.delay(now))
+        if deadline > now:
+            now, overshoot = sleep_until(deadline, self.spin)
+            # Spin through the host's typical sleep overshoot, decaying back slowly
+            self.spin = min(max(self.spin - (self.spin >> 6), SPIN_THRESHOLD, overshoot + (overshoot >> 1)),
+                            MAX_SPIN)
+        if self.bucket is not None:
+            self.bucket.take(now)
+        lateness = now - deadline
+        self.deviation.add(lateness)
+        if lateness > LATE_THRESHOLD:
+            self.late += 1
+        self.sends += 1
+        if self.first is None:
+            self.first = now
+        self.last = now
+        return now
+
+    def report(self, title="Pacing:"):
+        """
+        Format the schedule and the deviation of the actual send times from it.
+
+        Output : multi-line string
+        """
+        schedule = []
+        if self.interval:
+            schedule.append(f"interval = {self.interval / 1e6:g} ms")
+        if self.bucket is not None:
+            schedule.append(f"rate = {self.bucket.rate:g}/s, burst = {self.bucket.burst}")
+        lines = [title, f"     Sends: {self.sends} ({', '.join(schedule) or 'unpaced'})"]
+        if self.sends > 1:
+            achieved = (self.sends - 1) / ((self.last - self.first) / 1e9) if self.last > self.first else 0
+            lines.append(f"     Achieved rate: {achieved:.1f}/s, late (> {LATE_THRESHOLD / 1e3:g} us): "
+                         f"{self.late}, skipped slots: {self.skipped}")
+        if self.deviation.count:
+            lines.append("     Deviation from schedule: mean = {:.1f} us, p50 = {:.1f} us, p99 = {:.1f} us, "
+                         "max = {:.1f} us".format(self.deviation.total / self.deviation.count / 1e3,
+                                                  self.deviation.percentile(50) / 1e3,
+                                                  self.deviation.percentile(99) / 1e3,
+                                                  self.deviation.maximum / 1e3))
+        return "\n".join(lines)
+
+
+def _nothing(*args):
+    return time.perf_counter_ns()
+
+
+def load_pacer(interval=0.0, rate=0.0, burst=1):
+    """
+    Build the pacer for a pinger, letting PING_INTERVAL and PING_RATE override its settings.
+
+    Argument : the pinger's default interval in seconds (0 = none), aggregate
+               rate in probes per second (0 = unlimited) and burst size
+
+    Output : Pacer
+    """
+    interval = parse_interval(os.environ.get(INTERVAL_VARIABLE, interval) or 0)
+    rate = float(os.environ.get(RATE_VARIABLE, rate) or 0)
+    return Pacer(interval, rate, burst)
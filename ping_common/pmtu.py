@@ -0,0 +1,455 @@
+"""
+Network Diagnostics: Path MTU Discovery with Concurrent DF Probes
+
+PROBLEM STATEMENT:
+    Every probe carries a tiny payload (an 8-byte timestamp for ICMP, a short
+    text or a 16-byte header for UDP), and fragmentation is allowed. The
+    pingers therefore never see an MTU blackhole: a path where large packets
+    vanish without the Fragmentation Needed error that should announce it,
+    which stalls large-payload traffic while small pings look perfectly healthy.
+
+DESCRIPTION:
+    This module finds the path MTU to a target:
+    - Sets the Don't Fragment bit on the probe socket (IP_MTU_DISCOVER =
+      IP_PMTUDISC_DO) and starts from the route MTU the kernel knows (IP_MTU)
+    - Sends PROBES_PER_ROUND packet sizes at once and narrows the range between
+      the largest size answered and the smallest size refused by that factor
+      per round: from 68..1500 in about 3 rounds (fewer sizes per round when
+      they are large, so that a round stays within ROUND_BYTES)
+    - Waits for the answers of a round only as long as the RTO of the replies
+      so far (RFC 6298, ping_common.adaptive_timeout), since sizes that are
+      too big for a blackhole never answer
+    - Interprets Fragmentation Needed (ICMP type 3, code 4) with its next-hop
+      MTU, and EMSGSIZE from send() or from the socket error queue, by moving
+      the upper bound straight to the reported MTU
+    - Retries a size once when neither a reply nor an error came back, then
+      treats it as too big, and reports an MTU blackhole when the limit was
+      only found that way
+    - Caches the MTU per target in a JSON file for CACHE_TTL seconds, so repeat
+      runs do not search again (PING_PMTU_CACHE sets the file, '' disables it)
+    - Probes with ICMP echo requests (raw socket, root) or with binary UDP
+      probes to an echo server (no root)
+
+    Command:
+        python3 -m ping_common.pmtu TARGET ... [--refresh] [--timeout S] [--probes N]
+        TARGET is udp:HOST[:PORT] or icmp:HOST, as for the shard scheduler
+
+USE CASES:
+    - Detecting MTU blackholes that only hurt large-payload traffic
+    - Checking tunnels, VPNs and jumbo frame paths end to end
+    - Knowing the largest probe size that crosses a path unfragmented
+"""
+
+import argparse
+import collections
+import errno
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import time
+
+from ping_common import icmp_errqueue
+from ping_common.adaptive_timeout import ProbeTimeout
+from ping_common.inet_checksum import checksum
+from ping_common.probe_format import pack_probe, parse_probe
+from ping_common.resolver import shared_resolver
+from ping_common.shard_scheduler import parse_target
+
+# Linux values; Python does not export all of them
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+
+PMTU_VARIABLE = "PING_PMTU"
+CACHE_VARIABLE = "PING_PMTU_CACHE"
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "network-diagnostics", "pmtu.json")
+CACHE_TTL = 600.0  # Seconds a discovered MTU is reused (RFC 1191 retries larger MTUs after 10 minutes)
+MIN_MTU = 68  # Smallest MTU every IPv4 link supports (RFC 791)
+MAX_MTU = 65535
+HEADER_SIZE = 28  # IPv4 header and ICMP echo or UDP header
+PROBES_PER_ROUND = 8
+MAX_ROUNDS = 16
+TIMEOUT = 1.0  # Seconds to wait for the answers of a round
+RECEIVE_BUFFER = 4 << 20  # Bytes; a round of large probes and their echoes must fit
+ROUND_BYTES = 128 << 10  # Bytes in flight per round; fits the default 208 KiB receive buffer
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACHABLE = 3
+ICMP_FRAGMENTATION_NEEDED = 4
+
+_icmp_header = struct.Struct("!BBHHH")
+
+# Outcome of a discovery; mtu is None when not even the smallest size got through
+PmtuResult = collections.namedtuple("PmtuResult", "target mtu blackhole rounds probes age")
+
+
+class PmtuSearch:
+    """
+    The range of possible path MTUs, narrowed by every round of probes.
+
+    Argument : largest MTU possible, normally the route MTU
+    """
+
+    def __init__(self, upper):
+        self.low = MIN_MTU - 1  # Largest size answered
+        self.high = min(upper, MAX_MTU) + 1  # Smallest size refused
+        self.silentHigh = False  # The upper bound was only found by silence
+        self.suspects = set()  # Sizes that got no answer once
+        self.retries = []
+        self.rounds = 0
+        self.probes = 0
+
+    @property
+    def done(self):
+        return self.high - self.low <= 1
+
+    @property
+    def mtu(self):
+        return self.low if self.low >= MIN_MTU else None
+
+    def sizes(self, count=PROBES_PER_ROUND):
+        """
+        Sizes to probe next: spread evenly over the open range, its top included.
+        """
+        span = self.high - 1 - self.low
+        count = min(count, span)
+        sizes = {self.low + max(1, span * j // count) for j in range(1, count + 1)}
+        sizes.update(size for size in self.retries if self.low < size < self.high)
+        self.retries = []
+        return sorted(sizes)
+
+    def answered(self, size):
+        if size > self.low:
+            self.low = size
+            if self.high <= self.low:  # A refusal was really a loss
+                self.high = self.low + 1
+
+    def refused(self, size, mtu=0, silent=False):
+        """
+        Record a size that was too big, and the MTU the error reported (0 = unknown).
+        """
+        if mtu and self.low < mtu < size:
+            size = mtu + 1
+        if self.low < size < self.high:
+            self.high = size
+            self.silentHigh = silent
+
+    def unanswered(self, size):
+        """
+        Record a size that got neither a reply nor an error: retried once, then too big.
+        """
+        if size in self.suspects:
+            self.refused(size, silent=True)
+        else:
+            self.suspects.add(size)
+            self.retries.append(size)
+
+
+def route_mtu(address):
+    """
+    The MTU of the route to an address as the kernel knows it, including
+    what it learnt from earlier Fragmentation Needed errors.
+
+    Argument : IPv4 address
+
+    Output : MTU in bytes (MAX_MTU where IP_MTU is unsupported)
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect((address, 9))
+        return sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return MAX_MTU
+    finally:
+        sock.close()
+
+
+def set_dont_fragment(sock):
+    """
+    Send every datagram of a socket with DF set, failing with EMSGSIZE when it
+    is larger than the known path MTU.
+    """
+    sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+
+
+class _UdpProber:
+    # Binary probes padded to the packet size, answered by a UDP echo server
+    def __init__(self, address):
+        self.address = address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.connect(address)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        set_dont_fragment(self.socket)
+        icmp_errqueue.enable(self.socket)
+
+    def upper(self):
+        return self.socket.getsockopt(socket.IPPROTO_IP, IP_MTU)
+
+    def send(self, sequence, size):
+        self.socket.send(pack_probe(sequence, time.perf_counter_ns(), size - HEADER_SIZE))
+
+    def receive(self, timeout):
+        # Yields (sequence, None) for replies and (sequence, MTU) for refusals
+        if not select.select([self.socket], [], [], timeout)[0]:
+            return
+        while True:
+            error = icmp_errqueue.read_error(self.socket, 64)
+            if error is None:
+                break
+            probe = parse_probe(error.payload)
+            if error.errno == errno.EMSGSIZE:
+                if probe is not None:
+                    yield probe[0], error.info
+            elif error.origin == icmp_errqueue.SO_EE_ORIGIN_ICMP:
+                raise OSError(error.errno, icmp_errqueue.describe(error))
+        while True:
+            try:
+                reply = self.socket.recv(MAX_MTU, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return  # A queued error, read in the next call
+            probe = parse_probe(reply)
+            if probe is not None:
+                yield probe[0], None
+
+    def close(self):
+        self.socket.close()
+
+
+class _IcmpProber:
+    # ICMP echo requests padded to the packet size, over a raw socket
+    def __init__(self, address):
+        self.address = address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.getprotobyname("icmp"))
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        set_dont_fragment(self.socket)
+        self.icmpID = os.getpid() & 0xFFFF
+
+    def upper(self):
+        return route_mtu(self.address)
+
+    def send(self, sequence, size):
+        packet = _icmp_header.pack(ICMP_ECHO_REQUEST, 0, 0, self.icmpID, sequence & 0xFFFF) + bytes(size - HEADER_SIZE)
+        packet = packet[:2] + struct.pack("!H", checksum(packet)) + packet[4:]
+        self.socket.sendto(packet, (self.address, 0))
+
+    def receive(self, timeout):
+        if not select.select([self.socket], [], [], timeout)[0]:
+            return
+        while True:
+            try:
+                packet, addr = self.socket.recvfrom(MAX_MTU, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                return
+            ihl = (packet[0] & 0x0F) * 4
+            if len(packet) < ihl + _icmp_header.size:
+                continue
+            type, code, _, packetID, sequence = _icmp_header.unpack_from(packet, ihl)
+            if type == ICMP_ECHO_REPLY and packetID == self.icmpID and addr[0] == self.address:
+                yield sequence, None
+            elif type == ICMP_DEST_UNREACHABLE:
+                # The error quotes the IP header and first 8 bytes of our echo request
+                inner = ihl + 8
+                if len(packet) < inner + 20 or packet[inner + 9] != socket.IPPROTO_ICMP:
+                    continue
+                innerIhl = (packet[inner] & 0x0F) * 4
+                if len(packet) < inner + innerIhl + _icmp_header.size:
+                    continue
+                _, _, _, packetID, sequence = _icmp_header.unpack_from(packet, inner + innerIhl)
+                if packetID != self.icmpID:
+                    continue
+                if code != ICMP_FRAGMENTATION_NEEDED:
+                    raise OSError(errno.EHOSTUNREACH, f"Destination unreachable (code {code}) from {addr[0]}")
+                yield sequence, struct.unpack_from("!H", packet, ihl + 6)[0]  # Next-hop MTU
+
+    def close(self):
+        self.socket.close()
+
+
+def search(prober, timeout=TIMEOUT, probes=PROBES_PER_ROUND):
+    """
+    Find the path MTU with rounds of concurrent probes.
+
+    Argument : prober (_UdpProber or _IcmpProber), longest wait for the
+               answers of a round in seconds and sizes probed per round
+
+    Output : PmtuSearch with the result
+    """
+    state = PmtuSearch(prober.upper())
+    # Rounds wait for the RTO of the replies so far, not the full timeout,
+    # since the sizes that are too big never answer
+    wait = ProbeTimeout(adaptive=True, ceiling=timeout, initial=timeout)
+    sequence = 0
+    while not state.done and state.rounds < MAX_ROUNDS:
+        state.rounds += 1
+        pending = {}  # Sequence number -> (size, send time)
+        # Large sizes share the round's byte budget, so that a burst of them
+        # does not overflow the receive buffer of the echo server
+        count = max(2, min(probes, ROUND_BYTES // (state.high - 1)))
+        for size in state.sizes(count):
+            sequence = (sequence + 1) & 0xFFFF
+            try:
+                prober.send(sequence, size)
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE:
+                    raise
+                state.refused(size, prober.upper())  # Larger than the MTU the kernel knows
+                continue
+            pending[sequence] = (size, time.perf_counter_ns())
+            state.probes += 1
+        deadline = time.monotonic() + wait.timeout
+        while pending:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            for answered, mtu in prober.receive(left):
+                size, sent = pending.pop(answered, (None, 0))
+                if size is None:
+                    continue  # Late or duplicate
+                if mtu is None:
+                    wait.sample((time.perf_counter_ns() - sent) / 1e6)
+                    state.answered(size)
+                else:
+                    state.refused(size, mtu)
+        for size, _ in pending.values():
+            state.unanswered(size)
+    return state
+
+
+class PmtuCache:
+    """
+    Path MTUs per target, kept in a JSON file between runs.
+
+    Argument : file path ('' = no cache) and seconds an entry is valid
+    """
+
+    def __init__(self, path=DEFAULT_CACHE, ttl=CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}  # Target -> {"mtu", "blackhole", "time"}
+        if not path:
+            self.put = _nothing
+            return
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, target, now=None):
+        """
+        The cached entry of a target, or None if there is none or it expired.
+        """
+        entry = self.entries.get(target)
+        if entry is None or (now or time.time()) - entry["time"] >= self.ttl:
+            return None
+        return entry
+
+    def put(self, target, mtu, blackhole=False):
+        self.entries[target] = {"mtu": mtu, "blackhole": blackhole, "time": time.time()}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}"
+        with open(temporary, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)  # Concurrent runs never see a half-written file
+
+
+def _nothing(*args, **kwargs):
+    pass
+
+
+def load_pmtu_cache():
+    """
+    Open the MTU cache, letting PING_PMTU_CACHE override its path ('' disables it).
+
+    Output : PmtuCache
+    """
+    return PmtuCache(os.environ.get(CACHE_VARIABLE, DEFAULT_CACHE).strip())
+
+
+def pmtu_enabled(enabled=False):
+    """
+    Whether a pinger runs PMTU discovery, letting PING_PMTU override its setting.
+    """
+    value = os.environ.get(PMTU_VARIABLE)
+    if value is not None:
+        enabled = value.strip().lower() not in ("", "0", "false", "no", "off")
+    return enabled
+
+
+def discover(target, address=None, cache=None, refresh=False, timeout=TIMEOUT, probes=PROBES_PER_ROUND):
+    """
+    Find the path MTU to a target, from the cache if it was found recently.
+
+    Argument : target ('udp:HOST[:PORT]' or 'icmp:HOST'), its resolved address
+               ((ip, port) for UDP, ip for ICMP; None = resolve it), PmtuCache
+               (None = load_pmtu_cache()), True to search even if cached,
+               longest wait per round in seconds and sizes probed per round
+
+    Output : PmtuResult
+    """
+    cache = cache if cache is not None else load_pmtu_cache()
+    entry = None if refresh else cache.get(target)
+    if entry is not None:
+        return PmtuResult(target, entry["mtu"], entry["blackhole"], 0, 0, time.time() - entry["time"])
+    protocol, host, port = parse_target(target)
+    if protocol == "udp":
+        prober = _UdpProber(address or (shared_resolver().resolve(host), port))
+    elif protocol == "icmp":
+        prober = _IcmpProber(address or shared_resolver().resolve(host))
+    else:
+        raise ValueError(f"PMTU discovery needs a udp: or icmp: target, not {target!r}")
+    try:
+        state = search(prober, timeout, probes)
+    finally:
+        prober.close()
+    blackhole = state.mtu is not None and state.silentHigh
+    if state.mtu is not None:
+        cache.put(target, state.mtu, blackhole)
+    return PmtuResult(target, state.mtu, blackhole, state.rounds, state.probes, None)
+
+
+def describe(result):
+    """
+    One line describing a discovered path MTU, e.g. for the pingers' output.
+    """
+    if result.mtu is None:
+        return f"Path MTU to {result.target}: unknown, no probe got through ({result.probes} probes)"
+    text = f"Path MTU to {result.target}: {result.mtu} bytes"
+    if result.age is not None:
+        text += f" (cached {result.age:.0f} s ago)"
+    else:
+        text += f" ({result.rounds} rounds, {result.probes} probes)"
+    if result.blackhole:
+        text += ", MTU blackhole: larger packets are dropped without Fragmentation Needed"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the path MTU to UDP echo servers and ICMP hosts")
+    parser.add_argument("targets", nargs="+", help="udp:HOST[:PORT] or icmp:HOST")
+    parser.add_argument("--refresh", action="store_true", help="search again even if the MTU is cached")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="longest wait for a round's answers in seconds")
+    parser.add_argument("--probes", type=int, default=PROBES_PER_ROUND, help="sizes probed per round")
+    args = parser.parse_args(argv)
+
+    cache = load_pmtu_cache()
+    status = 0
+    for target in args.targets:
+        started = time.perf_counter()
+        try:
+            result = discover(target, cache=cache, refresh=args.refresh, timeout=args.timeout, probes=args.probes)
+        except (OSError, ValueError) as e:
+            print(f"{target}: Error: {e}")
+            status = 1
+            continue
+        print(f"{describe(result)} in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
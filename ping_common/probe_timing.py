@@ -0,0 +1,257 @@
+"""
+Network Diagnostics: Per-Probe Stage Timing and Self-Profiling
+
+PROBLEM STATEMENT:
+    When a reported RTT jumps, there is no telling whether the network or the
+    pinger caused it. Every probe goes through struct.pack, checksum, print,
+    time.ctime and string concatenation, much of it inside the timed window.
+
+DESCRIPTION:
+    This module implements opt-in instrumentation of the pingers' probe loops:
+    - StageTimer splits every probe into stages (build, checksum, send, wait,
+      receive and parse, output) with perf_counter_ns() marks between them
+    - Aggregates each stage in a log-linear histogram (the buckets of rtt_stats,
+      on nanoseconds) and prints count, mean, p50, p99 and maximum on exit
+    - Costs one no-op call per mark when disabled
+    - LoopProfiler runs the probe loop under cProfile, or under a sampling
+      profiler driven by a CPU-time interval timer (ITIMER_PROF) that writes
+      collapsed stacks for flame graph tools, and saves the result
+    - Both can be switched on for any pinger with PING_STAGE_TIMING=1 and
+      PING_PROFILE=<file> instead of editing its settings
+
+USE CASES:
+    - Telling the pinger's own overhead apart from network latency
+    - Finding which stage of the probe loop makes RTTs noisy
+    - Profiling the tools without installing anything
+"""
+
+import atexit
+import collections
+import cProfile
+import math
+import os
+import signal
+import sys
+import time
+
+from ping_common.rtt_stats import _bucket_index, _bucket_value
+
+TIMING_VARIABLE = "PING_STAGE_TIMING"
+PROFILE_VARIABLE = "PING_PROFILE"
+STAGES = ("build", "checksum", "send", "wait", "receive", "output")
+SAMPLE_INTERVAL = 0.001  # Seconds of CPU time between stack samples
+SAMPLED_SUFFIX = ".folded"  # Profile files with this suffix come from the sampling profiler
+
+
+class StageHistogram:
+    """
+    Count, total, extremes and log-linear histogram of one stage's durations in ns.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+        self._buckets = collections.Counter()
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        if ns > self.maximum:
+            self.maximum = ns
+        self._buckets[_bucket_index(max(ns, 0))] += 1
+
+    def percentile(self, p):
+        """
+        Estimate a percentile of the recorded durations.
+
+        Output : duration in ns (None without samples)
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(_bucket_value(index), self.maximum)
+        return self.maximum
+
+
+class StageTimer:
+    """
+    Time the stages of every probe.
+
+    Call start() when a probe begins, mark(stage) at the end of each stage and
+    finish() when the probe is done. A stage marked twice within one probe is
+    recorded as the sum of both parts.
+
+    Argument : True to record, False for a timer whose methods do nothing
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}  # Stage name -> StageHistogram
+        self.probes = 0
+        self._current = {}
+        self._last = 0
+        if not enabled:
+            self.start = self.mark = self.finish = _nothing
+
+    def start(self):
+        self._current.clear()
+        self._last = time.perf_counter_ns()
+
+    def mark(self, stage):
+        now = time.perf_counter_ns()
+        self._current[stage] = self._current.get(stage, 0) + now - self._last
+        self._last = now
+
+    def finish(self):
+        """
+        Record the stages of the current probe and their total.
+        """
+        if not self._current:
+            return
+        total = 0
+        for stage, ns in self._current.items():
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = StageHistogram()
+            histogram.add(ns)
+            total += ns
+        self._current.clear()
+        self.probes += 1
+        self.stages.setdefault("total", StageHistogram()).add(total)
+
+    def report(self, title="Probe stage timings:"):
+        """
+        Format the per-stage statistics in microseconds.
+
+        Output : multi-line string
+        """
+        lines = [title, f"     Probes: {self.probes}"]
+        order = [s for s in STAGES if s in self.stages]
+        order += [s for s in self.stages if s not in STAGES and s != "total"]
+        for stage in order + ["total"]:
+            histogram = self.stages.get(stage)
+            if histogram is None or not histogram.count:
+                continue
+            lines.append("     {:<9} mean = {:8.1f} us, p50 = {:8.1f} us, p99 = {:8.1f} us, max = {:8.1f} us".format(
+                stage + ":", histogram.total / histogram.count / 1e3, histogram.percentile(50) / 1e3,
+                histogram.percentile(99) / 1e3, histogram.maximum / 1e3))
+        return "\n".join(lines)
+
+    def print_on_exit(self, title="Probe stage timings:"):
+        """
+        Print report(title) when the process exits, if the timer is enabled.
+        """
+        if self.enabled:
+            atexit.register(lambda: print("\n" + self.report(title)))
+
+
+def _nothing(*args):
+    pass
+
+
+DISABLED = StageTimer(False)  # Default for functions that take an optional timer
+
+
+def load_stage_timer(enabled=False):
+    """
+    Build the stage timer for a pinger, letting PING_STAGE_TIMING override its setting.
+
+    Argument : the pinger's default
+
+    Output : StageTimer, printing its report on exit when enabled
+    """
+    value = os.environ.get(TIMING_VARIABLE)
+    if value is not None:
+        enabled = value.strip().lower() not in ("", "0", "false", "no", "off")
+    timer = StageTimer(enabled)
+    timer.print_on_exit()
+    return timer
+
+
+class SamplingProfiler:
+    """
+    Sample the main thread's Python stack every SAMPLE_INTERVAL of CPU time.
+
+    Time spent blocked in select() or recv() uses no CPU and is not sampled,
+    so the samples show where the pinger itself spends its time.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = collections.Counter()  # Collapsed stack -> samples
+
+    def _sample(self, signo, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def enable(self):
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous)
+
+    def dump_stats(self, path):
+        """
+        Write one 'frame;frame;... count' line per stack (flamegraph.pl, speedscope).
+        """
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class LoopProfiler:
+    """
+    Profile the code between start() and stop() and save the result.
+
+    Every stop() rewrites the file with everything profiled so far, so a loop
+    may be started and stopped once per round.
+
+    Argument : output file ('' = off); a name ending in .folded selects the
+               sampling profiler, anything else cProfile (read with pstats)
+    """
+
+    def __init__(self, output=""):
+        self.output = output
+        self.profiler = None
+        if output:
+            if output.endswith(SAMPLED_SUFFIX) and hasattr(signal, "setitimer"):
+                self.profiler = SamplingProfiler()
+            else:
+                self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        self.profiler.dump_stats(self.output)
+        if isinstance(self.profiler, SamplingProfiler):
+            how = f"{sum(self.profiler.samples.values())} samples of collapsed stacks"
+        else:
+            how = f"cProfile, read with: python3 -m pstats {self.output}"
+        print(f"Profile written to {self.output} ({how})", file=sys.stderr)
+
+
+def load_loop_profiler(output=""):
+    """
+    Build the loop profiler for a pinger, letting PING_PROFILE override its setting.
+
+    Argument : the pinger's default output file ('' = off)
+
+    Output : LoopProfiler
+    """
+    return LoopProfiler(os.environ.get(PROFILE_VARIABLE, output))
@@ -0,0 +1,345 @@
+"""
+Network Diagnostics: Columnar Append-Only Results Store
+
+PROBLEM STATEMENT:
+    Results only exist as console text and are lost when a run ends. Keeping
+    every probe of a month-long run as text or JSON is large, and answering
+    "p99 for host X last Tuesday" means parsing all of it.
+
+DESCRIPTION:
+    This module implements an on-disk results store for the UDP, TCP and ICMP
+    pingers that:
+    - Appends one record per probe: timestamp, target, sequence, RTT in
+      microseconds and status (reply, lost, unreachable, error)
+    - Buffers records per target and writes them in chunks of fixed-width
+      columns (uint32 time offsets, sequences and RTTs, uint8 statuses), 13 bytes
+      per probe, so a 30-day run at one probe per second is about 34 MB per target
+    - Keeps a fixed-width chunk index (target, first and last timestamp, offset)
+      so queries skip every chunk outside the target and time range
+    - Reads chunks through mmap without loading the file; a chunk appears in
+      the index only after it has been written, so a crash loses at most the
+      buffered records and never corrupts the store
+    - Lets several pinger processes append to one store (flock)
+    - Includes a query command for loss and percentiles per time window and target
+
+    Store layout (a directory):
+        targets  one target name per line; the line number is the target id
+        chunks   column data of each chunk, 8-byte aligned, native byte order
+        index    32 bytes per chunk: offset, first and last timestamp (us), target id, count
+
+    Query:
+        python3 -m ping_common.results_store DIR [--target T ...] [--since TIME]
+                                              [--until TIME] [--window 1h]
+        TIME is 'YYYY-MM-DD[ HH:MM[:SS]]' (local time), 'now' or relative like --since=-7d
+
+USE CASES:
+    - Keeping the results of long or unattended runs
+    - Loss and tail latency per hour or day, per target
+    - Comparing targets over the same period
+"""
+
+import argparse
+import array
+import atexit
+import datetime
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+
+from ping_common.rtt_stats import PERCENTILES, RttStats
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; one writer per store only
+    fcntl = None
+
+RESULTS_VARIABLE = "PING_RESULTS"
+CHUNK_RECORDS = 4096  # Records per chunk and target before it is written
+FLUSH_INTERVAL = 300  # Seconds a partial chunk may wait in memory
+MAX_OFFSET = 0xFFFFFFFF  # Largest time offset in a chunk, in us (about 71 minutes)
+
+STATUS_REPLY, STATUS_LOST, STATUS_UNREACHABLE, STATUS_ERROR = range(4)
+STATUS_NAMES = ("reply", "lost", "unreachable", "error")
+
+_index_entry = struct.Struct("<QQQHxxI")  # chunk offset, first us, last us, target id, count
+
+
+def _chunk_size(count):
+    # Three uint32 columns and one uint8 column, padded to 8 bytes
+    return (13 * count + 7) & ~7
+
+
+class _Columns:
+    # Buffered records of one target
+    def __init__(self, base):
+        self.base = base
+        self.started = time.monotonic()
+        self.offsets = array.array("I")
+        self.sequences = array.array("I")
+        self.rtts = array.array("I")
+        self.statuses = array.array("B")
+
+
+class ResultsWriter:
+    """
+    Append probe results to a store directory.
+
+    Argument : store directory (created if missing; None or '' = a writer
+               that records nothing) and records per chunk
+    """
+
+    def __init__(self, path, chunk_records=CHUNK_RECORDS):
+        self.path = path
+        self.chunk_records = chunk_records
+        self.buffers = {}  # Target name -> _Columns
+        self.target_ids = {}
+        self.written = 0
+        if not path:
+            self.append = _nothing
+            return
+        os.makedirs(path, exist_ok=True)
+        self._chunks = os.open(os.path.join(path, "chunks"), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._index = os.open(os.path.join(path, "index"), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        atexit.register(self.close)
+
+    def append(self, target, sequence, rtt_ms=0.0, status=STATUS_REPLY, timestamp=None):
+        """
+        Buffer the result of one probe.
+
+        Argument : target name (e.g. 'icmp:8.8.8.8'), probe sequence number, RTT
+                   in milliseconds, status (STATUS_*) and time.time() of the probe
+        """
+        now = int((time.time() if timestamp is None else timestamp) * 1e6)
+        columns = self.buffers.get(target)
+        if columns is not None and not 0 <= now - columns.base <= MAX_OFFSET:
+            self._write(target)  # Offset out of range for this chunk
+            columns = None
+        if columns is None:
+            columns = self.buffers[target] = _Columns(now)
+        columns.offsets.append(now - columns.base)
+        columns.sequences.append(sequence & 0xFFFFFFFF)
+        columns.rtts.append(min(max(int(rtt_ms * 1000), 0), 0xFFFFFFFF))
+        columns.statuses.append(status)
+        if len(columns.offsets) >= self.chunk_records or time.monotonic() - columns.started > FLUSH_INTERVAL:
+            self._write(target)
+
+    def _target_id(self, target):
+        # Called with the store locked, so concurrent writers agree on the ids
+        targetId = self.target_ids.get(target)
+        if targetId is not None:
+            return targetId
+        targetsPath = os.path.join(self.path, "targets")
+        names = []
+        if os.path.exists(targetsPath):
+            with open(targetsPath, encoding="utf-8") as f:
+                names = f.read().splitlines()
+        if target not in names:
+            with open(targetsPath, "a", encoding="utf-8") as f:
+                f.write(target + "\n")
+            names.append(target)
+        self.target_ids = {name: i for i, name in enumerate(names)}
+        return self.target_ids[target]
+
+    def _write(self, target):
+        columns = self.buffers.pop(target)
+        count = len(columns.offsets)
+        if not count:
+            return
+        data = (columns.offsets.tobytes() + columns.sequences.tobytes()
+                + columns.rtts.tobytes() + columns.statuses.tobytes())
+        data += bytes(_chunk_size(count) - len(data))
+        if fcntl is not None:
+            fcntl.flock(self._index, fcntl.LOCK_EX)
+        try:
+            targetId = self._target_id(target)
+            offset = os.fstat(self._chunks).st_size
+            os.write(self._chunks, data)
+            # The index entry makes the chunk visible, so it is written last
+            os.write(self._index, _index_entry.pack(offset, columns.base, columns.base + columns.offsets[-1],
+                                                    targetId, count))
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._index, fcntl.LOCK_UN)
+        self.written += count
+
+    def flush(self):
+        """
+        Write every buffered record, including partial chunks.
+        """
+        for target in list(self.buffers):
+            self._write(target)
+
+    def close(self):
+        if not self.path or self._chunks is None:
+            return
+        self.flush()
+        os.close(self._chunks)
+        os.close(self._index)
+        self._chunks = self._index = None
+
+
+def _nothing(*args, **kwargs):
+    pass
+
+
+def load_results_writer(path=""):
+    """
+    Build the results writer for a pinger, letting PING_RESULTS override its setting.
+
+    Argument : the pinger's default store directory ('' = do not store)
+
+    Output : ResultsWriter
+    """
+    return ResultsWriter(os.environ.get(RESULTS_VARIABLE, path))
+
+
+class ResultsReader:
+    """
+    Read a store directory through mmap.
+
+    Argument : store directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._maps = []
+        self.index = self._map("index")
+        self.chunks = self._map("chunks")
+        usable = len(self.index) - len(self.index) % _index_entry.size
+        self.entries = list(_index_entry.iter_unpack(self.index[:usable]))
+        # Read after the index: writers add a target before any index entry uses it
+        with open(os.path.join(path, "targets"), encoding="utf-8") as f:
+            text = f.read()
+        self.targets = text[:text.rfind("\n") + 1].splitlines()  # Complete lines only
+
+    def _map(self, name):
+        with open(os.path.join(self.path, name), "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return memoryview(b"")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped)
+
+    def chunks_for(self, targets=None, since=None, until=None):
+        """
+        Find the chunks that may hold records of the given targets and time range.
+
+        Argument : target names (None = all) and time range in us (None = open)
+
+        Output : list of (target name, base us, offsets, sequences, rtts, statuses)
+                 with the columns as memoryviews into the mapped file
+        """
+        wanted = None if targets is None else {i for i, name in enumerate(self.targets) if name in targets}
+        found = []
+        for offset, first, last, targetId, count in self.entries:
+            if targetId >= len(self.targets) or (wanted is not None and targetId not in wanted):
+                continue
+            if (since is not None and last < since) or (until is not None and first >= until):
+                continue
+            if offset + _chunk_size(count) > len(self.chunks):
+                continue  # Written after the file was mapped
+            column = 4 * count
+            found.append((self.targets[targetId], first,
+                          self.chunks[offset:offset + column].cast("I"),
+                          self.chunks[offset + column:offset + 2 * column].cast("I"),
+                          self.chunks[offset + 2 * column:offset + 3 * column].cast("I"),
+                          self.chunks[offset + 3 * column:offset + 3 * column + count]))
+        return found
+
+    def query(self, targets=None, since=None, until=None, window=None):
+        """
+        Aggregate RTTs and losses per time window and target.
+
+        Argument : target names (None = all), time range in us (None = whole
+                   store) and window length in us (None = one window)
+
+        Output : {(window start us, target): RttStats}
+        """
+        results = {}
+        for target, base, offsets, sequences, rtts, statuses in self.chunks_for(targets, since, until):
+            start = since if since is not None else 0
+            for i in range(len(offsets)):
+                stamp = base + offsets[i]
+                if (since is not None and stamp < since) or (until is not None and stamp >= until):
+                    continue
+                key = (start + (stamp - start) // window * window if window else start, target)
+                stats = results.get(key)
+                if stats is None:
+                    stats = results[key] = RttStats()
+                if statuses[i] == STATUS_REPLY:
+                    stats.add(rtts[i] / 1000)
+                else:
+                    stats.add_loss()
+        return results
+
+    def close(self):
+        self.index.release()
+        self.chunks.release()
+        for mapped in self._maps:
+            mapped.close()
+
+
+_duration = re.compile(r"^(\d+(?:\.\d+)?)\s*(s|m|h|d|w)$")
+_units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(text):
+    """
+    Seconds in a duration like '30s', '15m', '1h', '7d' or '2w'.
+    """
+    match = _duration.match(text.strip().lower())
+    if match is None:
+        raise ValueError(f"invalid duration {text!r}")
+    return float(match.group(1)) * _units[match.group(2)]
+
+
+def parse_time(text):
+    """
+    time.time() value of 'now', a relative time like '-7d' or a local
+    'YYYY-MM-DD[ HH:MM[:SS]]' date and time.
+    """
+    text = text.strip()
+    if text == "now":
+        return time.time()
+    if text.startswith("-"):
+        return time.time() - parse_duration(text[1:])
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Loss and RTT percentiles from a results store")
+    parser.add_argument("store", help="results store directory")
+    parser.add_argument("--target", action="append", help="target name (repeatable; default all)")
+    parser.add_argument("--since", help="start time: 'YYYY-MM-DD[ HH:MM[:SS]]', 'now' or relative, e.g. --since=-24h")
+    parser.add_argument("--until", help="end time (exclusive), same formats")
+    parser.add_argument("--window", help="window length, e.g. 1h or 1d (default: the whole range)")
+    args = parser.parse_args(argv)
+
+    since = int(parse_time(args.since) * 1e6) if args.since else None
+    until = int(parse_time(args.until) * 1e6) if args.until else None
+    window = int(parse_duration(args.window) * 1e6) if args.window else None
+
+    started = time.perf_counter()
+    reader = ResultsReader(args.store)
+    results = reader.query(args.target, since, until, window)
+    reader.close()
+
+    width = max([len(target) for _, target in results] + [6])
+    print(f"{'Window start':<19}  {'Target':<{width}}  {'Sent':>8}  {'Lost':>7}  {'Loss':>7}  "
+          + "  ".join(f"{'p%g' % p:>9}" for p in PERCENTILES))
+    for (start, target), stats in sorted(results.items()):
+        label = datetime.datetime.fromtimestamp(start / 1e6).strftime("%Y-%m-%d %H:%M:%S") if start else "all"
+        percentiles = "  ".join(f"{stats.percentile(p):>6.2f} ms" if stats.count else f"{'-':>9}"
+                                for p in PERCENTILES)
+        print(f"{label:<19}  {target:<{width}}  {stats.sent:>8}  {stats.lost:>7}  {stats.loss_rate:>6.2f}%  "
+              + percentiles)
+    print(f"\n{sum(s.sent for s in results.values())} probes in {len(results)} windows, "
+          f"{time.perf_counter() - started:.3f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
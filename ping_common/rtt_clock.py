@@ -0,0 +1,140 @@
+"""
+Network Diagnostics: RTT Clock Sources
+
+PROBLEM STATEMENT:
+    The pingers time probes with time.time(), a wall clock that can jump when
+    the system time is adjusted, and read the receive time only after select()
+    or recvfrom() has returned. Python scheduling delay and GIL contention
+    between the packet arriving and that call then end up inside every RTT.
+
+DESCRIPTION:
+    This module provides selectable timing backends that:
+    - "wall": the original behaviour, time.time() on both sides
+    - "monotonic": perf_counter_ns() on both sides, immune to clock steps
+    - "kernel": perf_counter_ns() for send times and the kernel's receive
+      timestamp (SO_TIMESTAMPNS ancillary data read through recvmsg) for
+      receive times
+    - Translate kernel timestamps, which use CLOCK_REALTIME, onto the monotonic
+      clock by measuring how long ago the kernel stamped the packet
+    - Fall back to a userspace timestamp for packets without ancillary data
+    - Describe the clock source actually used, for the pinger's output
+
+USE CASES:
+    - Accurate RTTs under high concurrency or CPU load
+    - Long runs that span NTP adjustments
+    - Comparing userspace and kernel receive timing
+"""
+
+import socket
+import struct
+import time
+
+# Linux values; older Python versions do not export these constants
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+
+CLOCK_SOURCES = ("wall", "monotonic", "kernel")
+
+_timespec = struct.Struct("@ll")
+
+
+class RttClock:
+    """
+    Timestamp sends and receives with the selected clock source.
+
+    All timestamps are integers in nanoseconds; only differences between a
+    send and a receive timestamp of the same clock are meaningful.
+
+    Argument : clock source, one of "wall", "monotonic" or "kernel"
+    """
+
+    def __init__(self, source="wall"):
+        if source not in CLOCK_SOURCES:
+            raise ValueError(f"Unknown clock source {source!r}, expected one of {CLOCK_SOURCES}")
+        self.source = source
+        self.now = time.time_ns if source == "wall" else time.perf_counter_ns
+        self.kernel_samples = 0
+        self.fallback_samples = 0
+        self.kernel_unavailable = False
+        self._ancbufsize = socket.CMSG_SPACE(_timespec.size) if hasattr(socket, "CMSG_SPACE") else 0
+
+    def enable(self, sock):
+        """
+        Prepare a socket for receive timestamping (needed only for "kernel").
+
+        Argument : socket the replies will be read from
+        """
+        if self.source != "kernel" or self.kernel_unavailable:
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        except (OSError, AttributeError):
+            self.kernel_unavailable = True  # Not Linux; use userspace timestamps
+
+    def _kernel_time(self, ancdata):
+        for level, type, data in ancdata:
+            if level == socket.SOL_SOCKET and type == SCM_TIMESTAMPNS and len(data) >= _timespec.size:
+                sec, nsec = _timespec.unpack_from(data)
+                # Map CLOCK_REALTIME onto perf_counter_ns by subtracting how long
+                # ago the kernel stamped the packet; both reads happen back to back
+                monoNow = time.perf_counter_ns()
+                age = time.time_ns() - (sec * 1_000_000_000 + nsec)
+                if age < 0:
+                    break  # The wall clock stepped; the userspace time is safer
+                self.kernel_samples += 1
+                return monoNow - age
+        self.fallback_samples += 1
+        return time.perf_counter_ns()
+
+    def recvfrom(self, sock, bufsize):
+        """
+        Receive a datagram and the time it arrived.
+
+        Argument : socket and maximum number of bytes to receive
+
+        Output : (data, address, receive timestamp in ns)
+        """
+        if self.source != "kernel" or self.kernel_unavailable:
+            data, address = sock.recvfrom(bufsize)
+            return data, address, self.now()
+        data, ancdata, _, address = sock.recvmsg(bufsize, self._ancbufsize)
+        return data, address, self._kernel_time(ancdata)
+
+    def recv(self, sock, bufsize):
+        """
+        Receive from a connected socket and the time the data arrived.
+
+        Argument : socket and maximum number of bytes to receive
+
+        Output : (data, receive timestamp in ns)
+        """
+        data, _, timestamp = self.recvfrom(sock, bufsize)
+        return data, timestamp
+
+    def recv_into(self, sock, buffer):
+        """
+        Receive from a connected socket into a buffer and the time the data arrived.
+
+        Argument : socket and writable buffer
+
+        Output : (number of bytes received, receive timestamp in ns)
+        """
+        if self.source != "kernel" or self.kernel_unavailable:
+            return sock.recv_into(buffer), self.now()
+        nbytes, ancdata, _, _ = sock.recvmsg_into([buffer], self._ancbufsize)
+        return nbytes, self._kernel_time(ancdata)
+
+    def describe(self):
+        """
+        Describe the clock source for the pinger's output.
+
+        Output : one-line description of the clocks used
+        """
+        if self.source == "wall":
+            return "wall clock (time.time)"
+        if self.source == "monotonic":
+            return "monotonic clock (perf_counter_ns)"
+        if self.kernel_unavailable:
+            return "monotonic clock (perf_counter_ns); kernel timestamps unavailable"
+        return (f"kernel receive timestamps (SO_TIMESTAMPNS), perf_counter_ns send times; "
+                f"{self.kernel_samples} kernel / {self.fallback_samples} userspace samples")
@@ -0,0 +1,179 @@
+"""
+Network Diagnostics: Streaming RTT Statistics
+
+PROBLEM STATEMENT:
+    The pingers keep every RTT in a list and compute minimum, maximum and average
+    only after the last probe. A week-long continuous run grows without bound,
+    and the final numbers say nothing about tail latency.
+
+DESCRIPTION:
+    This module implements a constant-memory RTT accumulator that:
+    - Tracks count, minimum, maximum, mean and variance with Welford's algorithm
+    - Counts lost probes next to the received ones
+    - Records RTTs in an HDR-histogram-style log-linear histogram with a fixed
+      number of buckets (about 1.6% relative precision from 1 microsecond to
+      over a day), stored sparsely so idle per-target accumulators stay small
+    - Reports p50, p90, p99 and p99.9 at any time
+    - Merges accumulators, e.g. from several targets or worker processes
+    - Prints running statistics when the process receives SIGUSR1
+
+USE CASES:
+    - Long-running and continuous ping sessions
+    - Tail latency (p99/p99.9) monitoring
+    - Shared statistics for the UDP, TCP and ICMP pingers
+"""
+
+import math
+import os
+import signal
+import sys
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS  # Exact values below this many microseconds
+HALF_BUCKETS = SUB_BUCKETS >> 1
+MAX_SHIFT = 30  # Largest value tracked is about 2**37 us (38 hours)
+NUM_BUCKETS = SUB_BUCKETS + MAX_SHIFT * HALF_BUCKETS
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def _bucket_index(micros):
+    if micros < SUB_BUCKETS:
+        return micros
+    shift = min(micros.bit_length() - SUB_BUCKET_BITS, MAX_SHIFT)
+    sub = min(micros >> shift, SUB_BUCKETS - 1)
+    return SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + (sub - HALF_BUCKETS)
+
+
+def _bucket_value(index):
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index - SUB_BUCKETS) // HALF_BUCKETS + 1
+    sub = (index - SUB_BUCKETS) % HALF_BUCKETS + HALF_BUCKETS
+    return ((sub << shift) + ((sub + 1) << shift) - 1) / 2  # Middle of the bucket
+
+
+class RttStats:
+    """
+    Constant-memory accumulator of RTT samples in milliseconds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lost = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._buckets = {}  # Sparse: bucket index -> count, at most NUM_BUCKETS entries
+
+    def add(self, rtt):
+        """
+        Record one RTT in milliseconds.
+        """
+        self.count += 1
+        delta = rtt - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (rtt - self.mean)
+        if rtt < self.minimum:
+            self.minimum = rtt
+        if rtt > self.maximum:
+            self.maximum = rtt
+        index = _bucket_index(max(int(rtt * 1000), 0))
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def add_loss(self, count=1):
+        """
+        Record lost probes.
+        """
+        self.lost += count
+
+    @property
+    def sent(self):
+        return self.count + self.lost
+
+    @property
+    def loss_rate(self):
+        """
+        Percentage of probes lost.
+        """
+        return self.lost / self.sent * 100 if self.sent else 0.0
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def percentile(self, p):
+        """
+        Estimate a percentile of the recorded RTTs.
+
+        Argument : percentile between 0 and 100
+
+        Output : RTT in milliseconds (None without samples)
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                value = _bucket_value(index) / 1000
+                return min(max(value, self.minimum), self.maximum)
+        return self.maximum
+
+    def merge(self, other):
+        """
+        Add the samples of another accumulator to this one.
+        """
+        if other.count:
+            total = self.count + other.count
+            delta = other.mean - self.mean
+            self._m2 += other._m2 + delta * delta * self.count * other.count / total
+            self.mean += delta * other.count / total
+            self.count = total
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+            for index, n in other._buckets.items():
+                self._buckets[index] = self._buckets.get(index, 0) + n
+        self.lost += other.lost
+
+    def report(self, title=None):
+        """
+        Format the statistics in the style of the pingers' final summary.
+
+        Argument : optional heading, e.g. 'Ping statistics for 127.0.0.1:'
+
+        Output : multi-line string
+        """
+        lines = [title] if title else []
+        lines.append("     Packets: Sent = {}, Received = {}, Lost = {} ({:.2f}% loss)".format(
+            self.sent, self.count, self.lost, self.loss_rate))
+        if self.count:
+            lines.append("Approximate round trip times in milli-seconds:")
+            lines.append("     Minimum: {:.2f} ms, Maximum: {:.2f} ms, Average: {:.2f} ms, Std dev: {:.2f} ms".format(
+                self.minimum, self.maximum, self.mean, self.stddev))
+            lines.append("     " + ", ".join(
+                "p{:g}: {:.2f} ms".format(p, self.percentile(p)) for p in PERCENTILES))
+        return "\n".join(lines)
+
+
+def print_on_signal(stats, title=None, signum=getattr(signal, "SIGUSR1", None)):
+    """
+    Print stats.report(title) whenever the process receives a signal (SIGUSR1).
+
+    The report is written straight to the stdout file descriptor so that it
+    cannot collide with a print() the signal interrupted.
+
+    Argument : RttStats to report, optional heading and the signal number
+    """
+    if signum is None:
+        return  # Platform without SIGUSR1
+
+    def handler(signo, frame):
+        os.write(sys.stdout.fileno(), ("\n" + stats.report(title) + "\n\n").encode())
+
+    signal.signal(signum, handler)
@@ -0,0 +1,452 @@
+"""
+Network Diagnostics: Multi-Process Sharded Probe Scheduler
+
+PROBLEM STATEMENT:
+    Even with non-blocking sockets and batched system calls, one Python process
+    runs on one core. Probing a large target list at a high rate is limited by
+    the interpreter, not by the network or the kernel.
+
+DESCRIPTION:
+    This module implements a probe scheduler that:
+    - Splits a list of ICMP, UDP and TCP targets into shards, round robin, and
+      probes each shard in its own worker process (one per core by default)
+    - Lets every worker own its sockets: one UDP socket and one raw ICMP socket
+      per worker, one framed TCP connection per TCP target
+    - Keeps a bounded number of probes in flight per worker and matches replies
+      to probes by sequence number (binary probes, ICMP echo sequence)
+    - Sends round robin over the targets that have a free slot, each target
+      holding at most its share of the in-flight window, so a target that
+      never answers only slows itself down
+    - Counts a UDP probe that caused a port, host or network unreachable as
+      lost right away, not after the timeout (IP_RECVERR, ping_common.icmp_errqueue)
+    - Optionally caps the aggregate probe rate with a token bucket per worker,
+      each allowed its share of the rate (ping_common.pacing)
+    - Streams partial per-target RttStats from the workers to the parent over
+      a pipe a few times per second; the parent merges them (RttStats.merge)
+      into per-target and global statistics, printable at any time with SIGUSR1
+    - Resolves every host name once, concurrently, in the parent before the
+      workers start (ping_common.resolver)
+
+    Targets:
+        udp:HOST[:PORT]     binary probes to a UDP echo server (port 14008 by default)
+        tcp:HOST[:PORT]     framed binary probes; the server needs framing = True and
+                            must keep the connection open (tcp_pinger_server_async.py)
+        icmp:HOST           ICMP echo requests (root)
+
+    Command:
+        python3 -m ping_common.shard_scheduler TARGET ... [-f FILE] [--count N]
+                                                [--workers N] [--timeout S] [--in-flight N]
+                                                [--rate PROBES_PER_SECOND]
+
+USE CASES:
+    - Probing thousands of targets at rates one process cannot reach
+    - Loading a multi-process server (udp_pinger_server_reuseport.py) from many cores
+    - Fleet-wide loss and latency snapshots with merged percentiles
+"""
+
+import argparse
+import collections
+import multiprocessing
+import multiprocessing.connection
+import os
+import selectors
+import socket
+import struct
+import sys
+import time
+
+from ping_common import icmp_errqueue
+from ping_common.inet_checksum import checksum
+from ping_common.pacing import TokenBucket
+from ping_common.probe_format import pack_probe, parse_probe
+from ping_common.resolver import shared_resolver
+from ping_common.rtt_stats import RttStats, print_on_signal
+from ping_common.tcp_framing import FRAME_PREFIX_SIZE, FrameReader, frame, set_nodelay
+
+DEFAULT_PORT = 14008
+DEFAULT_TIMEOUT = 1.0  # Seconds to wait for each reply
+DEFAULT_IN_FLIGHT = 64  # Probes in flight per worker
+REPORT_INTERVAL = 0.25  # Seconds between partial results sent to the parent
+RATE_BURST = 0.01  # Seconds of tokens a rate-limited worker may send back to back
+PROTOCOLS = ("udp", "tcp", "icmp")
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+_icmp_header = struct.Struct("!BBHHH")
+_icmp_stamp = struct.Struct("!Q")
+
+
+def parse_target(text):
+    """
+    Split a target like 'udp:10.0.0.1:14008' into its protocol, host and port.
+
+    Argument : target text
+
+    Output : (protocol, host, port); port is None for ICMP
+    """
+    protocol, _, rest = text.partition(":")
+    protocol = protocol.lower()
+    if protocol not in PROTOCOLS or not rest:
+        raise ValueError(f"invalid target {text!r}, expected udp:HOST[:PORT], tcp:HOST[:PORT] or icmp:HOST")
+    if protocol == "icmp":
+        return protocol, rest, None
+    host, _, port = rest.partition(":")
+    return protocol, host, int(port) if port else DEFAULT_PORT
+
+
+class _Shard:
+    """
+    The probing loop of one worker process.
+
+    Argument : targets of the shard, their resolved hosts ({host: address or
+               OSError}), probes per target, timeout in seconds, maximum probes
+               in flight, the pipe to the parent and the worker's share of the
+               rate limit (0 = unlimited)
+    """
+
+    def __init__(self, targets, addresses, count, timeout, in_flight, conn, rate=0):
+        self.targets = targets
+        self.addresses = addresses
+        self.count = count
+        self.timeout_ns = int(timeout * 1e9)
+        self.in_flight = in_flight
+        self.conn = conn
+        self.bucket = TokenBucket(rate, int(rate * RATE_BURST)) if rate else None
+        self.selector = selectors.DefaultSelector()
+        self.pending = {}  # (channel, sequence) -> (target, send time in ns)
+        self.deadlines = collections.deque()  # (deadline in ns, key) in send order
+        self.remaining = collections.Counter()  # Target -> probes still to send
+        self.flights = collections.Counter()  # Target -> probes in flight
+        self.ready = collections.deque()  # Targets with probes to send and a free slot
+        self.share = 0  # Probes in flight per target with probes to send, set by _reshare()
+        self.active = 0  # Targets with probes to send
+        self.stats = {}  # Target -> RttStats since the last report
+        self.sequence = 0
+        self.icmp_id = os.getpid() & 0xFFFF
+        self.udp = self.icmp = None
+        self.channels = {}  # Target -> (channel, address) or None when it cannot be probed
+
+    def _stats(self, target):
+        stats = self.stats.get(target)
+        if stats is None:
+            stats = self.stats[target] = RttStats()
+        return stats
+
+    def _open(self, target):
+        protocol, host, port = parse_target(target)
+        address = self.addresses[host]
+        if isinstance(address, OSError):
+            raise address
+        if protocol == "udp":
+            if self.udp is None:
+                self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+                icmp_errqueue.enable(self.udp)
+                self.selector.register(self.udp, selectors.EVENT_READ, self._read_udp)
+            return self.udp, (address, port)
+        if protocol == "icmp":
+            if self.icmp is None:
+                self.icmp = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.getprotobyname("icmp"))
+                self.icmp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+                self.selector.register(self.icmp, selectors.EVENT_READ, self._read_icmp)
+            return self.icmp, (address, 0)
+        connection = socket.create_connection((address, port), timeout=self.timeout_ns / 1e9)
+        set_nodelay(connection)
+        reader = FrameReader()
+        self.selector.register(connection, selectors.EVENT_READ, lambda: self._read_tcp(connection, reader))
+        return connection, None
+
+    def _send(self, target, now):
+        channel, address = self.channels[target]
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        if channel is self.icmp:
+            sequence = self.sequence & 0xFFFF
+            packet = _icmp_header.pack(ICMP_ECHO_REQUEST, 0, 0, self.icmp_id, sequence) + _icmp_stamp.pack(now)
+            packet = packet[:2] + struct.pack("!H", checksum(packet)) + packet[4:]
+            channel.sendto(packet, address)
+        elif channel is self.udp:
+            sequence = self.sequence
+            probe = pack_probe(sequence, now)
+            try:
+                channel.sendto(probe, address)
+            except OSError:
+                # With IP_RECVERR, the ICMP error of an earlier probe (to any
+                # target) fails the next send once; it is read from the error
+                # queue, so send again. An error of this send fails again.
+                channel.sendto(probe, address)
+        else:
+            sequence = self.sequence
+            channel.sendall(frame(pack_probe(sequence, now)))
+        key = (channel, sequence)
+        self.pending[key] = (target, now)
+        self.deadlines.append((now + self.timeout_ns, key))
+
+    def _reshare(self):
+        # Targets that finished sending leave their share to the others
+        share = max(1, self.in_flight // max(self.active, 1))
+        if share != self.share:
+            self.share = share
+            self.ready = collections.deque(target for target in self.channels
+                                           if self.remaining[target] and self.flights[target] < share)
+
+    def _release(self, target):
+        # A probe of the target ended; it may send again if it was at its share
+        self.flights[target] -= 1
+        if self.remaining[target] and self.flights[target] == self.share - 1:
+            self.ready.append(target)
+
+    def _answered(self, key, now):
+        probe = self.pending.pop(key, None)
+        if probe is not None:  # Otherwise late, duplicate or someone else's
+            self._stats(probe[0]).add((now - probe[1]) / 1e6)
+            self._release(probe[0])
+
+    def _refused(self, key):
+        probe = self.pending.pop(key, None)
+        if probe is not None:
+            self._stats(probe[0]).add_loss()
+            self._release(probe[0])
+
+    def _read_udp(self):
+        while True:
+            error = icmp_errqueue.read_error(self.udp, 64)
+            if error is None:
+                break
+            probe = parse_probe(error.payload)  # The start of the probe that caused it
+            if probe is not None:
+                self._refused((self.udp, probe[0]))
+        while True:
+            try:
+                reply = self.udp.recv(2048, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue  # The error is read from the error queue on the next call
+            now = time.monotonic_ns()
+            probe = parse_probe(reply)
+            if probe is not None:
+                self._answered((self.udp, probe[0]), now)
+
+    def _read_icmp(self):
+        while True:
+            try:
+                packet = self.icmp.recv(2048, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                return
+            now = time.monotonic_ns()
+            ihl = (packet[0] & 0x0F) * 4
+            if len(packet) < ihl + _icmp_header.size:
+                continue
+            type, _, _, packetID, sequence = _icmp_header.unpack_from(packet, ihl)
+            if type == ICMP_ECHO_REPLY and packetID == self.icmp_id:
+                self._answered((self.icmp, sequence), now)
+
+    def _read_tcp(self, connection, reader):
+        try:
+            nbytes = connection.recv_into(reader.space())
+        except OSError:
+            nbytes = 0
+        if not nbytes:
+            self.selector.unregister(connection)  # Its pings in flight time out
+            return
+        now = time.monotonic_ns()
+        reader.filled(nbytes)
+        for reply in reader.frames():
+            probe = parse_probe(reply[FRAME_PREFIX_SIZE:])
+            if probe is not None:
+                self._answered((connection, probe[0]), now)
+
+    def _expire(self, now):
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, key = self.deadlines.popleft()
+            probe = self.pending.pop(key, None)
+            if probe is not None:
+                self._stats(probe[0]).add_loss()
+                self._release(probe[0])
+
+    def _report(self):
+        if self.stats:
+            self.conn.send(("stats", self.stats))
+            self.stats = {}
+
+    def run(self):
+        for target in dict.fromkeys(self.targets):
+            try:
+                self.channels[target] = self._open(target)
+            except OSError as e:
+                self.channels[target] = None
+                self.conn.send(("error", f"{target}: {e}"))
+        for target in self.targets:
+            self.remaining[target] += self.count  # Repeated targets once per repeat
+        self.active = len(self.channels)
+        self._reshare()
+        reported = time.monotonic()
+        while self.ready or self.pending:
+            now = time.monotonic_ns()
+            tokenWait = None
+            while self.ready and len(self.pending) < self.in_flight:
+                if self.bucket is not None:
+                    delay = self.bucket.delay(time.perf_counter_ns())
+                    if delay:
+                        tokenWait = delay / 1e9
+                        break
+                    self.bucket.take(time.perf_counter_ns())
+                target = self.ready.popleft()
+                self.remaining[target] -= 1
+                if self.channels[target] is None:
+                    self._stats(target).add_loss()
+                else:
+                    try:
+                        self._send(target, now)
+                        self.flights[target] += 1
+                    except OSError:
+                        self._stats(target).add_loss()
+                if not self.remaining[target]:
+                    self.active -= 1
+                    self._reshare()
+                elif self.flights[target] < self.share:
+                    self.ready.append(target)
+            self._expire(now)
+            waits = [REPORT_INTERVAL]
+            if self.deadlines:
+                waits.append(max(self.deadlines[0][0] - time.monotonic_ns(), 0) / 1e9)
+            if tokenWait is not None:
+                waits.append(tokenWait)
+            if len(waits) > 1:
+                for key, _ in self.selector.select(min(waits)):
+                    key.data()
+            if time.monotonic() - reported >= REPORT_INTERVAL:
+                self._report()
+                reported = time.monotonic()
+        self._report()
+        self.conn.send(("done", None))
+
+
+def _work(targets, addresses, count, timeout, in_flight, conn, rate):
+    try:
+        _Shard(targets, addresses, count, timeout, in_flight, conn, rate).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
+class ShardScheduler:
+    """
+    Probe a target list from several worker processes and merge their results.
+
+    Argument : number of workers (None = one per core), timeout in seconds,
+               maximum probes in flight per worker, the aggregate rate limit
+               in probes per second (0 = unlimited) and the Resolver of the
+               host names (default the process's shared one)
+    """
+
+    def __init__(self, workers=None, timeout=DEFAULT_TIMEOUT, in_flight=DEFAULT_IN_FLIGHT, rate=0, resolver=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.resolver = resolver or shared_resolver()
+        self.timeout = timeout
+        self.in_flight = in_flight
+        self.rate = rate
+        self.targets = {}  # Target -> merged RttStats
+        self.total = RttStats()  # All targets merged
+        self.errors = []
+
+    def _merge(self, partial):
+        for target, stats in partial.items():
+            merged = self.targets.get(target)
+            if merged is None:
+                merged = self.targets[target] = RttStats()
+            merged.merge(stats)
+            self.total.merge(stats)
+
+    def run(self, targets, count=1):
+        """
+        Probe every target count times, one shard of the list per worker.
+
+        Argument : list of targets ('udp:HOST[:PORT]', 'tcp:HOST[:PORT]' or
+                   'icmp:HOST'; repeated targets are probed once per repeat)
+                   and probes per target
+
+        Output : {target: RttStats}; self.total holds the merged statistics
+        """
+        # Fail in the parent on a malformed target, and resolve every host once
+        hosts = [parse_target(target)[1] for target in targets]
+        addresses = self.resolver.resolve_many(hosts)
+        shards = [targets[i::self.workers] for i in range(min(self.workers, len(targets)))]
+        pipes = []
+        processes = []
+        for shard in shards:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            shard_addresses = {host: addresses[host] for host in (parse_target(target)[1] for target in shard)}
+            process = multiprocessing.Process(target=_work, daemon=True,
+                                              args=(shard, shard_addresses, count, self.timeout,
+                                                    self.in_flight, sender,
+                                                    self.rate * len(shard) / len(targets)))
+            process.start()
+            sender.close()  # The parent only reads; EOF then means the worker is gone
+            pipes.append(receiver)
+            processes.append(process)
+
+        while pipes:
+            for receiver in multiprocessing.connection.wait(pipes):
+                try:
+                    kind, payload = receiver.recv()
+                except EOFError:
+                    kind = "done"
+                if kind == "stats":
+                    self._merge(payload)
+                elif kind == "error":
+                    self.errors.append(payload)
+                if kind == "done":
+                    pipes.remove(receiver)
+                    receiver.close()
+        for process in processes:
+            process.join()
+        return self.targets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Probe many targets from several processes")
+    parser.add_argument("targets", nargs="*", help="udp:HOST[:PORT], tcp:HOST[:PORT] or icmp:HOST")
+    parser.add_argument("-f", "--file", help="file with one target per line")
+    parser.add_argument("--count", type=int, help="probes per target (asked for when omitted)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds to wait for a reply")
+    parser.add_argument("--in-flight", type=int, default=DEFAULT_IN_FLIGHT, help="probes in flight per worker")
+    parser.add_argument("--rate", type=float, default=0, help="aggregate probes per second (default: unlimited)")
+    args = parser.parse_args(argv)
+
+    targets = list(args.targets)
+    if args.file:
+        with open(args.file) as f:
+            targets += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not targets:
+        parser.error("no targets given")
+    count = args.count if args.count is not None else int(input("Set the number of ping operations: "))
+
+    scheduler = ShardScheduler(args.workers, args.timeout, args.in_flight, args.rate)
+    print_on_signal(scheduler.total, "Ping statistics for all targets so far:")
+    workers = min(scheduler.workers, len(targets))
+    print(f"Probing {len(targets)} targets {count} times from {workers} worker processes\n")
+    started = time.perf_counter()
+    results = scheduler.run(targets, count)
+    elapsed = time.perf_counter() - started
+
+    for error in scheduler.errors:
+        print(f"Error: {error}")
+    for target, stats in sorted(results.items()):
+        if stats.count:
+            print(f"{target}: {stats.count}/{stats.sent} replies, "
+                  f"min/avg/max = {stats.minimum:.2f}/{stats.mean:.2f}/{stats.maximum:.2f} ms, "
+                  f"p99 = {stats.percentile(99):.2f} ms")
+        else:
+            print(f"{target}: 0/{stats.sent} replies, 100% loss")
+    print("")
+    print(scheduler.total.report(f"Ping statistics for {len(results)} targets:"))
+    print(f"{scheduler.total.sent} probes in {elapsed:.3f} s "
+          f"({scheduler.total.sent / elapsed if elapsed else 0:.0f} probes/s, {workers} workers)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Network Diagnostics: Length-Prefixed TCP Framing
+
+PROBLEM STATEMENT:
+    The TCP client and servers treat every recv() as exactly one ping. TCP is a
+    byte stream, so under load several pings arrive in one recv() or one ping is
+    split across two, and RTTs get attributed to the wrong sequence number.
+    Nagle's algorithm also holds back small writes, inflating the reported RTT.
+
+DESCRIPTION:
+    This module implements a minimal framed protocol for the TCP pingers that:
+    - Prefixes every message with its length (2 bytes, network byte order)
+    - Reassembles frames from a stream with an incremental FrameReader that
+      receives straight into its own buffer and yields frames as memoryviews
+    - Grows the buffer only when a frame does not fit, so idle connections stay small
+    - Disables Nagle's algorithm (TCP_NODELAY) on framed connections
+
+    Frame layout:
+        length (2 bytes) | payload (length bytes, text ping or binary probe)
+
+USE CASES:
+    - Several outstanding pings per TCP connection
+    - Correct per-message RTTs at high message rates
+    - Echo servers that answer framed and unframed clients alike
+"""
+
+import socket
+import struct
+
+FRAME_PREFIX = struct.Struct("!H")
+FRAME_PREFIX_SIZE = FRAME_PREFIX.size
+MAX_FRAME_PAYLOAD = 0xFFFF
+
+
+def frame(payload):
+    """
+    Prefix a payload with its length.
+
+    Argument : bytes-like payload of at most 65535 bytes
+
+    Output : framed bytes, ready to send
+    """
+    if len(payload) > MAX_FRAME_PAYLOAD:
+        raise ValueError(f"Frame payload of {len(payload)} bytes exceeds {MAX_FRAME_PAYLOAD}")
+    return FRAME_PREFIX.pack(len(payload)) + payload
+
+
+def set_nodelay(sock):
+    """
+    Disable Nagle's algorithm so small frames are sent immediately.
+
+    Argument : connected TCP socket
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class FrameReader:
+    """
+    Reassemble length-prefixed frames from a TCP byte stream.
+
+    Frames yielded by frames() are memoryviews into the reader's buffer and
+    stay valid until the next call to space() or recv().
+
+    Argument : initial buffer size in bytes
+    """
+
+    def __init__(self, size=4096):
+        self.buffer = bytearray(max(size, FRAME_PREFIX_SIZE))
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First byte not yet returned as part of a frame
+        self.end = 0  # End of the received data
+
+    def space(self):
+        """
+        Make room for the next receive.
+
+        Output : writable memoryview to pass to recv_into()
+        """
+        pending = self.end - self.start
+        if self.start and (not pending or self.end == len(self.buffer)):
+            # Move the partial frame to the front of the buffer
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        if pending >= FRAME_PREFIX_SIZE:
+            needed = FRAME_PREFIX_SIZE + FRAME_PREFIX.unpack_from(self.buffer, self.start)[0]
+            if needed > len(self.buffer):
+                # Earlier frames may still be referenced, so copy instead of resizing
+                buffer = bytearray(needed)
+                buffer[:pending] = self.buffer[self.start:self.end]
+                self.buffer, self.view = buffer, memoryview(buffer)
+                self.start, self.end = 0, pending
+        return self.view[self.end:]
+
+    def filled(self, nbytes):
+        """
+        Account for bytes received into the memoryview returned by space().
+
+        Argument : number of bytes received
+        """
+        self.end += nbytes
+
+    def recv(self, sock):
+        """
+        Receive from a connected socket into the buffer.
+
+        Argument : connected TCP socket
+
+        Output : number of bytes received (0 when the peer closed the connection)
+        """
+        nbytes = sock.recv_into(self.space())
+        self.end += nbytes
+        return nbytes
+
+    def frames(self):
+        """
+        Yield every complete frame received so far.
+
+        Output : iterator of memoryviews, each holding the length prefix and
+                 the payload; frame[FRAME_PREFIX_SIZE:] is the payload
+        """
+        while self.end - self.start >= FRAME_PREFIX_SIZE:
+            stop = self.start + FRAME_PREFIX_SIZE + FRAME_PREFIX.unpack_from(self.buffer, self.start)[0]
+            if stop > self.end:
+                return  # Partial frame; wait for more data
+            message = self.view[self.start:stop]
+            self.start = stop
+            yield message
@@ -0,0 +1,222 @@
+"""
+Network Diagnostics: Concurrent TCP Connect Prober
+
+PROBLEM STATEMENT:
+    The TCP pinger opens a single connection and only times send/recv on it.
+    Handshake latency and the connection success rate under load, which are
+    what production services notice first, are never measured at all.
+
+DESCRIPTION:
+    This module implements an asyncio TCP prober that:
+    - Opens many connections in parallel with non-blocking sockets
+    - Records the connect() RTT distribution separately from the echo RTT
+    - Counts failed handshakes (refused, timed out, other errors) as connect losses
+    - Sends one binary probe per connection and matches the echo by sequence number
+    - Optionally keeps a pool of warm connections that is reused across probe
+      rounds, so that handshakes are only paid when a pooled connection is lost
+    - Bounds the number of connection attempts in flight
+
+USE CASES:
+    - Handshake latency and connection success rate under load
+    - Separating connection setup cost from request latency
+    - Load testing tcp_pinger_server_async.py with thousands of clients
+"""
+
+import asyncio
+import collections
+import errno
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.probe_format import PROBE_HEADER_SIZE, ProbeBuilder, parse_probe
+from ping_common.rtt_stats import RttStats
+from tcp_pinger_server_async import raise_file_limit
+
+server_ip = '127.0.0.1'
+server_port = 14008
+concurrency = 256  # Connection attempts in flight at once
+timeout = 1  # Seconds allowed for a handshake and for an echo
+warm_pool = False  # Keep connections open and reuse them in the next round
+round_interval = 1  # Seconds between probe rounds
+
+
+class ConnectProber:
+    """
+    Measure TCP connect() and echo RTTs over many parallel connections.
+
+    Argument : server address, maximum attempts in flight, timeout in seconds
+               and whether to keep a pool of warm connections
+    """
+
+    def __init__(self, address, concurrency=256, timeout=1, warm_pool=False):
+        self.address = address
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.warm_pool = warm_pool
+        self.pool = []  # Open connections kept between rounds in warm pool mode
+        self.connect_stats = RttStats()  # Handshake RTTs; failed handshakes are losses
+        self.echo_stats = RttStats()  # Probe RTTs on established connections
+        self.errors = collections.Counter()  # Failure reason -> count
+        self.sequence = 0
+        self.slots = None
+
+    async def connect(self):
+        """
+        Open one connection and time the handshake.
+
+        Output : connected non-blocking socket, or None if the handshake failed
+        """
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        async with self.slots:
+            start = time.perf_counter_ns()
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock, self.address), self.timeout)
+            except asyncio.TimeoutError:
+                self.errors["timed out"] += 1
+            except OSError as e:
+                self.errors[errno.errorcode.get(e.errno, str(e))] += 1
+            else:
+                self.connect_stats.add((time.perf_counter_ns() - start) / 1e6)
+                return sock
+        sock.close()
+        self.connect_stats.add_loss()
+        return None
+
+    async def _recv_reply(self, sock, sequence, reply):
+        # reply holds the part of an echo read so far; when the timeout cancels
+        # this call after a partial read, the next call on the connection
+        # completes that echo instead of starting mid-way through it
+        loop = asyncio.get_running_loop()
+        while True:
+            if len(reply) < PROBE_HEADER_SIZE:
+                chunk = await loop.sock_recv(sock, PROBE_HEADER_SIZE - len(reply))
+                if not chunk:
+                    raise ConnectionResetError(errno.ECONNRESET, "Connection closed by server")
+                reply += chunk
+                continue
+            probe = parse_probe(reply)
+            reply.clear()
+            if probe is not None and probe[0] == sequence:
+                return
+            # Late reply to a probe that already timed out
+
+    async def echo(self, sock, builder, reply=None):
+        """
+        Send one binary probe on an established connection and time the echo.
+
+        Argument : connected socket, the ProbeBuilder of this connection and
+                   the bytearray holding a partly read echo between probes
+                   (None for a connection that is closed after this probe)
+
+        Output : False if the connection failed and must not be reused
+        """
+        loop = asyncio.get_running_loop()
+        sequence = self.sequence
+        self.sequence += 1
+        start = time.perf_counter_ns()
+        try:
+            await loop.sock_sendall(sock, builder.build(sequence, start))
+            await asyncio.wait_for(self._recv_reply(sock, sequence, bytearray() if reply is None else reply),
+                                   self.timeout)
+        except asyncio.TimeoutError:
+            self.echo_stats.add_loss()  # The server dropped the probe
+            return True
+        except OSError:
+            self.echo_stats.add_loss()
+            return False
+        self.echo_stats.add((time.perf_counter_ns() - start) / 1e6)
+        return True
+
+    async def _probe_cold(self):
+        sock = await self.connect()
+        if sock is not None:
+            await self.echo(sock, ProbeBuilder())
+            sock.close()
+
+    async def _probe_warm(self, entry):
+        if entry is None:
+            sock = await self.connect()
+            if sock is None:
+                return None
+            entry = (sock, ProbeBuilder(), bytearray())
+        if await self.echo(*entry):
+            return entry
+        entry[0].close()
+        return None
+
+    async def run_round(self, connections):
+        """
+        Probe the server over the given number of connections.
+
+        Without a warm pool every connection is opened, probed once and closed.
+        With a warm pool, open connections are reused and only missing ones are
+        opened, so the handshake is measured only when the pool is refilled.
+
+        Argument : number of connections to probe over
+        """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.concurrency)
+        if not self.warm_pool:
+            await asyncio.gather(*(self._probe_cold() for _ in range(connections)))
+            return
+        entries = self.pool + [None] * max(0, connections - len(self.pool))
+        results = await asyncio.gather(*(self._probe_warm(entry) for entry in entries))
+        self.pool = [entry for entry in results if entry is not None]
+
+    def close(self):
+        for sock, _, _ in self.pool:
+            sock.close()
+        self.pool = []
+
+    def report(self):
+        """
+        Format the connect and echo statistics.
+
+        Output : multi-line string
+        """
+        host = "{}:{}".format(*self.address)
+        lines = [self.connect_stats.report("Connect statistics for {}:".format(host))]
+        if self.errors:
+            lines.append("     Failed connects: " + ", ".join(
+                "{} = {}".format(reason, n) for reason, n in self.errors.most_common()))
+        lines.append("")
+        lines.append(self.echo_stats.report("Echo statistics for {}:".format(host)))
+        return "\n".join(lines)
+
+
+async def probe(address, rounds, connections):
+    """
+    Run probe rounds and print a line per round plus the final statistics.
+
+    Argument : server address, number of rounds and connections per round
+
+    Output : the ConnectProber holding the collected statistics
+    """
+    prober = ConnectProber(address, concurrency, timeout, warm_pool)
+    try:
+        for number in range(rounds):
+            if number:
+                await asyncio.sleep(round_interval)
+            connected, failed = prober.connect_stats.count, prober.connect_stats.lost
+            await prober.run_round(connections)
+            print("Round {}: {} new connections, {} failed, {} pooled".format(
+                number, prober.connect_stats.count - connected,
+                prober.connect_stats.lost - failed, len(prober.pool)))
+    finally:
+        prober.close()
+    print("\n")
+    print(prober.report())
+    return prober
+
+
+if __name__ == "__main__":
+    raise_file_limit()
+    rounds = int(input("Set the number of probe rounds: "))
+    connections = int(input("Set the number of connections per round: "))
+    print("Initiating Connect Probes\n")
+    asyncio.run(probe((server_ip, server_port), rounds, connections))
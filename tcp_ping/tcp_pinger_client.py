@@ -11,9 +11,25 @@ DESCRIPTION:
     - Establishes TCP connections to remote servers
     - Sends TCP ping messages and measures round-trip time (RTT)
     - Handles connection-related errors (reset, unreachable, timeouts)
-    - Calculates comprehensive network statistics
+    - Calculates comprehensive network statistics, including RTT percentiles, in constant memory
     - Reports packet loss and connection failures
     - Provides detailed performance metrics (min, max, average RTT)
+    - Sends either legacy text pings or compact binary probes of a chosen size
+    - Optionally frames pings with a length prefix, disables Nagle's algorithm and
+      keeps several pings outstanding, matching replies by sequence number
+    - Optionally times every stage of each ping and profiles the ping loop
+      (ping_common.probe_timing)
+    - Writes its per-ping lines from a background thread, as text, JSON Lines,
+      one line per interval or not at all (ping_common.output_sink)
+    - Optionally appends every result to a columnar results store for later
+      queries (ping_common.results_store)
+    - Optionally serves live per-target counters and RTT histograms to
+      Prometheus in the OpenMetrics format (ping_common.metrics_exporter)
+    - Optionally paces its pings on an absolute schedule and/or a token bucket
+      rate and reports the deviation of the sends from it (ping_common.pacing)
+    - Optionally adapts its timeout to the path from the smoothed RTT and its
+      variance (RFC 6298), matching replies to pings by sequence number
+      (ping_common.adaptive_timeout)
 
 USE CASES:
     - TCP connection establishment and performance testing
@@ -23,77 +39,267 @@ USE CASES:
     - Network troubleshooting and diagnostics
 """
 
+import heapq
+import os
+import sys
 import time
 from socket import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.adaptive_timeout import load_timeout
+from ping_common.metrics_exporter import load_metrics_exporter
+from ping_common.output_sink import load_output_sink
+from ping_common.pacing import load_pacer
+from ping_common.probe_format import ProbeBuilder, echo_sequences, probe_sequence
+from ping_common.probe_timing import load_loop_profiler, load_stage_timer
+from ping_common.resolver import shared_resolver
+from ping_common.results_store import STATUS_ERROR, STATUS_LOST, STATUS_UNREACHABLE, load_results_writer
+from ping_common.rtt_clock import RttClock
+from ping_common.rtt_stats import RttStats, print_on_signal
+from ping_common.tcp_framing import FRAME_PREFIX_SIZE, FrameReader, frame, set_nodelay
+
+clock_source = 'wall'  # 'wall' (time.time), 'monotonic' or 'kernel' (SO_TIMESTAMPNS)
+probe_format = 'text'  # 'text' (legacy 'Ping <n> <time>') or 'binary' (ping_common.probe_format)
+probe_size = 0  # Pad binary probes to this many bytes (0 = 16-byte header only)
+framing = False  # Length-prefixed pings with TCP_NODELAY; the server needs framing = True too
+max_outstanding = 8  # Pings in flight at once in framing mode
+stage_timing = False  # Print per-stage ping timings on exit (or PING_STAGE_TIMING=1)
+profile_output = ''  # Profile the ping loop into this file, .folded = sampling (or PING_PROFILE)
+output_mode = 'text'  # 'text', 'quiet', 'summary', 'interval[=s]' or 'jsonl[=file]'; PING_OUTPUT overrides it
+results_path = ''  # Append every result to this results store directory (or PING_RESULTS)
+metrics_address = ''  # Serve OpenMetrics on this '[host:]port', e.g. '9464' (or PING_METRICS)
+interval = 0.0  # Seconds between ping sends on an absolute schedule, 0 = back to back (or PING_INTERVAL)
+rate_limit = 0  # Maximum pings per second (token bucket), 0 = unlimited (or PING_RATE)
+timeout_mode = 'fixed'  # 'fixed' (client.settimeout) or 'adaptive [floor=20ms] [ceiling=3s]' (or PING_TIMEOUT)
+EXPIRED_PINGS = 64  # Timed out pings whose late replies still update the adaptive timeout
+
+
+def framed_ping(client, num, clock, stats):
+    """
+    Send num framed pings, keeping up to max_outstanding in flight, and match
+    every reply to its ping by sequence number.
+
+    Argument : connected TCP socket, number of pings, the RttClock and the
+               RttStats that receive the RTTs and losses
+    """
+    reader = FrameReader()
+    sent_at = {}  # Sequence number -> send time, for pings still in flight
+    expired = {}  # Sequence number -> send time, for recently timed out pings
+    deadlines = []  # Heap of (deadline, sequence); the timeout may shrink between sends
+    i = 0
+
+    try:
+        while i < num or sent_at:
+            # Fill the window
+            while i < num and len(sent_at) < max_outstanding:
+                pacer.wait()
+                if probe_format == 'binary':
+                    start_time = clock.now()
+                    payload = builder.build(i, start_time)
+                    message = bytes(payload)  # Described by the output sink
+                else:
+                    message = 'Ping ' + str(i) + " " + time.ctime()
+                    payload = message.encode("utf-8")
+                    start_time = clock.now()
+                client.sendall(frame(payload))
+                metrics.probe_sent()
+                sink.record("sent", "Sent {message}", seq=i, message=message)
+                sent_at[i] = start_time
+                heapq.heappush(deadlines, (start_time + probe_timeout.timeout_ns, i))
+                i += 1
+
+            # Expire pings whose replies did not arrive in time
+            now = clock.now()
+            while deadlines and deadlines[0][0] <= now:
+                deadline, seq = heapq.heappop(deadlines)
+                start_time = sent_at.pop(seq, None)
+                if start_time is not None:
+                    stats.add_loss()
+                    probe_timeout.expired((deadline - start_time) / 1e9)
+                    expired[seq] = start_time
+                    if len(expired) > EXPIRED_PINGS:
+                        del expired[next(iter(expired))]
+                    results.append(target, seq, status=STATUS_LOST)
+                    metrics.loss()
+                    sink.record("lost", "#{seq} Request timed out for the packet\n", seq=seq)
+            if not sent_at:
+                continue
+
+            client.settimeout(max(deadlines[0][0] - now, 0) / 1e9 or 1e-6)
+            try:
+                nbytes, end_time = clock.recv_into(client, reader.space())
+            except timeout:
+                continue
+            if not nbytes:
+                raise ConnectionResetError("Connection closed by server")
+            reader.filled(nbytes)
+            for reply in reader.frames():
+                reply = reply[FRAME_PREFIX_SIZE:]
+                seq = probe_sequence(reply)
+                start_time = sent_at.pop(seq, None)
+                if start_time is None:
+                    # Late reply to a ping that already timed out: lost, but still an RTT sample
+                    start_time = expired.pop(seq, None)
+                    if start_time is not None:
+                        probe_timeout.sample((end_time - start_time) / 1e6)
+                    continue
+                rtt = (end_time - start_time) / 1e6  # RTT in milliseconds
+                stats.add(rtt)
+                probe_timeout.sample(rtt)
+                results.append(target, seq, rtt)
+                metrics.reply(rtt)
+                sink.record("received", "Received {reply}", seq=seq, reply=bytes(reply), rtt_ms=rtt)
+    except OSError as e:
+        # Pings in flight and not yet sent are lost with the connection
+        stats.add_loss(len(sent_at) + num - i)
+        metrics.loss(len(sent_at) + num - i)
+        for seq in list(sent_at) + list(range(i, num)):
+            results.append(target, seq, status=STATUS_ERROR)
+        sink.message("Connection error: {}\n".format(e))
+
+
 # Create a TCP socket
 client = socket(AF_INET, SOCK_STREAM)
 
 # Set a timeout of 1 second
 client.settimeout(1)
+probe_timeout = load_timeout(timeout_mode, client.gettimeout())  # Adapts to the RTT if configured
 server_ip = '127.0.0.1'
 
 # Server address and port
-server_address = (server_ip, 14008)
+server_address = (shared_resolver().resolve(server_ip), 14008)
+target = "tcp:{}:{}".format(*server_address)  # Target name in the results store and metrics
 
 # Establish a connection to the server
 client.connect(server_address)
 
+clock = RttClock(clock_source)
+clock.enable(client)
+builder = ProbeBuilder(probe_size)
+if framing:
+    set_nodelay(client)
+
 # Ask the user to set the number of ping operations
 num = int(input("Set the number of ping operations: "))
 
-print("Initiating Ping\n")
+# Per-ping lines are queued here and written by a background thread
+sink = load_output_sink(output_mode)
+sink.message("Initiating Ping\n")
+
+# Every result is also appended to the results store, if one is configured
+results = load_results_writer(results_path)
+
+# Live counters and RTT histograms for Prometheus, if an address is configured
+metrics = load_metrics_exporter(metrics_address).target(target)
 
-# Track RTTs and packet loss
-rtt_time = []
-packet_lost = 0
+# Track RTTs and packet loss in constant memory; kill -USR1 prints them
+stats = RttStats()
+print_on_signal(stats, "Ping statistics for {} so far:".format(server_ip))
 
-for i in range(num+1):
+# Sends on an absolute schedule, if an interval or rate limit is configured
+pacer = load_pacer(interval, rate_limit)
+
+# Per-stage timings of the unframed pings and the optional profiler of the ping loop
+timer = load_stage_timer(stage_timing)
+profiler = load_loop_profiler(profile_output)
+profiler.start()
+
+if framing:
+    framed_ping(client, num + 1, clock, stats)
+
+# Unframed echoes not yet matched to a ping; a read may hold several, or part of one
+echoes = bytearray()
+echo_size = builder.size if probe_format == 'binary' else 0
+
+for i in range(0 if framing else num+1):
+    pacer.wait()
+    timer.start()
     # Prepare the ping message
-    start_time = time.time()
-    message = 'Ping ' + str(i) + " " + time.ctime(start_time)
+    if probe_format == 'binary':
+        start_time = clock.now()
+        payload = builder.build(i, start_time)
+        message = bytes(payload)  # Described by the output sink
+    else:
+        message = 'Ping ' + str(i) + " " + time.ctime()
+        payload = message.encode("utf-8")
+        start_time = clock.now()
+    timer.mark("build")
     try:
         # Send the message to the server
-        sent = client.send(message.encode("utf-8"))
-        print("Sent " + message)
+        client.settimeout(probe_timeout.timeout)
+        wait_until = time.monotonic() + probe_timeout.timeout
+        sent = client.send(payload)
+        timer.mark("send")
+        metrics.probe_sent()
+        sink.record("sent", "Sent {message}", seq=i, message=message)
+        timer.mark("output")
 
-        # Receive the response from the server
-        response = client.recv(1024)
-        print("Received " + str(response.decode("utf-8")))
-        
+        # Receive the response from the server, skipping late replies to
+        # earlier pings that already timed out
+        response, end_time = clock.recv(client, 2048)
+        while True:
+            if not response:
+                raise ConnectionResetError("Connection closed by server")
+            echoes += response
+            sequences, used = echo_sequences(echoes, echo_size)
+            del echoes[:used]
+            if i in sequences:
+                break
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                raise timeout
+            client.settimeout(remaining)
+            response, end_time = clock.recv(client, 2048)
+        timer.mark("wait")
 
         # Calculate RTT in milliseconds
-        rtt = (time.time() - start_time)
-        rtt_time.append(rtt)
+        rtt = (end_time - start_time) / 1e6
+        stats.add(rtt)
+        probe_timeout.sample(rtt)
+        results.append(target, i, rtt)
+        metrics.reply(rtt)
+        timer.mark("receive")
+        sink.record("received", "Received {reply}", seq=i, reply=response, rtt_ms=rtt)
 
+    except timeout:
+        # Handle timeout (packet loss)
+        # print("Sent " + message)
+        timer.mark("wait")
+        stats.add_loss()
+        probe_timeout.expired()
+        results.append(target, i, status=STATUS_LOST)
+        metrics.loss()
+        sink.record("lost", "#{seq} Request timed out for the packet\n", seq=i)
     except ConnectionResetError:
         # print("Sent " + message)
-        print("ICMP Error: Destination Unreachable\n")
-        packet_lost += 1
+        timer.mark("wait")
+        sink.record("error", "ICMP Error: {error}\n", seq=i, error="Destination Unreachable")
+        stats.add_loss()
+        results.append(target, i, status=STATUS_UNREACHABLE)
+        metrics.loss()
     except OSError:
         # print("Sent " + message)
-        print("ICMP Error: Port Unreachable\n")
-        packet_lost += 1
-    except timeout:
-        # Handle timeout (packet loss)
-        # print("Sent " + message)
-        packet_lost += 1
-        print("#" + str(i) + " Request timed out for the packet\n")
-
-# Calculate and print the minimum, maximum, and average RTTs after all pings are done
-if rtt_time:
-    minimum_rtt = min(rtt_time)
-    maximun_rtt = max(rtt_time)
-    average_rtt = sum(rtt_time) / len(rtt_time)
-    packet_loss_rate = (packet_lost / num) * 100
-    # Print all stats in one line at the end
-    print("\n")
-    print("Ping statistics for {}:".format(server_ip))
-    print("     Packets: Sent = {}, Received = {}, Lost = {} ({}% loss)".format(num, num-packet_lost, packet_lost, packet_loss_rate))
-    print("Approximate round trip times in milli-seconds:")
-    print("     Minimum: {:.2f} ms, Maximum: {:.2f} ms, Average: {:.2f} ms\n".format(minimum_rtt, maximun_rtt, average_rtt))
+        timer.mark("wait")
+        sink.record("error", "ICMP Error: {error}\n", seq=i, error="Port Unreachable")
+        stats.add_loss()
+        results.append(target, i, status=STATUS_UNREACHABLE)
+        metrics.loss()
+    timer.mark("output")
+    timer.finish()
+
+profiler.stop()
+results.flush()
+
+# Print the minimum, maximum, average and percentile RTTs after all pings are done
+if stats.count:
+    sink.message("\n")
+    sink.summary(stats, "Ping statistics for {}:".format(server_ip),
+                 "Clock source: {}\n".format(clock.describe())
+                 + ("Timeout: {}\n".format(probe_timeout.describe()) if probe_timeout.adaptive else ""))
 else:
-    print("Ping attempts failed.\n")
+    sink.message("Ping attempts failed.\n")
+if pacer.enabled:
+    sink.message(pacer.report() + "\n")
 
 # Close the client socket
 client.close()
@@ -23,9 +23,14 @@ USE CASES:
     - Connection resilience testing
 """
 
+import os
+import sys
 import time
 from socket import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.rtt_stats import RttStats, print_on_signal
+
 # Create a TCP socket
 client = socket(AF_INET, SOCK_STREAM)
 
@@ -44,9 +49,9 @@ num = int(input("Set the number of ping operations: "))
 
 print("Initiating Ping\n")
 
-# Track RTTs and packet loss
-rtt_time = []
-packet_lost = 0
+# Track RTTs and packet loss in constant memory; kill -USR1 prints them
+stats = RttStats()
+print_on_signal(stats, "Ping statistics for {} so far:".format(server_ip))
 
 for i in range(num+1):
     # Prepare the ping message
@@ -63,35 +68,28 @@ for i in range(num+1):
         
 
         # Calculate RTT in milliseconds
-        rtt = (time.time() - start_time)
-        rtt_time.append(rtt)
+        rtt = (time.time() - start_time) * 1000
+        stats.add(rtt)
 
     except ConnectionResetError:
         # print("Sent " + message)
         print("ICMP Error: Destination Unreachable\n")
-        packet_lost += 1
+        stats.add_loss()
     except OSError:
         # print("Sent " + message)
         print("ICMP Error: Port Unreachable\n")
-        packet_lost += 1
+        stats.add_loss()
     except timeout:
         # Handle timeout (packet loss)
         # print("Sent " + message)
-        packet_lost += 1
+        stats.add_loss()
         print("#" + str(i) + " Request timed out for the packet\n")
 
-# Calculate and print the minimum, maximum, and average RTTs after all pings are done
-if rtt_time:
-    minimum_rtt = min(rtt_time)
-    maximun_rtt = max(rtt_time)
-    average_rtt = sum(rtt_time) / len(rtt_time)
-    packet_loss_rate = (packet_lost / num) * 100
-    # Print all stats in one line at the end
+# Print the minimum, maximum, average and percentile RTTs after all pings are done
+if stats.count:
     print("\n")
-    print("Ping statistics for {}:".format(server_ip))
-    print("     Packets: Sent = {}, Received = {}, Lost = {} ({}% loss)".format(num, num-packet_lost, packet_lost, packet_loss_rate))
-    print("Approximate round trip times in milli-seconds:")
-    print("     Minimum: {:.2f} ms, Maximum: {:.2f} ms, Average: {:.2f} ms\n".format(minimum_rtt, maximun_rtt, average_rtt))
+    print(stats.report("Ping statistics for {}:".format(server_ip)))
+    print("")
 else:
     print("Ping attempts failed.\n")
 
@@ -11,9 +11,14 @@ DESCRIPTION:
     - Listens for incoming TCP connections from clients
     - Accepts multiple client connections sequentially
     - Echoes received messages back to clients
+    - Optionally reads length-prefixed frames, so pings merged or split by TCP
+      are echoed one by one
     - Simulates packet loss by dropping random packets
+    - Optionally delays, reorders and duplicates replies (ping_common.impairment)
     - Handles connection errors gracefully
     - Demonstrates TCP connection management and error recovery
+    - Logs messages through a background writer, or as JSON Lines, interval
+      summaries or not at all (ping_common.output_sink)
 
 USE CASES:
     - TCP server implementation and testing
@@ -23,9 +28,21 @@ USE CASES:
     - Performance testing of TCP-based applications
 """
 
+import os
 import random
+import sys
 from socket import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.impairment import load_impairment
+from ping_common.output_sink import load_output_sink
+from ping_common.probe_format import echo_reply
+from ping_common.tcp_framing import FRAME_PREFIX_SIZE, FrameReader, set_nodelay
+
+framing = False  # Expect length-prefixed frames (ping_common.tcp_framing) and set TCP_NODELAY
+impairment_spec = ''  # tc-netem style (ping_common.impairment), e.g. 'delay 20ms loss 5%'; PING_IMPAIRMENT overrides it
+output_mode = 'text'  # 'text', 'quiet', 'summary', 'interval[=s]' or 'jsonl[=file]'; PING_OUTPUT overrides it
+
 # Create a TCP socket
 serverSocket = socket(AF_INET, SOCK_STREAM)
 
@@ -35,39 +52,67 @@ serverSocket.bind(('127.0.0.1', 14008))
 # Start listening for incoming connections
 serverSocket.listen(5)
 
-print("TCP server up and listening...")
+impairment = load_impairment(impairment_spec)
+
+# The per-message log is written by a background thread
+sink = load_output_sink(output_mode)
+
+sink.message("TCP server up and listening...")
 cnt = 0
+buffer = bytearray(2048)  # Reused for every message
+view = memoryview(buffer)
 
 while cnt < 10:
     cnt += 1
     # Accept a new client connection
     connectionSocket, address = serverSocket.accept()
-    print(f"Connection established with {address}")
+    sink.message(f"Connection established with {address}")
 
     try:
         c = 0
+        if framing:
+            set_nodelay(connectionSocket)
+            reader = FrameReader()
         while c < 100:
             # Generate a random number between 1 and 10
             c += 1
 
-            # Receive the message from the client
-            message = connectionSocket.recv(1024)
-
-            if not message:
+            if framing:
+                if not impairment.recv(connectionSocket, lambda: reader.recv(connectionSocket)):
+                    break
+                # Echo every complete frame; the length prefix is sent back as received
+                for frame in reader.frames():
+                    payload = frame[FRAME_PREFIX_SIZE:]
+                    reply = echo_reply(payload)
+                    if reply is not payload:
+                        payload[:] = reply  # Uppercased text has the same length
+                    for _ in range(impairment.apply(frame, connectionSocket)):
+                        connectionSocket.sendall(frame)
+                    sink.record("responded", "Packet from {client} responded: {message}",
+                                client=address, message=bytes(payload))
+                continue
+
+            # Receive the message from the client into the reusable buffer,
+            # sending delayed replies while waiting
+            nbytes = impairment.recv(connectionSocket, lambda: connectionSocket.recv_into(buffer))
+
+            if not nbytes:
                 # If no message is received, break out of the loop
                 break
 
-            # Capitalize the message from the client
-            message = message.upper()
+            # Echo binary probes unchanged; capitalize legacy text messages
+            message = echo_reply(view[:nbytes])
 
-            # Otherwise, the server responds
-            connectionSocket.send(message)
-            print(f"Packet from {address} responded: {message.decode()}")
+            # Otherwise, the server responds (unless the impairment drops or delays the reply)
+            for _ in range(impairment.apply(message, connectionSocket)):
+                connectionSocket.send(message)
+            sink.record("responded", "Packet from {client} responded: {message}",
+                        client=address, message=bytes(message))
 
     except Exception as e:
-        print(f"Error handling request from {address}: {e}")
+        sink.message(f"Error handling request from {address}: {e}")
 
     finally:
         # Close the connection with the client after the loop ends
         connectionSocket.close()
-        print(f"Connection with {address} closed.")
+        sink.message(f"Connection with {address} closed.")
@@ -0,0 +1,306 @@
+"""
+Network Diagnostics: Event-Loop TCP Pinger Server
+
+PROBLEM STATEMENT:
+    The multithreaded TCP server starts one OS thread per connection, stops
+    accepting after 10 clients and closes every connection after 100 messages.
+    That rules it out as a long-running target for connection-heavy probing.
+
+DESCRIPTION:
+    This module implements a single-threaded, event-driven TCP ping server that:
+    - Multiplexes all connections on one selectors event loop, with no thread per connection
+    - Handles tens of thousands of concurrent keep-alive connections in one process
+    - Echoes binary probes unchanged and uppercases legacy text, like the other servers
+    - Keeps the random response drop of tcp_pinger_server_threaded.py, with optional
+      delay, reordering and duplication on a timer wheel (ping_common.impairment)
+    - Makes the connection and per-connection message limits configurable (or unlimited)
+    - Buffers replies that do not fit in the socket and sends them when it is writable
+    - Optionally reads length-prefixed frames, with a small per-connection reassembly buffer
+    - Stops watching the listener for a moment when accept() fails (e.g. out of
+      file descriptors), instead of spinning on the connection left in the backlog
+    - Prints a periodic summary of connections and messages
+    - Logs packets, when asked to, through a background writer, as text, JSON
+      Lines or interval summaries (ping_common.output_sink)
+
+USE CASES:
+    - Long-running target for TCP connect and echo probes
+    - Load testing with many concurrent clients
+    - Keep-alive connection scalability testing
+"""
+
+import os
+import selectors
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.impairment import load_impairment
+from ping_common.output_sink import load_output_sink
+from ping_common.probe_format import echo_reply
+from ping_common.tcp_framing import FRAME_PREFIX_SIZE, FrameReader, set_nodelay
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+server_ip = '127.0.0.1'
+server_port = 14008
+max_connections = None  # Stop accepting after this many connections (None = never)
+max_messages = None  # Close a connection after this many messages (None = never)
+impairment_spec = 'loss 20%'  # tc-netem style (ping_common.impairment); PING_IMPAIRMENT overrides it
+log_packets = False  # Log every connection and packet like the threaded server
+output_mode = 'text'  # 'text', 'quiet', 'summary', 'interval[=s]' or 'jsonl[=file]'; PING_OUTPUT overrides it
+summary_interval = 5  # Seconds between summaries
+framing = False  # Expect length-prefixed frames (ping_common.tcp_framing) and set TCP_NODELAY
+listen_backlog = 4096
+accept_backoff = 1.0  # Seconds to stop accepting after accept() failed, unless a connection closes first
+
+
+class Connection:
+    """
+    State of one client connection.
+    """
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.messages = 0
+        self.outgoing = bytearray()  # Replies waiting for the socket to become writable
+        self.reader = FrameReader() if framing else None  # Partial frames between reads
+
+
+class EventLoopServer:
+    """
+    Echo TCP pings for many connections on one selectors event loop.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.buffer = bytearray(65536)  # One receive buffer shared by all connections
+        self.view = memoryview(self.buffer)
+        self.accepted = 0
+        self.active = 0
+        self.received = 0
+        self.responded = 0
+        self.impairment = load_impairment(impairment_spec)
+        self.sink = load_output_sink(output_mode)  # Written by a background thread
+        self.started = time.time()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((server_ip, server_port))
+        self.listener.listen(listen_backlog)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.resumeAccepting = None  # time.monotonic() at which a paused listener is watched again
+        self.acceptFailing = False  # accept() failed since the last accepted connection
+
+    def accept(self):
+        while max_connections is None or self.accepted < max_connections:
+            try:
+                sock, address = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.pause_accepting(e)  # e.g. out of file descriptors
+                return
+            if self.acceptFailing:
+                self.acceptFailing = False
+                self.sink.message("Accepting connections again")
+            sock.setblocking(False)
+            if framing:
+                set_nodelay(sock)
+            self.accepted += 1
+            self.active += 1
+            self.selector.register(sock, selectors.EVENT_READ, Connection(sock, address))
+            if log_packets:
+                self.sink.record("connected", "Connection established with {client}", client=address)
+        # Limit reached: stop listening, keep serving the open connections
+        self.selector.unregister(self.listener)
+        self.listener.close()
+        self.listener = None
+
+    def pause_accepting(self, error):
+        """
+        Stop watching the listener until a connection closes or accept_backoff
+        has passed: the failed connection stays in the backlog, so the listener
+        would be readable again at once.
+        """
+        self.selector.unregister(self.listener)
+        self.resumeAccepting = time.monotonic() + accept_backoff
+        if not self.acceptFailing:
+            self.acceptFailing = True
+            self.sink.message(f"Error accepting connection: {error}; retrying when a connection "
+                              f"closes or after {accept_backoff:g} s")
+
+    def resume_accepting(self):
+        if self.resumeAccepting is not None:
+            self.resumeAccepting = None
+            self.selector.register(self.listener, selectors.EVENT_READ)
+
+    def close(self, conn):
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+        self.active -= 1
+        self.resume_accepting()  # A file descriptor is free again
+        if log_packets:
+            self.sink.record("closed", "Connection with {client} closed.", client=conn.address)
+
+    def read(self, conn):
+        try:
+            nbytes = conn.sock.recv_into(conn.reader.space() if framing else self.buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.sink.message(f"Error handling request from {conn.address}: {e}")
+            self.close(conn)
+            return
+        if not nbytes:
+            self.close(conn)
+            return
+
+        if framing:
+            conn.reader.filled(nbytes)
+            messages = conn.reader.frames()
+        else:
+            messages = (self.view[:nbytes],)
+        for message in messages:
+            conn.messages += 1
+            self.received += 1
+            if not self.respond(conn, message):
+                return  # Connection failed and was closed
+            if max_messages is not None and conn.messages >= max_messages:
+                self.flush_and_close(conn)
+                return
+
+    def respond(self, conn, message):
+        """
+        Echo one message, unless the impairment drops or delays the reply.
+
+        Output : False if the connection failed and was closed
+        """
+        payload = message[FRAME_PREFIX_SIZE:] if framing else message
+        reply = echo_reply(payload)
+        if framing:
+            if reply is not payload:
+                payload[:] = reply  # Uppercased text has the same length
+            reply = message  # The length prefix is sent back as received
+        # Simulate packet loss by not responding, like handle_client(); delayed replies come back from due()
+        copies = self.impairment.apply(reply, conn)
+        if not copies:
+            if log_packets:
+                self.sink.record("dropped", "Packet from {client} lost or delayed", client=conn.address)
+            return True
+        for _ in range(copies):
+            if not self.write(conn, reply):
+                return False
+        self.responded += copies
+        if log_packets:
+            self.sink.record("responded", "Packet from {client} responded: {message}",
+                             client=conn.address, message=bytes(payload if framing else reply))
+        return True
+
+    def send_delayed(self):
+        for reply, conn in self.impairment.due():
+            if conn.sock.fileno() == -1:
+                continue  # The connection closed while the reply was delayed
+            if self.write(conn, reply):
+                self.responded += 1
+
+    def write(self, conn, data):
+        """
+        Send data now, or queue what does not fit until the socket is writable.
+
+        Output : False if the connection failed and was closed
+        """
+        if not conn.outgoing:
+            try:
+                sent = conn.sock.send(data)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self.close(conn)
+                return False
+            if sent == len(data):
+                return True
+            data = data[sent:]
+            self.selector.modify(conn.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, conn)
+        conn.outgoing += data
+        return True
+
+    def drain(self, conn):
+        try:
+            sent = conn.sock.send(conn.outgoing)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.close(conn)
+            return
+        del conn.outgoing[:sent]
+        if not conn.outgoing:
+            if max_messages is not None and conn.messages >= max_messages:
+                self.close(conn)
+            else:
+                self.selector.modify(conn.sock, selectors.EVENT_READ, conn)
+
+    def flush_and_close(self, conn):
+        if conn.outgoing:
+            self.selector.modify(conn.sock, selectors.EVENT_WRITE, conn)  # drain() closes it
+        else:
+            self.close(conn)
+
+    def print_summary(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        self.sink.message(f"\nServer statistics after {elapsed:.1f} s:\n"
+                          f"     Connections: Accepted = {self.accepted}, Active = {self.active}\n"
+                          f"     Messages: Received = {self.received}, Responded = {self.responded} "
+                          f"({self.received / elapsed:.0f} messages/s)\n"
+                          f"     {self.impairment.describe()}")
+
+    def serve(self):
+        nextSummary = time.time() + summary_interval
+        while self.listener is not None or self.active:
+            timeout = max(0.0, nextSummary - time.time())
+            delayed = self.impairment.next_timeout()
+            if delayed is not None:
+                timeout = min(timeout, delayed)
+            if self.resumeAccepting is not None:
+                timeout = min(timeout, max(0.0, self.resumeAccepting - time.monotonic()))
+            for key, events in self.selector.select(timeout=timeout):
+                if key.data is None:
+                    self.accept()
+                    continue
+                conn = key.data
+                if events & selectors.EVENT_WRITE:
+                    self.drain(conn)
+                if events & selectors.EVENT_READ and conn.sock.fileno() != -1:
+                    self.read(conn)
+            self.send_delayed()
+            if self.resumeAccepting is not None and time.monotonic() >= self.resumeAccepting:
+                self.resume_accepting()
+            if time.time() >= nextSummary:
+                self.print_summary()
+                nextSummary += summary_interval
+        self.print_summary()
+
+
+def raise_file_limit():
+    """
+    Raise the open file limit to the hard limit so that 10k+ sockets fit.
+    """
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+if __name__ == "__main__":
+    raise_file_limit()
+    server = EventLoopServer()
+    server.sink.message("TCP server with event loop up and listening...")
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        server.print_summary()
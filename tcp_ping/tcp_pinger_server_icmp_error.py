@@ -12,7 +12,7 @@ DESCRIPTION:
     - Responds to valid ping requests
     - Simulates ICMP Destination Unreachable errors
     - Simulates ICMP Port Unreachable errors
-    - Uses raw sockets to send ICMP error packets
+    - Sends ICMP error packets over one long-lived raw socket (ping_common.icmp_emitter)
     - Validates client error handling capabilities
 
 USE CASES:
@@ -23,26 +23,18 @@ USE CASES:
     - Diagnostic tool development
 """
 
+import os
 import random
-import struct
+import sys
 from socket import *
 import threading
 
-def checksum(data):
-    s = 0
-    for i in range(0, len(data), 2):
-        w = (data[i] << 8) + (data[i+1] if i+1 < len(data) else 0)
-        s = s + w
-    s = (s >> 16) + (s & 0xffff)
-    s = ~s & 0xffff
-    return s
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.icmp_emitter import IcmpErrorEmitter
+from ping_common.probe_format import describe, echo_reply
 
-def create_icmp_packet(type, code):
-    # Type 3 is Destination Unreachable, type 11 is Time Exceeded, etc.
-    header = struct.pack('bbHHh', type, code, 0, 0, 0)
-    my_checksum = checksum(header)
-    header = struct.pack('bbHHh', type, code, my_checksum, 0, 0)
-    return header
+# One raw socket for every ICMP error; type 3 is Destination Unreachable, type 11 is Time Exceeded, etc.
+emitter = IcmpErrorEmitter('127.0.0.1')
 
 # Bind the TCP socket
 serverSocket = socket(AF_INET, SOCK_STREAM)
@@ -51,6 +43,8 @@ serverSocket.listen(5)
 
 print("TCP server up and listening...")
 cnt = 0
+buffer = bytearray(2048)  # Reused for every message
+view = memoryview(buffer)
 
 while cnt < 10:
     cnt += 1
@@ -62,30 +56,26 @@ while cnt < 10:
         while c < 100:
             c += 1
             rand = random.randint(1, 10)
-            message = connectionSocket.recv(1024)
+            nbytes = connectionSocket.recv_into(buffer)
             
-            if not message:
+            if not nbytes:
                 break
 
-            message = message.upper()
+            message = echo_reply(view[:nbytes])  # Binary probes unchanged, legacy text uppercased
             
             if rand < 7:
                 connectionSocket.send(message)
-                print(f"Packet from {address} responded: {message.decode()}")
+                print(f"Packet from {address} responded: {describe(message)}")
                 
             elif rand >= 7 and rand <= 8:
                 print(f"Sending ICMP Destination Unreachable to {address} (rand={rand})")
-                icmp_packet = create_icmp_packet(3, 1)  # Type 3 (Destination Unreachable), Code 1 (Host Unreachable)
-                rawSocket = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
-                rawSocket.sendto(icmp_packet, address)
-                rawSocket.close()
+                # Type 3 (Destination Unreachable), Code 1 (Host Unreachable)
+                emitter.send(3, 1, address, connectionSocket.getsockname(), view[:nbytes], IPPROTO_TCP)
                 
             elif rand > 8:
                 print(f"Sending ICMP Port Unreachable to {address} (rand={rand})")
-                icmp_packet = create_icmp_packet(3, 3)  # Type 3 (Destination Unreachable), Code 3 (Port Unreachable)
-                rawSocket = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
-                rawSocket.sendto(icmp_packet, address)
-                rawSocket.close()
+                # Type 3 (Destination Unreachable), Code 3 (Port Unreachable)
+                emitter.send(3, 3, address, connectionSocket.getsockname(), view[:nbytes], IPPROTO_TCP)
             
     except Exception as e:
         print(f"Error handling request from {address}: {e}")
@@ -11,9 +11,13 @@ DESCRIPTION:
     - Accepts multiple concurrent TCP client connections
     - Spawns a new thread for each client connection
     - Echoes received messages back to clients
-    - Simulates packet loss by randomly dropping responses
+    - Simulates packet loss by randomly dropping responses, and optionally delays,
+      reorders and duplicates them, per connection (ping_common.impairment)
+    - Optionally reads length-prefixed frames and drops or echoes each frame on its own
     - Handles connection errors in individual threads
     - Provides scalable server architecture for testing
+    - Logs messages from all threads through one background writer, or as JSON
+      Lines, interval summaries or not at all (ping_common.output_sink)
 
 USE CASES:
     - Multithreaded server implementation and testing
@@ -23,46 +27,78 @@ USE CASES:
     - Realistic server simulation with packet loss
 """
 
-import random
+import os
+import sys
 from socket import *
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.impairment import load_impairment
+from ping_common.output_sink import load_output_sink
+from ping_common.probe_format import echo_reply
+from ping_common.tcp_framing import FRAME_PREFIX_SIZE, FrameReader, set_nodelay
+
+framing = False  # Expect length-prefixed frames (ping_common.tcp_framing) and set TCP_NODELAY
+impairment_spec = 'loss 20%'  # tc-netem style (ping_common.impairment); PING_IMPAIRMENT overrides it
+output_mode = 'text'  # 'text', 'quiet', 'summary', 'interval[=s]' or 'jsonl[=file]'; PING_OUTPUT overrides it
+
+def respond(connectionSocket, address, impairment, reply, payload):
+    # Simulate packet loss (and delay, reordering, duplication) of the reply
+    copies = impairment.apply(reply, connectionSocket)
+    if not copies:
+        sink.record("dropped", "Packet from {client} lost or delayed", client=address)
+        return
+    for _ in range(copies):
+        connectionSocket.sendall(reply)
+    sink.record("responded", "Packet from {client} responded: {message}", client=address, message=bytes(payload))
+
+def handle_frames(connectionSocket, address, reader, impairment):
+    # Echo every complete frame; the length prefix is sent back as received
+    for frame in reader.frames():
+        payload = frame[FRAME_PREFIX_SIZE:]
+        reply = echo_reply(payload)
+        if reply is not payload:
+            payload[:] = reply  # Uppercased text has the same length
+        respond(connectionSocket, address, impairment, frame, payload)
+
 # Function to handle each client connection
-def handle_client(connectionSocket, address):
-    print(f"Connection established with {address}")
+def handle_client(connectionSocket, address, impairment):
+    sink.message(f"Connection established with {address}")
+    buffer = bytearray(2048)  # Reused for every message on this connection
+    view = memoryview(buffer)
     
     try:
         c = 0
+        if framing:
+            set_nodelay(connectionSocket)
+            reader = FrameReader()
         while c < 100:
             c += 1
-            # Generate a random number between 1 and 10
-            rand = random.randint(1, 10)
+            if framing:
+                if not impairment.recv(connectionSocket, lambda: reader.recv(connectionSocket)):
+                    break
+                handle_frames(connectionSocket, address, reader, impairment)
+                continue
 
-            # Receive the message from the client
-            message = connectionSocket.recv(1024)
+            # Receive the message from the client into the reusable buffer,
+            # sending delayed replies while waiting
+            nbytes = impairment.recv(connectionSocket, lambda: connectionSocket.recv_into(buffer))
 
-            if not message:
+            if not nbytes:
                 # If no message is received, break out of the loop
                 break
 
-            # Capitalize the message from the client
-            message = message.upper()
-
-            # Simulate packet loss by not responding if rand > 8
-            if rand > 8:
-                print(f"Packet from {address} lost (rand={rand})")
-            else:
-                # Otherwise, the server responds
-                connectionSocket.send(message)
-                print(f"Packet from {address} responded: {message.decode()}")
+            # Echo binary probes unchanged; capitalize legacy text messages
+            message = echo_reply(view[:nbytes])
+            respond(connectionSocket, address, impairment, message, message)
 
     except Exception as e:
-        print(f"Error handling request from {address}: {e}")
+        sink.message(f"Error handling request from {address}: {e}")
 
     finally:
         # Close the connection with the client after the loop ends
         connectionSocket.close()
-        print(f"Connection with {address} closed.")
+        sink.message(f"Connection with {address} closed.")
 
 # Create a TCP socket
 serverSocket = socket(AF_INET, SOCK_STREAM)
@@ -73,7 +109,13 @@ serverSocket.bind(('127.0.0.1', 14008))
 # Start listening for incoming connections
 serverSocket.listen(5)
 
-print("TCP server with threading support up and listening...")
+# Every connection gets its own copy (loss state, random sequence, timer wheel)
+impairment = load_impairment(impairment_spec)
+
+# One background writer for the log lines of every connection thread
+sink = load_output_sink(output_mode)
+
+sink.message("TCP server with threading support up and listening...")
 cnt = 0
 
 while cnt < 10:
@@ -82,5 +124,6 @@ while cnt < 10:
     connectionSocket, address = serverSocket.accept()
 
     # Start a new thread to handle the client
-    client_thread = threading.Thread(target=handle_client, args=(connectionSocket, address))
+    client_thread = threading.Thread(target=handle_client,
+                                     args=(connectionSocket, address, impairment.fork(cnt)))
     client_thread.start()
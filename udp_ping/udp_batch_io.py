@@ -0,0 +1,318 @@
+"""
+Network Diagnostics: Batched UDP Datagram I/O
+
+PROBLEM STATEMENT:
+    The UDP pinger client and server make one system call per datagram
+    (sendto/recvfrom). In flood tests the system call overhead, not the network,
+    sets the ceiling on the packet rate.
+
+DESCRIPTION:
+    This module implements a batched datagram layer that:
+    - Calls Linux recvmmsg()/sendmmsg() through ctypes
+    - Moves up to 64 datagrams per system call
+    - Receives into and sends from buffers that are allocated once
+    - Echoes received datagrams straight from the receive buffers (zero copy)
+    - Decodes and encodes IPv4 socket addresses without extra system calls
+    - Falls back to one recvfrom()/sendto() per datagram when the calls are unavailable
+    - Honours the socket timeout in both modes
+    - Checks itself on loopback, a full batch echoed with every reply
+      duplicated included (python3 udp_ping/udp_batch_io.py)
+
+USE CASES:
+    - High packet rate UDP echo servers
+    - UDP flood clients for load and loss testing
+    - Reducing system call overhead in packet processing loops
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import socket
+import struct
+
+BATCH_SIZE = 64
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_iovec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_mmsg():
+    """
+    Look up recvmmsg() and sendmmsg() in the C library.
+
+    Output : (recvmmsg, sendmmsg) or (None, None) if they are not available
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        recvmmsg, sendmmsg = libc.recvmmsg, libc.sendmmsg
+    except (OSError, AttributeError):
+        return None, None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return recvmmsg, sendmmsg
+
+
+_recvmmsg, _sendmmsg = _load_mmsg()
+_sockaddr_in = struct.Struct("=H")  # sin_family in host byte order, followed by the port
+
+
+def _encode_address(address):
+    ip, port = address
+    return _sockaddr_in.pack(socket.AF_INET) + struct.pack("!H", port) + socket.inet_aton(ip) + bytes(8)
+
+
+def _decode_address(raw):
+    return socket.inet_ntoa(raw[4:8]), struct.unpack("!H", raw[2:4])[0]
+
+
+class DatagramBatch:
+    """
+    Receive and send UDP datagrams in batches on an IPv4 socket.
+
+    After recv() returns n, message(i), view(i) and address(i) give the i-th
+    datagram for i < n until the next call to recv().
+
+    Argument : UDP socket, datagrams per batch, buffer size per datagram and
+               whether to use recvmmsg/sendmmsg when they are available
+    """
+
+    def __init__(self, sock, batch_size=BATCH_SIZE, buffer_size=2048, use_mmsg=True):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.batched = use_mmsg and _recvmmsg is not None and sock.family == socket.AF_INET
+        self._count = 0
+        if not self.batched:
+            # Per-packet path: recvfrom_into one reusable buffer
+            self._buffer = bytearray(buffer_size)
+            self._view = memoryview(self._buffer)
+            self._received = []
+            return
+
+        # One buffer, address and header per slot, for each direction
+        self._fileno = sock.fileno()
+        self._address_cache = {}
+        self._recv_buffers, self._recv_names, self._recv_msgs = self._allocate()
+        self._send_buffers, self._send_names, self._send_msgs = self._allocate()
+        self._recv_view = memoryview(self._recv_buffers[0]).cast("B")
+
+        # Echo headers point straight at the receive buffers and addresses
+        self._echo_iovecs = (_iovec * self.batch_size)()
+        self._echo_msgs = (_mmsghdr * self.batch_size)()
+        for i in range(self.batch_size):
+            self._echo_msgs[i].msg_hdr.msg_namelen = 16
+            self._echo_msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._echo_iovecs[i])
+            self._echo_msgs[i].msg_hdr.msg_iovlen = 1
+
+    def _allocate(self):
+        size = self.batch_size
+        buffers = (ctypes.c_char * (self.buffer_size * size))()
+        names = (ctypes.c_char * (16 * size))()
+        iovecs = (_iovec * size)()
+        msgs = (_mmsghdr * size)()
+        base, nameBase = ctypes.addressof(buffers), ctypes.addressof(names)
+        for i in range(size):
+            iovecs[i].iov_base = base + i * self.buffer_size
+            iovecs[i].iov_len = self.buffer_size
+            msgs[i].msg_hdr.msg_name = nameBase + i * 16
+            msgs[i].msg_hdr.msg_namelen = 16
+            msgs[i].msg_hdr.msg_iov = ctypes.pointer(iovecs[i])
+            msgs[i].msg_hdr.msg_iovlen = 1
+        return (buffers, iovecs), names, msgs
+
+    def _wait(self, timeout, readable=True):
+        if timeout == 0:
+            return True
+        if readable:
+            ready = select.select([self.sock], [], [], timeout)[0]
+        else:
+            ready = select.select([], [self.sock], [], timeout)[1]
+        return bool(ready)
+
+    def recv(self, timeout=-1):
+        """
+        Receive up to batch_size datagrams, waiting for at least one.
+
+        Argument : seconds to wait; -1 uses the socket timeout, None waits forever
+                   and 0 only collects datagrams that are already queued
+
+        Output : number of datagrams received (0 on timeout)
+        """
+        if timeout == -1:
+            timeout = self.sock.gettimeout()
+        if not self.batched:
+            return self._recv_single(timeout)
+
+        while True:
+            if not self._wait(timeout):
+                self._count = 0
+                return 0
+            for i in range(self.batch_size):
+                self._recv_msgs[i].msg_hdr.msg_namelen = 16
+            count = _recvmmsg(self._fileno, self._recv_msgs, self.batch_size, MSG_DONTWAIT, None)
+            if count >= 0:
+                self._count = count
+                return count
+            errno = ctypes.get_errno()
+            if errno not in (11, 4):  # EAGAIN, EINTR
+                raise OSError(errno, os.strerror(errno))
+            if timeout == 0:
+                self._count = 0
+                return 0
+
+    def _recv_single(self, timeout):
+        saved = self.sock.gettimeout()
+        self.sock.settimeout(timeout)
+        try:
+            nbytes, address = self.sock.recvfrom_into(self._buffer)
+            self._received = [(self._view[:nbytes], address)]
+        except (socket.timeout, BlockingIOError):
+            self._received = []
+        finally:
+            self.sock.settimeout(saved)
+        self._count = len(self._received)
+        return self._count
+
+    def message(self, i):
+        """
+        Return the payload of the i-th received datagram as bytes.
+        """
+        return bytes(self.view(i))
+
+    def view(self, i):
+        """
+        Return the payload of the i-th received datagram without copying it.
+
+        The memoryview points into the receive buffer and is only valid until
+        the next call to recv(); writing to it changes what echo() sends.
+        """
+        if not self.batched:
+            return self._received[i][0]
+        start = i * self.buffer_size
+        return self._recv_view[start:start + self._recv_msgs[i].msg_len]
+
+    def address(self, i):
+        """
+        Return the (ip, port) the i-th received datagram came from.
+        """
+        if not self.batched:
+            return self._received[i][1]
+        start = i * 16
+        return _decode_address(self._recv_names[start:start + 16])
+
+    def echo(self, indices):
+        """
+        Send received datagrams back to where they came from, without copying them.
+
+        Argument : indices of the datagrams (from the last recv()) to echo; an
+                   index may repeat, e.g. for duplicated replies
+
+        Output : number of datagrams handed to the kernel
+        """
+        if not self.batched:
+            for i in indices:
+                self.sock.sendto(self._received[i][0], self._received[i][1])
+            return len(indices)
+
+        sent = 0
+        recvIovecs = self._recv_buffers[1]
+        for first in range(0, len(indices), self.batch_size):
+            chunk = indices[first:first + self.batch_size]
+            for k, i in enumerate(chunk):
+                self._echo_iovecs[k].iov_base = recvIovecs[i].iov_base
+                self._echo_iovecs[k].iov_len = self._recv_msgs[i].msg_len
+                self._echo_msgs[k].msg_hdr.msg_name = self._recv_msgs[i].msg_hdr.msg_name
+            sent += self._sendmmsg(self._echo_msgs, len(chunk))
+        return sent
+
+    def _sendmmsg(self, msgs, total):
+        done = 0
+        while done < total:
+            count = _sendmmsg(self._fileno, ctypes.byref(msgs[done]), total - done, 0)
+            if count < 0:
+                errno = ctypes.get_errno()
+                if errno == 11 and self._wait(self.sock.gettimeout(), readable=False):
+                    continue  # EAGAIN on a socket with a timeout: wait for room
+                if errno == 4:
+                    continue
+                raise OSError(errno, os.strerror(errno))
+            done += count
+        return done
+
+    def send(self, messages):
+        """
+        Send datagrams, batch_size per system call.
+
+        Argument : list of (payload bytes, (ip, port)) tuples
+
+        Output : number of datagrams handed to the kernel
+        """
+        if not self.batched:
+            for payload, address in messages:
+                self.sock.sendto(payload, address)
+            return len(messages)
+
+        sent = 0
+        buffers, iovecs = self._send_buffers
+        for first in range(0, len(messages), self.batch_size):
+            chunk = messages[first:first + self.batch_size]
+            for i, (payload, address) in enumerate(chunk):
+                if len(payload) > self.buffer_size:
+                    raise ValueError(f"datagram of {len(payload)} bytes exceeds buffer_size")
+                ctypes.memmove(iovecs[i].iov_base, payload, len(payload))
+                iovecs[i].iov_len = len(payload)
+                name = self._address_cache.get(address)
+                if name is None:
+                    name = self._address_cache[address] = _encode_address(address)
+                ctypes.memmove(self._send_msgs[i].msg_hdr.msg_name, name, 16)
+            sent += self._sendmmsg(self._send_msgs, len(chunk))
+        return sent
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    from ping_common.impairment import Impairment
+
+    # A full batch with every reply duplicated is echoed as two sendmmsg() calls
+    for use_mmsg in (True, False):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.settimeout(1)
+        batch = DatagramBatch(server, use_mmsg=use_mmsg)
+        impairment = Impairment.parse("duplicate 100%")
+        for i in range(BATCH_SIZE):
+            client.sendto(b"%d" % i, server.getsockname())
+        sent = 0
+        while sent < 2 * BATCH_SIZE:
+            count = batch.recv(1)
+            assert count, "datagrams lost on loopback"
+            assert count == (BATCH_SIZE if batch.batched else 1), count
+            replies = []
+            for i in range(count):
+                replies.extend([i] * impairment.apply(batch.view(i), batch.address(i)))
+            sent += batch.echo(replies)
+        echoed = sorted(int(client.recv(64)) for _ in range(2 * BATCH_SIZE))
+        assert echoed == sorted(list(range(BATCH_SIZE)) * 2), echoed
+        server.close()
+        client.close()
+        print(f"{'recvmmsg/sendmmsg' if batch.batched else 'recvfrom/sendto'}: "
+              f"{BATCH_SIZE} datagrams echoed twice each")
@@ -11,9 +11,26 @@ DESCRIPTION:
     - Establishes connectionless UDP communication with remote servers
     - Sends UDP ping packets and measures round-trip time (RTT)
     - Handles timeouts and packet loss scenarios
-    - Calculates network statistics (min, max, average RTT)
+    - Calculates network statistics (min, max, average RTT, percentiles) in constant memory
     - Reports comprehensive packet loss metrics
     - Provides continuous ping capability with user-defined packet counts
+    - Offers a flood mode that batches datagrams with sendmmsg/recvmmsg
+    - Sends either legacy text pings or compact binary probes of a chosen size
+    - Optionally times every stage of each ping and profiles the ping loop
+      (ping_common.probe_timing)
+    - Writes its per-ping lines from a background thread, as text, JSON Lines,
+      one line per interval or not at all (ping_common.output_sink)
+    - Optionally appends every result to a columnar results store for later
+      queries (ping_common.results_store)
+    - Optionally serves live per-target counters and RTT histograms to
+      Prometheus in the OpenMetrics format (ping_common.metrics_exporter)
+    - Optionally paces its pings on an absolute schedule and/or a token bucket
+      rate and reports the deviation of the sends from it (ping_common.pacing)
+    - Optionally adapts its timeout to the path from the smoothed RTT and its
+      variance (RFC 6298), matching replies to pings by sequence number
+      (ping_common.adaptive_timeout)
+    - Optionally finds the path MTU to the server with concurrent DF probes
+      before pinging and reports MTU blackholes (ping_common.pmtu)
 
 USE CASES:
     - UDP network performance measurement
@@ -22,61 +39,223 @@ USE CASES:
     - Network reliability assessment without connection overhead
 """
 
+import os
 import socket
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.adaptive_timeout import load_timeout
+from ping_common.metrics_exporter import load_metrics_exporter
+from ping_common.output_sink import load_output_sink
+from ping_common.pacing import load_pacer
+from ping_common.pmtu import describe as describe_pmtu, discover, pmtu_enabled
+from ping_common.probe_format import ProbeBuilder, pack_probe, probe_sequence
+from ping_common.probe_timing import load_loop_profiler, load_stage_timer
+from ping_common.resolver import shared_resolver
+from ping_common.results_store import STATUS_LOST, load_results_writer
+from ping_common.rtt_clock import RttClock
+from ping_common.rtt_stats import RttStats, print_on_signal
+from udp_batch_io import BATCH_SIZE, DatagramBatch
+
+clock_source = 'wall'  # 'wall' (time.time), 'monotonic' or 'kernel' (SO_TIMESTAMPNS)
+flood_mode = False  # Send all pings back to back in batches instead of one at a time
+probe_format = 'text'  # 'text' (legacy 'Ping <n> <time>') or 'binary' (ping_common.probe_format)
+probe_size = 0  # Pad binary probes to this many bytes (0 = 16-byte header only)
+stage_timing = False  # Print per-stage ping timings on exit (or PING_STAGE_TIMING=1)
+profile_output = ''  # Profile the ping loop into this file, .folded = sampling (or PING_PROFILE)
+output_mode = 'text'  # 'text', 'quiet', 'summary', 'interval[=s]' or 'jsonl[=file]'; PING_OUTPUT overrides it
+results_path = ''  # Append every result to this results store directory (or PING_RESULTS)
+metrics_address = ''  # Serve OpenMetrics on this '[host:]port', e.g. '9464' (or PING_METRICS)
+interval = 0.0  # Seconds between ping sends on an absolute schedule, 0 = back to back (or PING_INTERVAL)
+rate_limit = 0  # Maximum pings per second (token bucket), 0 = unlimited (or PING_RATE)
+timeout_mode = 'fixed'  # 'fixed' (client.settimeout) or 'adaptive [floor=20ms] [ceiling=3s]' (or PING_TIMEOUT)
+pmtu_discovery = False  # Find the path MTU to the server before pinging, cached per target (or PING_PMTU=1)
+
+
+def flood(client, server_address, num, clock, stats, target, results, metrics, pacer, probe_timeout):
+    """
+    Send num pings as fast as possible, up to 64 per system call, or one per
+    slot when the pings are paced, and match the replies.
+
+    Argument : UDP socket, server address, number of pings, the RttClock, the
+               RttStats that receive the RTTs and losses, the target name, the
+               results writer and metrics of that target, the Pacer and the
+               ProbeTimeout that sets the final wait and learns from the RTTs
+    """
+    batch = DatagramBatch(client)
+    sent_at = [None] * num  # Send time per sequence number, cleared once answered
+    received = 0
+    stamp = time.ctime()
+
+    def collect(timeout):
+        nonlocal received
+        count = batch.recv(timeout)
+        end = clock.now()
+        for k in range(count):
+            seq = probe_sequence(batch.view(k))
+            if seq is not None and 0 <= seq < num and sent_at[seq] is not None:
+                rtt = (end - sent_at[seq]) / 1e6
+                stats.add(rtt)
+                probe_timeout.sample(rtt)
+                metrics.reply(rtt)
+                results.append(target, seq, rtt)
+                sent_at[seq] = None
+                received += 1
+        return count
+
+    started = clock.now()
+    step = 1 if pacer.enabled else BATCH_SIZE
+    for first in range(0, num, step):
+        pacer.wait()
+        now = clock.now()
+        if probe_format == 'binary':
+            messages = [(pack_probe(i, now, probe_size), server_address)
+                        for i in range(first, min(first + step, num))]
+        else:
+            messages = [(f'Ping {i} {stamp}'.encode("utf-8"), server_address)
+                        for i in range(first, min(first + step, num))]
+        batch.send(messages)
+        metrics.probe_sent(len(messages))
+        for i in range(first, first + len(messages)):
+            sent_at[i] = now
+        collect(0)  # Pick up replies that are already waiting
+
+    # Wait for the remaining replies until the (adaptive) timeout passes without any
+    client.settimeout(probe_timeout.timeout)
+    while received < num and collect(-1):
+        pass
+    stats.add_loss(num - received)
+    metrics.loss(num - received)
+    for seq in range(num):
+        if sent_at[seq] is not None:
+            results.append(target, seq, status=STATUS_LOST)
+
+    elapsed = (clock.now() - started) / 1e9
+    sink.message("Flooded {} pings in {:.3f} s ({:.0f} packets/s, {})".format(
+        num, elapsed, num / elapsed if elapsed else 0,
+        "recvmmsg/sendmmsg" if batch.batched else "per-packet sendto/recvfrom"))
+
+
+# Per-stage timings of the count-mode pings and the optional profiler of the ping loop
+timer = load_stage_timer(stage_timing)
+profiler = load_loop_profiler(profile_output)
+
+# Per-ping lines are queued here and written by a background thread
+sink = load_output_sink(output_mode)
+
+# Every result is also appended to the results store, if one is configured
+results = load_results_writer(results_path)
+
+# Live counters and RTT histograms for Prometheus, if an address is configured
+exporter = load_metrics_exporter(metrics_address)
+
+# Host names are looked up once per cache TTL, not once per round
+resolver = shared_resolver()
+
 while True:
     # Ask the user to set the number of ping operations
     num = int(input("Set the number of ping operations: "))
             
-    print("Initiating Ping\n")
+    sink.message("Initiating Ping\n")
     server_ip = '127.0.0.1'
     
     # Create a UDP socket
     client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  
     
-    server_address = (server_ip, 14008)  # Set IP Address and Port Number of Socket
+    server_address = (resolver.resolve(server_ip), 14008)  # Set IP Address and Port Number of Socket
+    target = "udp:{}:{}".format(*server_address)  # Target name in the results store and metrics
+    metrics = exporter.target(target)
+
+    # Largest unfragmented probe size, and whether larger ones vanish silently
+    if pmtu_enabled(pmtu_discovery):
+        try:
+            sink.message(describe_pmtu(discover(target, server_address)) + "\n")
+        except OSError as e:
+            sink.message("Path MTU to {}: unknown ({})\n".format(target, e))  # Pinging shows the rest
     
     client.settimeout(1)  # Sets a timeout value of 1 second
+    probe_timeout = load_timeout(timeout_mode, client.gettimeout())  # Per target; adapts to the RTT if configured
+
+    # Batched receives carry no per-packet kernel timestamps, so floods use the monotonic clock
+    clock = RttClock('monotonic' if flood_mode and clock_source == 'kernel' else clock_source)
+    clock.enable(client)
+    builder = ProbeBuilder(probe_size)
 
-    rtt_time = []  # List to store Round-Trip Times (RTTs)
-    packet_lost = 0  # Count of lost (timed-out) pings
+    # Sends on an absolute schedule, if an interval or rate limit is configured
+    pacer = load_pacer(interval, rate_limit)
 
+    # Round-Trip Times and lost pings, in constant memory; kill -USR1 prints them
+    stats = RttStats()
+    print_on_signal(stats, "Ping statistics for {} so far:".format(server_ip))
+
+    profiler.start()
     try:
+        if flood_mode:
+            flood(client, server_address, num, clock, stats, target, results, metrics, pacer, probe_timeout)
+
         # Loop to ping the server 'num' times
-        for i in range(num):
-            start = time.time()  # Start time when message is sent to server
-            message = 'Ping ' + str(i) + " " + time.ctime(start)
+        for i in range(0 if flood_mode else num):
+            pacer.wait()
+            timer.start()
+            if probe_format == 'binary':
+                start = clock.now()  # Start time when message is sent to server
+                payload = builder.build(i, start)
+                message = bytes(payload)  # Described by the output sink
+            else:
+                message = 'Ping ' + str(i) + " " + time.ctime()
+                payload = message.encode("utf-8")
+                start = clock.now()  # Start time when message is sent to server
+            timer.mark("build")
             try:
-                sent = client.sendto(message.encode("utf-8"), server_address)
-                print("Sent " + message)
-                data, server = client.recvfrom(4096)  # Maximum data received 4096 bytes
-                print("Received " + str(data.decode("utf-8")))
-                end = time.time()
-                elapsed = end - start
-                rtt_time.append(elapsed * 1000)  # Store RTT in milliseconds
-                print("RTT: " + str(elapsed * 1000) + " Milliseconds\n")
+                client.settimeout(probe_timeout.timeout)
+                wait_until = time.monotonic() + probe_timeout.timeout
+                sent = client.sendto(payload, server_address)
+                timer.mark("send")
+                metrics.probe_sent()
+                sink.record("sent", "Sent {message}", seq=i, message=message)
+                timer.mark("output")
+                data, server, end = clock.recvfrom(client, 4096)  # Maximum data received 4096 bytes
+                while probe_sequence(data) not in (i, None):
+                    # A late reply to an earlier ping that already timed out
+                    remaining = wait_until - time.monotonic()
+                    if remaining <= 0:
+                        raise socket.timeout
+                    client.settimeout(remaining)
+                    data, server, end = clock.recvfrom(client, 4096)
+                timer.mark("wait")
+                elapsed = (end - start) / 1e9
+                stats.add(elapsed * 1000)  # Store RTT in milliseconds
+                probe_timeout.sample(elapsed * 1000)
+                results.append(target, i, elapsed * 1000)
+                metrics.reply(elapsed * 1000)
+                timer.mark("receive")
+                sink.record("received", "Received {reply}\nRTT: {rtt_ms} Milliseconds\n",
+                            seq=i, reply=data, rtt_ms=elapsed * 1000)
             except socket.timeout:
-                print("#" + str(i) + " Request timed out for the packet\n")
-                packet_lost += 1  # Increment packet loss count
+                timer.mark("wait")
+                sink.record("lost", "#{seq} Request timed out for the packet\n", seq=i)
+                stats.add_loss()  # Increment packet loss count
+                probe_timeout.expired()
+                results.append(target, i, status=STATUS_LOST)
+                metrics.loss()
+            timer.mark("output")
+            timer.finish()
     finally:
-        print("Ping completed, terminating socket connection...")
+        profiler.stop()
+        results.flush()
+        sink.message("Ping completed, terminating socket connection...")
         client.close()
 
    
-    # Calculate and print the minimum, maximum, and average RTTs after all pings are done
-    if rtt_time:
-        minimum_rtt = min(rtt_time)
-        maximun_rtt = max(rtt_time)
-        average_rtt = sum(rtt_time) / len(rtt_time)
-
-        packet_loss_rate = (packet_lost / num) * 100
-        # Print all stats in one line at the end
-        print("\n")
-        print("Ping statistics for {}:".format(server_ip))
-        print("     Packets: Sent = {}, Received = {}, Lost = {} ({}% loss)".format(num,num-packet_lost, packet_lost, packet_loss_rate))
-        print("Approximate round trip times in milli-seconds:")
-        print("     Minimum: {:.2f} ms, Maximum: {:.2f} ms, Average: {:.2f} ms\n".format(minimum_rtt, maximun_rtt, average_rtt))
+    # Print the minimum, maximum, average and percentile RTTs after all pings are done
+    if stats.count:
+        sink.message("\n")
+        sink.summary(stats, "Ping statistics for {}:".format(server_ip),
+                     "Clock source: {}\n".format(clock.describe())
+                     + ("Timeout: {}\n".format(probe_timeout.describe()) if probe_timeout.adaptive else ""))
 
     else:
-        print("Ping attempts failed.\n")
+        sink.message("Ping attempts failed.\n")
+    if pacer.enabled:
+        sink.message(pacer.report() + "\n")
@@ -9,11 +9,15 @@ PROBLEM STATEMENT:
 DESCRIPTION:
     This module implements a UDP ping client with ICMP error detection that:
     - Sends UDP ping packets to remote servers
-    - Listens for ICMP error responses using raw sockets
+    - Reads ICMP errors from the UDP socket's error queue (IP_RECVERR) in the same
+      select() loop as the replies: no root, no per-probe socket, one timeout
+    - Can still listen for ICMP error responses using raw sockets (legacy backend)
     - Detects Destination Unreachable and Port Unreachable errors
     - Measures round-trip time for successful packets
     - Reports network unreachability and port closure scenarios
     - Handles timeouts and multiple error conditions
+    - Optionally serves live counters, RTT histograms and ICMP error counts by
+      type and code in the OpenMetrics format (ping_common.metrics_exporter)
 
 USE CASES:
     - UDP error diagnosis and network troubleshooting
@@ -23,12 +27,23 @@ USE CASES:
     - UDP-based service diagnostics
 """
 
+import os
+import select
 import socket
+import sys
 import time
 import struct
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common import icmp_errqueue
+from ping_common.metrics_exporter import DISABLED, load_metrics_exporter
+from ping_common.rtt_stats import RttStats, print_on_signal
+
 ICMP_DEST_UNREACHABLE = 3
 
+error_backend = 'recverr'  # 'recverr' (IP_RECVERR error queue, no root) or 'raw' (raw ICMP socket, root)
+metrics_address = ''  # Serve OpenMetrics on this '[host:]port', e.g. '9464' (or PING_METRICS)
+
 def parse_icmp_packet(packet):
     ip_header = packet[:20]
     icmp_header = packet[20:28]
@@ -37,6 +52,99 @@ def parse_icmp_packet(packet):
     icmp_type, icmp_code, _, _, _ = struct.unpack('!BBHHH', icmp_header)
     return icmp_type, icmp_code
 
+def ping_sequence(message):
+    # 'Ping <n> <time>' and its uppercased echo carry the sequence number second
+    try:
+        return int(bytes(message).split(b' ', 2)[1])
+    except (IndexError, ValueError):
+        return None
+
+def wait_recverr(client, i, deadline, stats, metrics=DISABLED):
+    """
+    Wait for the reply to ping i or an ICMP error it caused, whichever comes first.
+
+    Argument : UDP socket with IP_RECVERR enabled, ping number, deadline
+               (time.time()), the RttStats that receive losses and the
+               TargetMetrics that count losses and ICMP errors
+
+    Output : True if the server replied
+    """
+    while True:
+        remaining = deadline - time.time()
+        # A queued ICMP error makes the socket readable just like a reply
+        if remaining <= 0 or not select.select([client], [], [], remaining)[0]:
+            print(f"# {i} Request timed out")
+            stats.add_loss()
+            metrics.loss()
+            return False
+        error = icmp_errqueue.read_error(client)
+        if error is not None:
+            if ping_sequence(error.payload) != i:
+                continue  # Caused by an earlier ping
+            print(icmp_errqueue.describe(error))
+            stats.add_loss()
+            metrics.loss()
+            metrics.icmp_error(error.type, error.code)
+            return False
+        try:
+            data, addr = client.recvfrom(1024)
+        except (BlockingIOError, InterruptedError):
+            continue
+        if ping_sequence(data) != i:
+            continue  # Late reply to an earlier ping
+        print(f"Received {data.decode('utf-8')} from {addr}")
+        return True
+
+def wait_raw(client, i, stats, metrics=DISABLED):
+    """
+    Wait for the reply to ping i, then for an ICMP error on a raw socket (needs root).
+
+    Argument : UDP socket, ping number, the RttStats that receive losses and
+               the TargetMetrics that count losses and ICMP errors
+
+    Output : True if the server replied
+    """
+    replied = False
+    # Create a raw socket to listen for ICMP errors
+    raw_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    try:
+        raw_socket.settimeout(1)
+        while True:
+            try:
+                data, addr = client.recvfrom(1024)
+                print(f"Received {data.decode('utf-8')} from {addr}")
+                replied = True
+                break
+            except socket.timeout:
+                try:
+                    # Check for ICMP error messages
+                    icmp_data, icmp_addr = raw_socket.recvfrom(1024)
+                    icmp_type, icmp_code = parse_icmp_packet(icmp_data)
+                    metrics.icmp_error(icmp_type, icmp_code)
+                    if icmp_type == ICMP_DEST_UNREACHABLE:
+                        if icmp_code == 0:
+                            print(f"ICMP Error: Destination Unreachable from {icmp_addr[0]}")
+                            stats.add_loss()
+                            metrics.loss()
+                        elif icmp_code == 3:
+                            print(f"ICMP Error: Port Unreachable from {icmp_addr[0]}")
+                            stats.add_loss()
+                            metrics.loss()
+
+                        break
+                except socket.timeout:
+                    print(f"# {i} Request timed out")
+                    stats.add_loss()
+                    metrics.loss()
+                    break
+
+    finally:
+        raw_socket.close()
+    return replied
+
+# Live counters and RTT histograms for Prometheus, if an address is configured
+exporter = load_metrics_exporter(metrics_address)
+
 while True:
     num = int(input("Set the number of ping operations: "))
     print("Initiating Ping\n")
@@ -44,74 +152,48 @@ while True:
     server_ip = '127.0.0.1'
     client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     client.settimeout(1)
+    recverr = error_backend == 'recverr' and icmp_errqueue.enable(client)
+    if recverr:
+        client.setblocking(False)  # select() waits for replies and errors alike
     
-    rtt_time = []
-    packet_lost = 0
+    stats = RttStats()  # RTTs and losses in constant memory; kill -USR1 prints them
+    print_on_signal(stats, f"Ping statistics for {server_ip} so far:")
     server_address = (server_ip, 14008)
+    metrics = exporter.target("udp:{}:{}".format(*server_address))
     
     try:
         for i in range(num):
+            if recverr:
+                while icmp_errqueue.read_error(client) is not None:
+                    pass  # Errors still queued for earlier pings
             start = time.time()
             message = f'Ping {i} {time.ctime(start)}'
             try:
                 sent = client.sendto(message.encode("utf-8"), server_address)
                 print(f"Sent {message}")
-                try:
-                    # Create a raw socket to listen for ICMP errors
-                    raw_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
-                    raw_socket.settimeout(1)
-                    while True:
-                        try:
-                            data, addr = client.recvfrom(1024)
-                            print(f"Received {data.decode('utf-8')} from {addr}")
-                            break
-                        except socket.timeout:
-                            try:
-                                # Check for ICMP error messages
-                                icmp_data, icmp_addr = raw_socket.recvfrom(1024)
-                                icmp_type, icmp_code = parse_icmp_packet(icmp_data)
-                                if icmp_type == ICMP_DEST_UNREACHABLE:
-                                    if icmp_code == 0:
-                                        print(f"ICMP Error: Destination Unreachable from {icmp_addr[0]}")
-                                        packet_lost += 1
-                                    elif icmp_code == 3:
-                                        print(f"ICMP Error: Port Unreachable from {icmp_addr[0]}")
-                                        packet_lost += 1
-
-                                    break
-                            except socket.timeout:
-                                print(f"# {i} Request timed out")
-                                packet_lost += 1
-                                break
-
-                finally:
-                    raw_socket.close()
-
-                end = time.time()
-                elapsed = end - start
-                rtt_time.append(elapsed * 1000)
-                # if icmp_code == 0:
-                #     continue
-                # elif icmp_code == 3:
-                #     continue
-                print(f"RTT: {elapsed * 1000:.3f} ms\n")
+                metrics.probe_sent()
+                if recverr:
+                    replied = wait_recverr(client, i, start + 1, stats, metrics)
+                else:
+                    replied = wait_raw(client, i, stats, metrics)
+
+                if replied:
+                    end = time.time()
+                    elapsed = end - start
+                    stats.add(elapsed * 1000)
+                    metrics.reply(elapsed * 1000)
+                    print(f"RTT: {elapsed * 1000:.3f} ms\n")
             except socket.timeout:
                 print(f"# {i} Request timed out for the packet\n")
-                packet_lost += 1
+                stats.add_loss()
+                metrics.loss()
 
     finally:
         print("Ping completed, terminating socket connection...")
         client.close()
 
-    if rtt_time:
-        minimum_rtt = min(rtt_time)
-        maximum_rtt = max(rtt_time)
-        average_rtt = sum(rtt_time) / len(rtt_time)
-
-        packet_loss_rate = (packet_lost / num) * 100
-        print(f"Ping statistics for {server_ip}:")
-        print(f"     Packets: Sent = {num}, Received = {num - packet_lost}, Lost = {packet_lost} ({packet_loss_rate}% loss)")
-        print(f"Approximate round trip times in milli-seconds:")
-        print(f"     Minimum = {minimum_rtt:.2f} ms, Maximum = {maximum_rtt:.2f} ms, Average = {average_rtt:.2f} ms\n")
+    if stats.count:
+        print(stats.report(f"Ping statistics for {server_ip}:"))
+        print("")
     else:
         print("Ping attempts failed.\n")
@@ -10,10 +10,15 @@ DESCRIPTION:
     This module implements a UDP ping server that:
     - Listens for incoming UDP ping packets from clients
     - Responds to valid ping requests
-    - Simulates random packet loss to test client resilience
+    - Simulates random packet loss to test client resilience, plus optional delay,
+      jitter, reordering, duplication and bursty loss (ping_common.impairment)
     - Converts incoming messages to uppercase as an echo
     - Demonstrates connectionless UDP communication patterns
     - Logs client interactions and packet statistics
+    - Receives and answers datagrams in batches with recvmmsg/sendmmsg where available
+    - Echoes binary probes straight from the receive buffers without decoding them
+    - Logs datagrams through a background writer, or as JSON Lines, interval
+      summaries or not at all (ping_common.output_sink)
 
 USE CASES:
     - UDP server implementation and testing
@@ -23,9 +28,23 @@ USE CASES:
     - Performance testing of UDP-based applications
 """
 
-import random
+import os
+import sys
 from socket import *
 
+from udp_batch_io import DatagramBatch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.impairment import load_impairment
+from ping_common.output_sink import load_output_sink
+from ping_common.probe_format import echo_reply
+
+# tc-netem style impairment of the replies (ping_common.impairment); PING_IMPAIRMENT overrides it
+impairment_spec = 'loss 20%'
+
+# 'text', 'quiet', 'summary', 'interval[=s]' or 'jsonl[=file]' (ping_common.output_sink); PING_OUTPUT overrides it
+output_mode = 'text'
+
 # Create a UDP socket
 # Notice the use of SOCK_DGRAM for UDP packets
 serverSocket = socket(AF_INET, SOCK_DGRAM)
@@ -34,23 +53,40 @@ server_ip = '127.0.0.1'
 # Assign IP address and port number to socket
 serverSocket.bind((server_ip, 14008))
 
-print(f"Server is listening on port: {14008} and ip: {server_ip}")
+# Receive and send up to 64 datagrams per system call (recvmmsg/sendmmsg)
+batch = DatagramBatch(serverSocket)
+
+# Loss, delay, reordering and duplication of the replies
+impairment = load_impairment(impairment_spec)
+
+# The per-datagram log is written by a background thread
+sink = load_output_sink(output_mode)
+
+sink.message(f"Server is listening on port: {14008} and ip: {server_ip}")
 
 while True:
-    # Generate a random number between 1 to 10 (both inclusive)
-    rand = random.randint(1, 10)
-
-    # Receive the client packet along with the address it is coming from
-    message, address = serverSocket.recvfrom(1024)
-    message = message.decode('utf-8')
-
-    # Capitalize the message from the client
-    message = message.upper()
-    print(f"Received from {address[0]}:{address[1]}: {message}")
-    
-    # If rand is greater than 8, we consider the packet lost and do not respond to the client
-    if rand > 8:
-        continue
-
-    # Otherwise, the server response
-    serverSocket.sendto(message.encode('utf-8'), address)
+    # Receive the next batch of client packets along with the addresses they are coming from,
+    # waking up in time to send delayed replies
+    count = batch.recv(impairment.next_timeout())
+    replies = []
+
+    for i in range(count):
+        message = batch.view(i)
+        address = batch.address(i)
+
+        # Binary probes are echoed as they are; legacy text is capitalized in place
+        reply = echo_reply(message)
+        if reply is not message:
+            message[:] = reply
+        sink.record("received", "Received from {client[0]}:{client[1]}: {message}",
+                    client=address, message=bytes(message))
+
+        # The impairment decides whether the reply is lost, delayed or sent (twice) right away
+        replies.extend([i] * impairment.apply(message, address))
+
+    batch.echo(replies)
+
+    # Send the delayed replies whose time has come
+    delayed = impairment.due()
+    if delayed:
+        batch.send(delayed)
@@ -13,6 +13,8 @@ DESCRIPTION:
     - Simulates ICMP Destination Unreachable errors
     - Simulates ICMP Port Unreachable errors
     - Randomly generates error conditions for realistic testing
+    - Sends the errors over one long-lived raw socket, quoting the offending
+      datagram so that clients can match them (ping_common.icmp_emitter)
     - Provides comprehensive error diagnostic capabilities
 
 USE CASES:
@@ -25,8 +27,12 @@ USE CASES:
 
 import random
 import socket
-import struct
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.icmp_emitter import IcmpErrorEmitter
+from ping_common.probe_format import describe, echo_reply
 
 # Create a UDP socket
 serverSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -36,30 +42,22 @@ serverSocket.bind((server_ip, server_port))
 
 print(f"Server is listening on port: {server_port} and IP: {server_ip}")
 
-# Function to send ICMP Destination Unreachable or Port Unreachable
-def send_icmp_error(dest_addr, error_type, code):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
-    
-    packet_id = os.getpid() & 0xFFFF
-    header = struct.pack('!BBHHH', error_type, code, 0, packet_id, 1)
-    
-    # Include dummy IP header for compatibility with some systems
-    ip_header = struct.pack('!BBHHHBBH4s4s',
-                            69, 0, 84, 54321, 0, 255, socket.IPPROTO_ICMP, 0,
-                            socket.inet_aton(server_ip),
-                            socket.inet_aton(dest_addr))
-    
-    # Send ICMP error packet to client
-    sock.sendto(ip_header + header, (dest_addr, 0))
-    sock.close()
+# One raw socket for every ICMP error this server sends
+emitter = IcmpErrorEmitter(server_ip)
+
+# Function to send ICMP Destination Unreachable or Port Unreachable about a received datagram
+def send_icmp_error(client_address, error_type, code, payload):
+    emitter.send(error_type, code, client_address, (server_ip, server_port), payload)
+
+buffer = bytearray(2048)  # Reused for every datagram
+view = memoryview(buffer)
 
 while True:
     rand = random.randint(1, 10)
-    message, client_address = serverSocket.recvfrom(1024)
-    message = message.upper()
+    nbytes, client_address = serverSocket.recvfrom_into(buffer)
+    message = echo_reply(view[:nbytes])  # Binary probes unchanged, legacy text uppercased
     client_ip, client_port = client_address
-    print(f"Received from {client_ip}:{client_port}: {message.decode('utf-8')}")
+    print(f"Received from {client_ip}:{client_port}: {describe(message)}")
 
     if rand <= 6:
         # Send UDP packet normally
@@ -67,8 +65,8 @@ while True:
     elif rand > 6 and rand <= 8:
         # Send ICMP Destination Unreachable (Type 3, Code 0)
         print(f"Sending ICMP Destination Unreachable to {client_ip}")
-        send_icmp_error(client_ip, 3, 0)
+        send_icmp_error(client_address, 3, 0, view[:nbytes])
     elif rand > 8:
         # Send ICMP Port Unreachable (Type 3, Code 3)
         print(f"Sending ICMP Port Unreachable to {client_ip}")
-        send_icmp_error(client_ip, 3, 3)
+        send_icmp_error(client_address, 3, 3, view[:nbytes])
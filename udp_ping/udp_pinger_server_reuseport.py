@@ -0,0 +1,138 @@
+"""
+Network Diagnostics: Multi-Core UDP Pinger Server with SO_REUSEPORT
+
+PROBLEM STATEMENT:
+    The UDP pinger server is a single blocking recvfrom() loop that decodes,
+    uppercases, prints and re-encodes every datagram on one core. It cannot
+    keep up with the packet rates produced by load generators.
+
+DESCRIPTION:
+    This module implements a multi-process UDP ping server that:
+    - Starts N worker processes that all bind to port 14008 with SO_REUSEPORT
+    - Lets the kernel spread client flows across the workers (and cores)
+    - Echoes binary probes unchanged and legacy text uppercased, without decoding either
+    - Keeps the random packet drop of the original server, with configurable loss,
+      delay, reordering and duplication per worker (ping_common.impairment)
+    - Counts received, responded and dropped packets per worker in shared memory
+    - Prints a combined summary periodically and when stopped with Ctrl+C
+    - Optionally logs every datagram through a per-worker background writer
+      (ping_common.output_sink)
+
+USE CASES:
+    - UDP load and flood testing
+    - Echo target for many concurrent UDP clients
+    - Packet-rate scalability testing across cores
+"""
+
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ping_common.impairment import load_impairment
+from ping_common.output_sink import load_output_sink
+from ping_common.probe_format import echo_reply
+
+server_ip = '127.0.0.1'
+server_port = 14008
+num_workers = os.cpu_count() or 1  # Number of worker processes
+impairment_spec = 'loss 20%'  # tc-netem style (ping_common.impairment); PING_IMPAIRMENT overrides it
+log_packets = False  # Log every datagram like udp_pinger_server.py
+output_mode = 'text'  # Per-worker log: 'text', 'interval[=s]' or 'jsonl[=file]' (ping_common.output_sink); PING_OUTPUT overrides it
+summary_interval = 5  # Seconds between combined summaries
+
+# Per-worker counters in shared memory: received, responded, dropped
+RECEIVED, RESPONDED, DROPPED = range(3)
+NUM_COUNTERS = 3
+
+
+def worker(index, counters):
+    """
+    Serve UDP pings on a SO_REUSEPORT socket until the process is stopped.
+
+    Argument : worker number and the shared counter array
+    """
+    # Own random sequence, loss state and timer wheel; a seeded spec stays reproducible per worker
+    impairment = load_impairment(impairment_spec).fork(index)
+    sink = load_output_sink(output_mode) if log_packets else None  # Background writer of this worker
+    serverSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    serverSocket.bind((server_ip, server_port))
+    base = index * NUM_COUNTERS
+    buffer = bytearray(2048)  # Reused for every datagram
+    view = memoryview(buffer)
+    try:
+        while True:
+            # Wake up in time to send delayed replies
+            serverSocket.settimeout(impairment.next_timeout())
+            try:
+                nbytes, address = serverSocket.recvfrom_into(buffer)
+            except (socket.timeout, BlockingIOError):
+                nbytes = None  # A zero timeout makes the socket non-blocking
+
+            if nbytes is not None:
+                counters[base + RECEIVED] += 1
+                message = echo_reply(view[:nbytes])  # Binary probes unchanged, legacy text uppercased
+                if log_packets:
+                    sink.record("received", "[worker {worker}] Received from {client[0]}:{client[1]}: {message}",
+                                worker=index, client=address, message=bytes(message))
+
+                # Simulate packet loss (and delay, reordering, duplication) like the single-process server
+                for _ in range(impairment.apply(message, address)):
+                    serverSocket.sendto(message, address)
+                    counters[base + RESPONDED] += 1
+                counters[base + DROPPED] = impairment.dropped
+
+            for payload, destination in impairment.due():
+                serverSocket.sendto(payload, destination)
+                counters[base + RESPONDED] += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serverSocket.close()
+
+
+def print_summary(counters, started):
+    """
+    Print per-worker and combined packet counters.
+
+    Argument : shared counter array and the server start time
+    """
+    elapsed = max(time.time() - started, 1e-9)
+    totals = [0] * NUM_COUNTERS
+    print(f"\nServer statistics after {elapsed:.1f} s:")
+    for index in range(num_workers):
+        values = counters[index * NUM_COUNTERS:(index + 1) * NUM_COUNTERS]
+        for i, value in enumerate(values):
+            totals[i] += value
+        print(f"     Worker {index}: Received = {values[RECEIVED]}, "
+              f"Responded = {values[RESPONDED]}, Dropped = {values[DROPPED]}")
+    print(f"     Total: Received = {totals[RECEIVED]}, Responded = {totals[RESPONDED]}, "
+          f"Dropped = {totals[DROPPED]} ({totals[RECEIVED] / elapsed:.0f} packets/s)")
+
+
+if __name__ == "__main__":
+    # Unsynchronized counters: each slot has exactly one writer
+    counters = multiprocessing.Array('Q', num_workers * NUM_COUNTERS, lock=False)
+    workers = [multiprocessing.Process(target=worker, args=(i, counters), daemon=True)
+               for i in range(num_workers)]
+    for process in workers:
+        process.start()
+
+    print(f"Server is listening on port: {server_port} and ip: {server_ip} with {num_workers} workers")
+    started = time.time()
+    try:
+        while True:
+            time.sleep(summary_interval)
+            print_summary(counters, started)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Let the workers shut down in peace
+        for process in workers:
+            process.terminate()
+            process.join()
+        print_summary(counters, started)